@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# End to end benchmark of TwitchLiveAlert against tools/fakeTwitch.py (requires aiohttp, psutil optional)
+# Runs the app in a temporary folder with N channels, sends go-live events and reports
+# detection latency percentiles, requests per cycle, CPU time and RSS of the app process
+# With --instances N, N apps share one coordination file and split the lists
+# Usage: python bench/benchLive.py [--channels 1000] [--priority 10] [--events 20] [--duration 120] [--instances 1] [--option asyncpriority=True]
+
+import sys
+import argparse
+import asyncio
+import math
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from os.path import join, dirname, abspath
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), "tools"))
+
+from aiohttp import web
+from fakeTwitch import FakeTwitch
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# Run fake server on its own event loop thread
+def startServer(fake, port):
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    error = []
+
+    def run():
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(fake.application())
+        loop.run_until_complete(runner.setup())
+
+        try:
+            loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        except OSError as e: # Port in use
+            error.append(e)
+            started.set()
+            return
+
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+
+    if error:
+        raise SystemExit("fake server: {}".format(error[0]))
+
+    return loop
+
+# Run fn on server loop to avoid racing with request handlers
+def call(loop, fn, *args):
+    async def wrapper():
+        return fn(*args)
+
+    return asyncio.run_coroutine_threadsafe(wrapper(), loop).result()
+
+def writeConfig(workDir, port, args, normal, priority, coordination=""):
+    options = {
+        "token" : "1:fake",
+        "clientid" : "1",
+        "userlist" : "normal.txt",
+        "userpriority" : "priority.txt",
+        "sendthumbnail" : "True",
+        "refreshdelay" : str(args.refresh),
+        "refreshpriority" : str(args.refresh_priority),
+        "newalertsonly" : "True",
+        "winnotify" : "False",
+        "silentstart" : "True",
+        "hostoverride" : "http://127.0.0.1:{}".format(port)
+    }
+
+    if coordination:
+        options["coordination"] = coordination
+
+    for n in args.option:
+        k, _, v = n.partition("=")
+        options[k.strip().lower()] = v.strip()
+
+    with open(join(workDir, "알리미설정.ini"), "w", encoding="utf-8") as f:
+        f.write("[LiveAlertConfig]\n" + "".join("{} = {}\n".format(k, v) for k, v in options.items()))
+
+    with open(join(workDir, "normal.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(normal))
+
+    with open(join(workDir, "priority.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(priority))
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(math.ceil(p / 100 * len(values))) - 1)]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--channels", type=int, default=1000, help="channels in normal list")
+    parser.add_argument("--priority", type=int, default=10, help="channels in priority list")
+    parser.add_argument("--events", type=int, default=20, help="go-live events during run")
+    parser.add_argument("--duration", type=float, default=120, help="seconds to send events over")
+    parser.add_argument("--refresh", type=int, default=10, help="refreshdelay")
+    parser.add_argument("--refresh-priority", type=int, default=5, help="refreshpriority")
+    parser.add_argument("--priority-share", type=float, default=0.3, help="share of events on priority channels")
+    parser.add_argument("--initial-live", type=float, default=0.1, help="ratio of channels live before start")
+    parser.add_argument("--latency", type=float, default=30, help="fake server response delay in ms")
+    parser.add_argument("--jitter", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--warmup", type=float, default=60, help="max seconds to wait for first cycle")
+    parser.add_argument("--instances", type=int, default=1, help="app instances sharing one coordination file")
+    parser.add_argument("--option", action="append", default=[], help="extra config option key=value")
+    parser.add_argument("--keep", action="store_true", help="keep temporary app folder")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    fake = FakeTwitch(args.channels + args.priority, initialLive=args.initial_live, latency=args.latency, jitter=args.jitter, errorRate=args.error_rate)
+    loop = startServer(fake, args.port)
+
+    priority = ["channel{}".format(i) for i in range(args.priority)]
+    normal = ["channel{}".format(i) for i in range(args.priority, args.priority + args.channels)]
+    workDir = tempfile.mkdtemp(prefix="benchLive")
+    srcDir = join(dirname(dirname(abspath(__file__))), "src")
+    coordination = join(workDir, "coordination.db") if args.instances > 1 else ""
+    procs = []
+    logs = []
+
+    for i in range(max(1, args.instances)):
+        appDir = join(workDir, "app{}".format(i)) if args.instances > 1 else workDir
+        os.makedirs(appDir, exist_ok=True)
+        shutil.copy(join(srcDir, "TwitchLiveAlert.py"), appDir) # appPath is script folder, keeps caches out of src
+        shutil.copy(join(srcDir, "bt.ico"), appDir)
+        writeConfig(appDir, args.port, args, normal, priority, coordination)
+        logs.append(open(join(appDir, "console.txt"), "w", encoding="utf-8"))
+        procs.append(subprocess.Popen([sys.executable, join(appDir, "TwitchLiveAlert.py")], cwd=appDir, stdin=subprocess.DEVNULL, stdout=logs[-1], stderr=subprocess.STDOUT))
+
+    monitors = [psutil.Process(n.pid) for n in procs] if psutil else []
+    rss = []
+
+    print("app folder: {}".format(workDir))
+
+    # Wait for first normal list cycle
+    t0 = time.time()
+
+    while time.time() - t0 < args.warmup and all(n.poll() is None for n in procs):
+        if call(loop, lambda: fake.requests.get("helix/streams", 0)) >= math.ceil(args.channels / 100):
+            break
+
+        time.sleep(0.2)
+
+    startup = time.time() - t0
+    time.sleep(args.refresh_priority) # Let every priority channel be probed once, earlier go-live counts as live before start
+
+    if any(n.poll() is not None for n in procs):
+        print("app exited during startup, see console.txt in {}".format(workDir))
+        return
+
+    call(loop, fake.reset)
+    t0 = time.time()
+    schedule = sorted(random.uniform(0, args.duration) for _ in range(args.events))
+    offline = [[n for n in names if n not in fake.streams] for names in [priority, normal]]
+    count = min(len(offline[0]), int(round(args.events * args.priority_share)))
+    targets = random.sample(offline[0], count) + random.sample(offline[1], min(len(offline[1]), args.events - count))
+    random.shuffle(targets)
+
+    # Send go-live events and sample memory
+    for at, login in zip(schedule, targets):
+        while time.time() - t0 < at:
+            if monitors:
+                rss.append(sum(n.memory_info().rss for n in monitors))
+
+            time.sleep(min(1.0, max(0.0, t0 + at - time.time())))
+
+        call(loop, fake.setLive, login)
+
+    # Give last events time to be detected
+    grace = time.time() + max(args.refresh, args.refresh_priority) * 3
+
+    while time.time() < grace and any(n["alerted"] is None for n in call(loop, lambda: list(fake.events))):
+        if monitors:
+            rss.append(sum(n.memory_info().rss for n in monitors))
+
+        time.sleep(0.5)
+
+    elapsed = time.time() - t0
+    stats = call(loop, fake.stats)
+    cpu = None
+
+    if monitors:
+        cpu = sum(n.cpu_times().user + n.cpu_times().system for n in monitors)
+        rss.append(sum(n.memory_info().rss for n in monitors))
+
+    for proc, log in zip(procs, logs):
+        proc.terminate()
+        proc.wait()
+        log.close()
+
+    if not monitors and resource: # Only children of this process are the apps
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = usage.ru_utime + usage.ru_stime
+        rss.append(usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024))
+
+    prioritySet = set(priority)
+    latency = {"priority" : [], "normal" : []}
+    missed = 0
+
+    for n in stats["events"]:
+        if n["latency"] is None:
+            missed += 1
+        else:
+            latency["priority" if n["login"] in prioritySet else "normal"].append(n["latency"])
+
+    cycles = max(1, stats["requests"].get("helix/streams", 0) / max(1, math.ceil(args.channels / 100)))
+
+    print("\nchannels {} + priority {}, instances {}, events {} over {:.0f}s, startup {:.1f}s".format(args.channels, args.priority, len(procs), len(stats["events"]), elapsed, startup))
+    print("\n{:<10} {:>6} {:>8} {:>8} {:>8} {:>8}".format("latency", "count", "p50", "p90", "p99", "max"))
+
+    for k in ["priority", "normal"]:
+        v = latency[k]
+
+        if v:
+            print("{:<10} {:>6} {:>7.2f}s {:>7.2f}s {:>7.2f}s {:>7.2f}s".format(k, len(v), percentile(v, 50), percentile(v, 90), percentile(v, 99), max(v)))
+
+    print("missed alerts: {}, duplicate alerts: {}".format(missed, sum(n - 1 for n in stats["alerts"].values() if n > 1)))
+    print("\n{:<24} {:>8} {:>10} {:>8}".format("requests", "total", "per cycle", "errors"))
+
+    for k in sorted(stats["requests"]):
+        print("{:<24} {:>8} {:>10.2f} {:>8}".format(k, stats["requests"][k], stats["requests"][k] / cycles, stats["errors"].get(k, 0)))
+
+    print("\nnormal cycles {:.0f}, cpu {}, rss peak {}".format(cycles, "{:.2f}s".format(cpu) if cpu is not None else "-", "{:.1f}MB".format(max(rss) / 1048576) if rss else "-"))
+
+    if not args.keep:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Microbenchmark of parseM3U8 against the previous implementation on bench/corpus playlists
+# Usage: python bench/benchM3U8.py [--number 2000]
+
+import sys
+import re
+import argparse
+import timeit
+from glob import glob
+from os.path import join, dirname, abspath, basename
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), "src"))
+
+import TwitchLiveAlert as tla
+
+# parseM3U8 before single pass rewrite, kept for comparison
+def parseM3U8Legacy(inputM3U8, excludeURL=None, limit=0): # No leak
+    lines = [l for l in inputM3U8.split("\n") if l]
+    parsed = {}
+    extraKeys = ["#EXT-X-TWITCH-INFO", "#EXT-X-MEDIA", "#EXT-X-STREAM-INF", "#EXT-X-DATERANGE"]
+    multiKeys = ["#EXT-X-MEDIA", "#EXT-X-STREAM-INF", "#EXT-X-DATERANGE", "#EXT-X-PROGRAM-DATE-TIME", "#EXTINF", "#EXT-X-TWITCH-PREFETCH"]
+    count = 0
+
+    if "#EXTM3U" in lines[0]:
+        for n in lines:
+            if limit > 0 and limit < count: # Limit parsed line count
+                break
+
+            if "#EXTM3U" not in n and n[0] == "#":
+                temp = n.split(":", 1) # Split at first colon
+
+                if temp[0] in extraKeys: # Split again for extra options
+                    temp2 = [n.split("=") for n in re.split(r',(?=[A-Z])', temp[1].replace('"', ""))] # Split at comma followed by capitalized letter
+
+                    if temp[0] in multiKeys: # Create list for multikeys
+                        tempDict = {}
+
+                        for m in temp2:
+                            if len(m) > 1:
+                                tempDict[m[0]] = m[1]
+
+                        if tempDict:
+                            if parsed.get(temp[0]):
+                               parsed[temp[0]].append(tempDict)
+                            else:
+                                parsed[temp[0]] = [tempDict]
+                    else:
+                        tempDict = {}
+
+                        for m in temp2:
+                            if len(m) > 1:
+                                tempDict[m[0]] = m[1]
+                        if tempDict:
+                            parsed[temp[0]] = tempDict
+                else:
+                    if temp[0] in multiKeys:
+                        if parsed.get(temp[0]):
+                            parsed[temp[0]].append(temp[1])
+                        else:
+                            parsed[temp[0]] = [temp[1]]
+                    else:
+                        parsed[temp[0]] = temp[1]
+            elif not excludeURL and n[0:5] == "https":
+                if parsed.get("url"):
+                    parsed["url"].append(n)
+                else:
+                    parsed["url"] = [n]
+
+            count += 1
+
+    return parsed
+
+# Same arguments as getStreamInformation
+def getCalls(fileName):
+    if basename(fileName).startswith("master"):
+        return [{}, {"keys" : tla.masterKeys}]
+
+    return [{"excludeURL" : True, "limit" : 7}, {"excludeURL" : True, "limit" : 7, "keys" : tla.variantKeys}]
+
+# Returns only the fields getStreamInformation reads
+def getFields(parsed):
+    fields = {}
+
+    for k in tla.masterKeys | tla.variantKeys | {"url"}:
+        if k in parsed:
+            fields[k] = parsed[k]
+
+    return fields
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    corpus = sorted(glob(join(dirname(abspath(__file__)), "corpus", "*.m3u8")))
+
+    print("{:<28} {:>12} {:>12} {:>12} {:>8} {:>6}".format("playlist", "legacy (us)", "full (us)", "keys (us)", "speedup", "same"))
+
+    for fileName in corpus:
+        with open(fileName, encoding="utf-8") as f:
+            playlist = f.read()
+
+        legacyArgs, newArgs = getCalls(fileName)
+
+        try:
+            expected = getFields(parseM3U8Legacy(playlist, **legacyArgs))
+            legacy = timeit.timeit(lambda: parseM3U8Legacy(playlist, **legacyArgs), number=args.number) / args.number
+        except Exception: # Legacy parser fails on tags without colon (#EXT-X-DISCONTINUITY)
+            expected = None
+            legacy = 0.0
+
+        full = timeit.timeit(lambda: tla.parseM3U8(playlist, **legacyArgs), number=args.number) / args.number
+        keys = timeit.timeit(lambda: tla.parseM3U8(playlist, **newArgs), number=args.number) / args.number
+        same = "error" if expected is None else ("yes" if getFields(tla.parseM3U8(playlist, **newArgs)) == expected else "NO")
+
+        print("{:<28} {:>12.1f} {:>12.1f} {:>12.1f} {:>7.1f}x {:>6}".format(basename(fileName), legacy * 1e6, full * 1e6, keys * 1e6, legacy / keys if legacy else 0, same))
+
+    # Quoted attribute values containing commas
+    line = '#EXTM3U\n#EXT-X-DATERANGE:ID="ad",X-TV-TWITCH-AD-URL="https://example.com/ad?a=1,B=2",X-TV-TWITCH-AD-COMMERCIAL-ID="Ad,Break"'
+    print("\nlegacy: {}".format(parseM3U8Legacy(line).get("#EXT-X-DATERANGE")))
+    print("new:    {}".format(tla.parseM3U8(line).get("#EXT-X-DATERANGE")))
+
+if __name__ == "__main__":
+    main()
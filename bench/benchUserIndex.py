@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark getLiveResponse cycle time against alert list size
+# Compares userID reverse index (UserDataMap) with searchForValue linear scan
+# Usage: python bench/benchUserIndex.py [--sizes 100,500,1000,2000,5000] [--live 0.2] [--cycles 5]
+
+import sys
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join, dirname, abspath
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), "src"))
+
+import TwitchLiveAlert as tla
+
+# Canned Helix /streams response for requested user_login chunk
+def fakeAPIResponse(liveUsers):
+    def getAPIResponse(url, *args, **kwargs):
+        query = parse_qs(urlsplit(url).query)
+
+        if "user_login" in query:
+            return {"data" : [liveUsers[k] for k in query["user_login"] if k in liveUsers]}
+
+        return []
+
+    return getAPIResponse
+
+def buildUserData(size, mapClass):
+    userData = mapClass()
+
+    for i in range(size):
+        userData["user{}".format(i)] = [str(100000 + i), "User{}".format(i), "0", False, None, []]
+
+    return userData
+
+def buildLiveUsers(size, liveRatio):
+    liveUsers = {}
+    step = max(1, int(1 / liveRatio)) if liveRatio > 0 else size + 1
+
+    for i in range(0, size, step):
+        liveUsers["user{}".format(i)] = {"id" : str(900000 + i), "user_id" : str(100000 + i), "user_name" : "User{}".format(i), "game_id" : "", "title" : "title", "viewer_count" : 1, "started_at" : "2021-01-01T00:00:00Z"}
+
+    return liveUsers
+
+def runCycles(alert, userData, cycles):
+    t0 = time.perf_counter()
+
+    for _ in range(cycles):
+        alert.getLiveResponse(userData)
+
+    return (time.perf_counter() - t0) / cycles
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100,500,1000,2000,5000")
+    parser.add_argument("--live", type=float, default=0.2, help="ratio of live channels")
+    parser.add_argument("--cycles", type=int, default=5)
+    args = parser.parse_args()
+
+    tla.logConsole = ""
+    tla.OAuthToken = ""
+
+    alert = tla.TwitchLiveAlert.__new__(tla.TwitchLiveAlert)
+    alert.TWclientID = ""
+    alert.gameCache = tla.GameCache("") # Empty file name, never loaded or saved
+    alert.pollSchedule = None
+    alert.chunkExecutor = ThreadPoolExecutor(max_workers=8)
+
+    print("{:>8} {:>8} {:>14} {:>14} {:>8}".format("channels", "live", "scan (ms)", "index (ms)", "speedup"))
+
+    for size in [int(n) for n in args.sizes.split(",")]:
+        liveUsers = buildLiveUsers(size, args.live)
+        tla.getAPIResponse = fakeAPIResponse(liveUsers)
+
+        scan = runCycles(alert, buildUserData(size, dict), args.cycles)
+        index = runCycles(alert, buildUserData(size, tla.UserDataMap), args.cycles)
+
+        print("{:>8} {:>8} {:>14.2f} {:>14.2f} {:>7.1f}x".format(size, len(liveUsers), scan * 1000, index * 1000, scan / index if index else 0))
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import sys, signal
-import win32api,win32process,win32con
 import configparser
-import msvcrt
 import os
 from os import makedirs
 from os.path import isfile, join, exists, dirname, abspath, basename, splitext
@@ -14,29 +12,85 @@ from requests.packages.urllib3.exceptions import InsecureRequestWarning
 import time
 from datetime import datetime, timedelta
 from html import escape
-from urllib.parse import quote
+from urllib.parse import quote, urlsplit
 import hashlib
 import threading
 import re
 import traceback
+import cProfile
+import pstats
+import io
 import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import atexit
+import asyncio
+import random
+import queue
+import heapq
+import bisect
+import multiprocessing
+import sqlite3
+import socket
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 try:
     from zoneinfo import ZoneInfo
 except ImportError:
     from backports.zoneinfo import ZoneInfo
 
-# Thread safe print
-def safeprint(*args, **kwargs):
-    with printLock:
-        if logConsole:
-            logging.info(*args, **kwargs)
-        else:
-            print(*args, **kwargs)
+aiohttp = None # Optional, imported by requireAiohttp() for asyncpriority and eventsub
+
+logQueue = queue.Queue() # Unbounded so callers never block, drained by one QueueListener thread
+logger = logging.getLogger("TwitchLiveAlert")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+logger.addHandler(QueueHandler(logQueue))
+
+# Thread safe print, queues message with optional structured fields (loginID, broadcastID, phase, latency...)
+def safeprint(*args, **fields):
+    logger.info(" ".join(str(n) for n in args), extra={"fields" : fields})
+
+# One JSON object per line with time, thread, message and structured fields
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time" : datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "thread" : record.threadName,
+            "message" : record.getMessage()
+        }
+        data.update(getattr(record, "fields", None) or {})
+
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+# Start background log writer to console and optional rotating log file (logFormat text or json)
+def startLogging(logFile="", logFormat="text", maxSize=10, backups=3):
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("{message}", style="{"))
+    handlers = [console]
+
+    if logFile:
+        try:
+            if maxSize > 0:
+                fileHandler = RotatingFileHandler(logFile, "a", maxBytes=maxSize * 1048576, backupCount=backups, encoding="utf-8")
+            else:
+                fileHandler = logging.FileHandler(logFile, "a", "utf-8")
+
+            fileHandler.setFormatter(JSONFormatter() if logFormat.lower() == "json" else logging.Formatter("{message}", style="{"))
+            handlers.append(fileHandler)
+        except OSError as e:
+            print("Log file Error: {}".format(e))
+
+    listener = QueueListener(logQueue, *handlers)
+    listener.start()
+    atexit.register(listener.stop) # Write queued messages before exit
+
+    return listener
 
 # Handle system interrupt to break python loop scope
 def signalHandler(signal, frame):
-    threads = [t for t in threading.enumerate() if t.name != "MainThread"]
+    threads = [t for t in threading.enumerate() if t.name != "MainThread" and hasattr(t, "stop")]
 
     if threads:
         safeprint("\nKeyboard interrupt: Stopping {0} thread{1} before main thread...".format(len(threads), "s" if len(threads) != 1 else ""))
@@ -46,18 +100,52 @@ def signalHandler(signal, frame):
         for t in threads:
             t.join()
 
+    telegramQueue.flush() # Deliver queued alerts before exit
+    alertStore.save()
+    coordinator.close() # Hand shards to other instances
+
     sys.exit()
 
-# Keyboard event
-def kbFunc():
-    return ord(msvcrt.getch()) if msvcrt.kbhit() else 0
+# Platform layer, Windows modules are imported on first use so the core also runs on Linux
+isWindows = sys.platform == "win32"
+headless = not isWindows # Telegram only without console keys, toast and console title, also set by --headless
+
+# Wait for next key press, never returns when headless
+def readKey():
+    if headless:
+        while True:
+            time.sleep(3600) # Unlike lock waits, sleep is interrupted by Ctrl+C on Windows
+
+    import msvcrt
+
+    return ord(msvcrt.getch())
 
 # Pause and exit on key press
 def exitOnKey():
-    safeprint("아무 키나 누르면 종료 된다에요...")
-    msvcrt.getch()
+    if not headless:
+        safeprint("아무 키나 누르면 종료 된다에요...")
+        readKey()
+
     sys.exit()
 
+# Set console window title
+def setTitle(title):
+    if isWindows and not headless:
+        os.system("title {}".format(title))
+
+# Returns aiohttp module or None if it isn't installed, imported on first use to keep start fast
+def requireAiohttp():
+    global aiohttp
+
+    if aiohttp is None:
+        try:
+            import aiohttp as module
+            aiohttp = module
+        except ImportError:
+            aiohttp = False
+
+    return aiohttp or None
+
 # Get absolute path to resource, works for dev and for PyInstaller
 def resourcePath(relPath):
     try:
@@ -70,6 +158,15 @@ def resourcePath(relPath):
 
 def setpriority(pid=None,priority=1):
     # Set priority between 0-5 where 2 is normal priority.
+    if not isWindows: # Same classes as nice values
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid or 0, [19, 10, 0, -5, -10, -20][priority])
+        except (OSError, AttributeError):
+            pass
+
+        return
+
+    import win32api, win32process, win32con
 
     priorityclasses = [win32process.IDLE_PRIORITY_CLASS,
                        win32process.BELOW_NORMAL_PRIORITY_CLASS,
@@ -94,8 +191,786 @@ def timeStamp(format = None):
 
     return date_string
 
-# Returns valid API response
-def getAPIResponse(url, clientID=None, kraken=None, token=None, ignoreHeader=None, data=None, printError=None, post=None, raw=None, ignoreKrakenHeader=None, insecure=None):
+# Shared keep-alive connection pools, one requests.Session per host
+class HTTPPool:
+    def __init__(self, poolSize=10, keepAlive=True, hostOverride=""):
+        self.poolSize = max(1, poolSize)
+        self.keepAlive = keepAlive
+        self.hostOverride = hostOverride.rstrip("/")
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.loopRequests = 0 # Requests made by main loop and its helix chunk workers
+        self.fingerprints = OrderedDict() # (key, url): [ETag, Last-Modified, body digest] of last 200 response
+        self.fingerprintSize = 2048
+
+    # Returns session bound to the host of given url (api.twitch.tv, usher.ttvnw.net, video-edge-*, api.telegram.org...)
+    def getSession(self, url):
+        host = urlsplit(url).netloc.lower()
+        session = self.sessions.get(host)
+
+        if session is None:
+            with self.lock:
+                session = self.sessions.get(host)
+
+                if session is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=self.poolSize)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+
+                    if not self.keepAlive:
+                        session.headers.update({"Connection" : "close"})
+
+                    self.sessions[host] = session
+
+        return session
+
+    # Returns url rewritten to hostOverride as {hostOverride}/{host}{path}, used with tools/fakeTwitch.py
+    def rewrite(self, url):
+        if not self.hostOverride:
+            return url
+
+        parsed = urlsplit(url)
+
+        return "{}/{}{}".format(self.hostOverride, parsed.netloc, url.split(parsed.netloc, 1)[1])
+
+    def request(self, method, url, **kwargs):
+        t0 = time.time()
+        status = "error"
+
+        try:
+            res = self.getSession(url).request(method, self.rewrite(url), **kwargs)
+            status = res.status_code
+
+            return res
+        finally:
+            metrics.observeRequest(url, status, time.time() - t0)
+
+            if isOAuthUpdater():
+                with self.lock:
+                    self.loopRequests += 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    # Returns If-None-Match and If-Modified-Since headers from last response of key and url
+    def validators(self, key, url):
+        with self.lock:
+            entry = self.fingerprints.get((key, url))
+
+        headers = {}
+
+        if entry:
+            if entry[0]:
+                headers["If-None-Match"] = entry[0]
+            if entry[1]:
+                headers["If-Modified-Since"] = entry[1]
+
+        return headers
+
+    # Returns True if response is the same as last response of key and url, by 304 or body digest
+    def unchanged(self, key, url, res):
+        with self.lock:
+            if res.status_code == 304:
+                if (key, url) in self.fingerprints:
+                    self.fingerprints.move_to_end((key, url))
+                    return True
+
+                return False
+
+        if res.status_code != 200: # Errors are always parsed
+            return False
+
+        entry = [res.headers.get("ETag"), res.headers.get("Last-Modified"), hashlib.sha1(res.content).digest()]
+
+        with self.lock:
+            last = self.fingerprints.pop((key, url), None)
+            self.fingerprints[(key, url)] = entry
+
+            while len(self.fingerprints) > self.fingerprintSize:
+                self.fingerprints.popitem(last=False)
+
+        return last is not None and last[2] == entry[2]
+
+    # Drop fingerprints of key, next responses are parsed again
+    def forget(self, key):
+        with self.lock:
+            for k in [k for k in self.fingerprints if k[0] == key]:
+                del self.fingerprints[k]
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    # Returns { host: {"requests": n, "hits": n, "misses": n} } where misses are new connections (TCP+TLS handshakes)
+    def stats(self):
+        stats = {}
+
+        with self.lock:
+            sessions = list(self.sessions.items())
+
+        for host, session in sessions:
+            numRequests = 0
+            numConnections = 0
+
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+
+                for key in pools.keys():
+                    pool = pools.get(key)
+
+                    if pool:
+                        numRequests += pool.num_requests
+                        numConnections += pool.num_connections
+
+            stats[host] = {"requests" : numRequests, "hits" : max(0, numRequests - numConnections), "misses" : numConnections}
+
+        return stats
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+
+            self.sessions.clear()
+
+# Token bucket of a single endpoint group
+class RateBucket:
+    def __init__(self, name, limit, period=60.0, share=1.0):
+        self.name = name
+        self.period = period
+        self.share = share # Part of limit this process may use
+        self.setLimit(limit)
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.blockedUntil = 0.0
+        self.waiters = [] # Heap of [priority, sequence]
+        self.waits = 0
+        self.waitTotal = 0.0
+        self.waitMax = 0.0
+        self.limited = 0 # 429 responses
+
+    # Set requests per period, scaled by share
+    def setLimit(self, limit):
+        self.capacity = max(1.0, float(int(limit * self.share)))
+        self.rate = self.capacity / self.period # Tokens per second
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until next token is available
+    def delay(self, now):
+        if now < self.blockedUntil:
+            return self.blockedUntil - now
+
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+# Shared request scheduler, ranks waiting requests by priority and follows Ratelimit headers
+class RateLimiter:
+    PROBE = 0 # Priority channel probes
+    ALERT = 1 # Requests needed to deliver an alert
+    POLL = 2 # Normal list polling
+    BACKGROUND = 3 # User data refresh
+
+    def __init__(self, enabled=True, helixLimit=800, share=1.0):
+        self.enabled = enabled
+        self.condition = threading.Condition()
+        self.sequence = 0
+        self.buckets = { # share splits Twitch limits between priority worker processes
+            "helix" : RateBucket("helix", helixLimit, share=share), # Helix points per minute of app access token
+            "twitch" : RateBucket("twitch", 600, share=share), # Access token, OAuth
+            "usher" : RateBucket("usher", 600, share=share),
+            "telegram" : RateBucket("telegram", 30, 1.0) # Telegram bot API messages per second
+        }
+
+    # Returns bucket of given url or None for unlimited hosts (video-edge playlists, thumbnails)
+    def getBucket(self, url):
+        parsed = urlsplit(url)
+        host = parsed.netloc.lower()
+
+        if host == "api.twitch.tv":
+            return self.buckets["helix"] if parsed.path.startswith("/helix") else self.buckets["twitch"]
+        elif host == "id.twitch.tv":
+            return self.buckets["twitch"]
+        elif host == "usher.ttvnw.net":
+            return self.buckets["usher"]
+        elif host == "api.telegram.org":
+            return self.buckets["telegram"]
+
+        return None
+
+    # Wait for request token of given url, higher priority (lower value) goes first
+    def acquire(self, url, priority=POLL):
+        bucket = self.getBucket(url) if self.enabled else None
+
+        if bucket is None:
+            return 0.0
+
+        t0 = time.time()
+
+        with self.condition:
+            self.sequence += 1
+            entry = [priority, self.sequence]
+            heapq.heappush(bucket.waiters, entry)
+
+            try:
+                while True:
+                    now = time.time()
+                    bucket.refill(now)
+                    delay = bucket.delay(now)
+
+                    if bucket.waiters[0] is entry and delay <= 0:
+                        heapq.heappop(bucket.waiters)
+                        bucket.tokens -= 1
+                        self.condition.notify_all() # Wake next waiter
+                        break
+
+                    self.condition.wait(timeout=max(0.01, delay) if bucket.waiters[0] is entry else None)
+            finally:
+                if any(n is entry for n in bucket.waiters): # Interrupted while waiting, don't block the queue head
+                    bucket.waiters[:] = [n for n in bucket.waiters if n is not entry]
+                    heapq.heapify(bucket.waiters)
+                    self.condition.notify_all()
+
+            waited = time.time() - t0
+
+            if waited > 0.01:
+                bucket.waits += 1
+                bucket.waitTotal += waited
+                bucket.waitMax = max(bucket.waitMax, waited)
+
+        return waited
+
+    # Non-blocking acquire for event loop callers, returns 0 if granted or seconds to wait
+    def reserve(self, url, priority=PROBE):
+        bucket = self.getBucket(url) if self.enabled else None
+
+        if bucket is None:
+            return 0.0
+
+        with self.condition:
+            now = time.time()
+            bucket.refill(now)
+            delay = bucket.delay(now)
+
+            if delay <= 0 and (not bucket.waiters or bucket.waiters[0][0] > priority):
+                bucket.tokens -= 1
+                return 0.0
+
+        return max(0.01, delay)
+
+    # Adjust bucket from response status and Ratelimit headers
+    def update(self, url, status, headers, info=None):
+        bucket = self.getBucket(url) if self.enabled else None
+
+        if bucket is None:
+            return
+
+        with self.condition:
+            now = time.time()
+
+            try:
+                remaining = headers.get("Ratelimit-Remaining")
+                reset = headers.get("Ratelimit-Reset")
+
+                if headers.get("Ratelimit-Limit"): # Reported for whole token, keep share of it
+                    bucket.refill(now)
+                    bucket.setLimit(float(headers.get("Ratelimit-Limit")))
+                    bucket.tokens = min(bucket.tokens, bucket.capacity)
+
+                if remaining is not None:
+                    bucket.refill(now)
+                    bucket.tokens = min(bucket.tokens, float(remaining) * bucket.share)
+
+                    if float(remaining) < 1 and reset:
+                        bucket.blockedUntil = max(bucket.blockedUntil, float(reset))
+            except ValueError:
+                pass
+
+            if status == 429:
+                bucket.limited += 1
+                bucket.tokens = 0.0
+                retryAfter = 1.0
+
+                try:
+                    if info and isinstance(info, dict) and info.get("parameters"): # Telegram
+                        retryAfter = float(info.get("parameters").get("retry_after", 1))
+                    elif headers.get("Ratelimit-Reset"):
+                        retryAfter = max(1.0, float(headers.get("Ratelimit-Reset")) - now)
+                    elif headers.get("Retry-After"):
+                        retryAfter = float(headers.get("Retry-After"))
+                except ValueError:
+                    pass
+
+                bucket.blockedUntil = max(bucket.blockedUntil, now + retryAfter)
+                safeprint("{} 요청 한도 초과 (429) [{}] {}초 후에 다시 요청한다에요".format(timeStamp(), bucket.name, round(retryAfter, 1)))
+
+            self.condition.notify_all()
+
+    # Returns { bucket: {"queue": n, "tokens": n, "waits": n, "waitAvg": s, "waitMax": s, "limited": n} }
+    def stats(self):
+        stats = {}
+
+        with self.condition:
+            now = time.time()
+
+            for name, bucket in self.buckets.items():
+                bucket.refill(now)
+                stats[name] = {
+                    "queue" : len(bucket.waiters),
+                    "tokens" : int(bucket.tokens),
+                    "waits" : bucket.waits,
+                    "waitAvg" : bucket.waitTotal / bucket.waits if bucket.waits else 0.0,
+                    "waitMax" : bucket.waitMax,
+                    "limited" : bucket.limited
+                }
+
+        return stats
+
+# Returns low cardinality endpoint label of url (helix/streams, usher, telegram/sendMessage...)
+def metricEndpoint(url):
+    parsed = urlsplit(url)
+    host = parsed.netloc.lower()
+    path = parsed.path.strip("/").split("/")
+
+    if host == "api.twitch.tv":
+        return "helix/{}".format(path[1]) if path[0] == "helix" and len(path) > 1 else "access_token"
+    elif host == "id.twitch.tv":
+        return "oauth2/{}".format(path[-1])
+    elif host == "usher.ttvnw.net":
+        return "usher"
+    elif host == "api.telegram.org":
+        return "telegram/{}".format(path[-1])
+    elif parsed.path.endswith(".m3u8"):
+        return "variant"
+    elif host == "static-cdn.jtvnw.net":
+        return "thumbnail"
+
+    return "other"
+
+# Prometheus text format metrics served from a local HTTP endpoint, every call is a no-op when disabled
+class Metrics:
+    definitions = {
+        "tla_http_requests_total" : ["counter", "HTTP requests by endpoint and status"],
+        "tla_http_request_seconds" : ["histogram", "HTTP request duration until response headers", (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)],
+        "tla_cycle_phase_seconds" : ["histogram", "Main loop cycle duration by phase", (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)],
+        "tla_cycle_seconds" : ["histogram", "Main loop cycle duration without refresh wait", (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)],
+        "tla_channels" : ["gauge", "Channels in alert list"],
+        "tla_priority_active" : ["gauge", "Priority channels being probed"],
+        "tla_threads" : ["gauge", "Running threads"],
+        "tla_alert_lag_seconds" : ["histogram", "Seconds from stream start to alert", (5, 10, 15, 30, 45, 60, 90, 120, 300, 600)],
+        "tla_alerts_total" : ["counter", "Stream alerts by list"],
+        "tla_deliveries_total" : ["counter", "Alert deliveries by channel and result"],
+        "tla_telegram_delivery_seconds" : ["histogram", "Seconds from queueing to Telegram delivery", (0.5, 1, 2, 5, 10, 30, 60, 120)],
+        "tla_telegram_queue" : ["gauge", "Telegram messages waiting for delivery"],
+        "tla_oauth_refresh_total" : ["counter", "OAuth token refreshes by result"],
+        "tla_oauth_invalid_total" : ["counter", "Helix responses rejecting current OAuth token"],
+        "tla_http_unchanged_total" : ["counter", "Responses skipped as unchanged since last request by endpoint"]
+    }
+
+    def __init__(self, port=0, host="127.0.0.1"):
+        self.enabled = port > 0
+        self.lock = threading.Lock()
+        self.values = {} # name: { labels: value or [bucketCounts, sum, count] }
+        self.server = None
+
+        if self.enabled:
+            self.start(host, port)
+
+    def start(self, host, port):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((host, port), Handler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True).start()
+            safeprint("{} 메트릭 서버 시작: http://{}:{}/metrics".format(timeStamp(), host, port))
+        except OSError as e:
+            safeprint("{} 메트릭 서버를 시작하지 못했어요 ({}:{}): {}".format(timeStamp(), host, port, e))
+            self.enabled = False
+
+    def inc(self, name, value=1, **labels):
+        if self.enabled:
+            key = tuple(sorted(labels.items()))
+
+            with self.lock:
+                series = self.values.setdefault(name, {})
+                series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if self.enabled:
+            with self.lock:
+                self.values.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name, value, **labels):
+        if self.enabled:
+            buckets = self.definitions[name][2]
+            key = tuple(sorted(labels.items()))
+
+            with self.lock:
+                series = self.values.setdefault(name, {})
+                histogram = series.get(key)
+
+                if histogram is None:
+                    histogram = series[key] = [[0] * len(buckets), 0.0, 0]
+
+                for i, bound in enumerate(buckets):
+                    if value <= bound:
+                        histogram[0][i] += 1
+                        break
+
+                histogram[1] += value
+                histogram[2] += 1
+
+    # Record HTTP request of url with status code or "error"
+    def observeRequest(self, url, status, seconds):
+        if self.enabled:
+            endpoint = metricEndpoint(url)
+            self.inc("tla_http_requests_total", endpoint=endpoint, status=str(status))
+            self.observe("tla_http_request_seconds", seconds, endpoint=endpoint)
+
+    # Record alert of stream started at startTime (UTC timestamp)
+    def alert(self, listName, startTime):
+        if self.enabled:
+            self.inc("tla_alerts_total", list=listName)
+
+            if startTime:
+                self.observe("tla_alert_lag_seconds", max(0.0, time.time() - startTime), list=listName)
+
+    @staticmethod
+    def formatLabels(labels, extra=""):
+        pairs = ['{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in labels]
+
+        if extra:
+            pairs.append(extra)
+
+        return "{{{}}}".format(",".join(pairs)) if pairs else ""
+
+    # Returns all metrics in Prometheus text exposition format
+    def render(self):
+        self.set("tla_threads", threading.active_count())
+        lines = []
+
+        with self.lock:
+            values = {name : dict(series) for name, series in self.values.items()}
+
+        for name, definition in self.definitions.items():
+            series = values.get(name)
+
+            if not series:
+                continue
+
+            lines.append("# HELP {} {}".format(name, definition[1]))
+            lines.append("# TYPE {} {}".format(name, definition[0]))
+
+            for labels in sorted(series):
+                if definition[0] == "histogram":
+                    counts, total, count = series[labels]
+                    cumulative = 0
+
+                    for bound, n in zip(definition[2], counts):
+                        cumulative += n
+                        lines.append("{}_bucket{} {}".format(name, self.formatLabels(labels, 'le="{}"'.format(bound)), cumulative))
+
+                    lines.append("{}_bucket{} {}".format(name, self.formatLabels(labels, 'le="+Inf"'), count))
+                    lines.append("{}_sum{} {}".format(name, self.formatLabels(labels), total))
+                    lines.append("{}_count{} {}".format(name, self.formatLabels(labels), count))
+                else:
+                    lines.append("{}{} {}".format(name, self.formatLabels(labels), series[labels]))
+
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+# Records wall time and main loop HTTP requests of each loopLiveAlert phase, optionally with cProfile
+class CycleProfiler:
+    def __init__(self, logFile="", cycles=0, window=100):
+        self.logFile = logFile # JSON lines, one summary per cycle
+        self.cycles = cycles # Cycles to run under cProfile
+        self.window = window
+        self.history = OrderedDict() # phase: deque of last window durations in run order
+        self.totals = deque(maxlen=window)
+        self.phases = []
+        self.cycle = 0
+        self.profile = None
+        self.profileLeft = 0
+
+        if cycles > 0:
+            self.startProfile(cycles)
+
+    # Profile next cycles, takes effect from next start()
+    def startProfile(self, cycles):
+        self.profileLeft = max(1, cycles)
+
+    def start(self):
+        self.cycle += 1
+        self.phases = []
+        self.cycleStart = self.mark = time.time()
+        self.requestStart = self.requestMark = httpPool.loopRequests
+
+        if self.profileLeft:
+            if not self.profile:
+                safeprint("{} cProfile 시작 [{} 회]".format(timeStamp(), self.profileLeft))
+                self.profile = cProfile.Profile()
+
+            self.profile.enable() # Paused between cycles to leave out refresh wait
+
+    # Close current phase
+    def lap(self, phase):
+        now = time.time()
+        requests = httpPool.loopRequests
+        seconds = now - self.mark
+        self.phases.append([phase, seconds, requests - self.requestMark])
+        self.history.setdefault(phase, deque(maxlen=self.window)).append(seconds)
+        metrics.observe("tla_cycle_phase_seconds", seconds, phase=phase)
+        self.mark = now
+        self.requestMark = requests
+
+    def end(self):
+        total = time.time() - self.cycleStart
+        self.totals.append(total)
+        metrics.observe("tla_cycle_seconds", total)
+
+        if self.logFile:
+            self.writeSummary(total)
+
+        if self.profile:
+            self.profile.disable()
+            self.profileLeft -= 1
+
+            if not self.profileLeft:
+                self.dumpProfile()
+                self.profile = None
+
+    @staticmethod
+    def percentile(values, p):
+        values = sorted(values)
+
+        return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+    def writeSummary(self, total):
+        slowest = max(self.phases, key=lambda n: n[1]) if self.phases else ["", 0.0, 0]
+        summary = {
+            "time" : datetime.now().isoformat(timespec="seconds"),
+            "cycle" : self.cycle,
+            "seconds" : round(total, 4),
+            "requests" : httpPool.loopRequests - self.requestStart,
+            "slowest" : slowest[0],
+            "phases" : {n[0] : {"seconds" : round(n[1], 4), "requests" : n[2]} for n in self.phases},
+            "p50" : {k : round(self.percentile(v, 50), 4) for k, v in self.history.items()},
+            "p99" : {k : round(self.percentile(v, 99), 4) for k, v in self.history.items()}
+        }
+
+        try:
+            with open(self.logFile, "a", encoding="utf-8") as f:
+                f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+        except OSError as e:
+            safeprint("{} Profile log Error: {}".format(timeStamp(), e))
+            self.logFile = ""
+
+    # Save cProfile stats and print top functions by cumulative time
+    def dumpProfile(self):
+        fileName = join(appPath, "cycleProfile_{}.prof".format(timeStamp("%y%m%d_%H%M%S")))
+        output = io.StringIO()
+
+        try:
+            self.profile.dump_stats(fileName)
+            pstats.Stats(self.profile, stream=output).sort_stats("cumulative").print_stats(15)
+            safeprint("{} cProfile 저장: '{}'\n{}".format(timeStamp(), fileName, output.getvalue().strip()))
+        except Exception as e:
+            safeprint("{} cProfile Error: {}".format(timeStamp(), e))
+
+    # Print rolling phase statistics
+    def printStats(self):
+        message = ""
+
+        for phase, values in self.history.items():
+            message += "{} [평균 {:.3f}초] [p50 {:.3f}초] [p99 {:.3f}초] [최대 {:.3f}초]\n".format(phase, sum(values) / len(values), self.percentile(values, 50), self.percentile(values, 99), max(values))
+
+        safeprint("{}\n{} 확인 주기 단계별 소요 시간 [최근 {} 회] [주기 p50 {:.3f}초 p99 {:.3f}초]\n{}\n{}{}".format("-"*50, timeStamp(), len(self.totals), self.percentile(self.totals, 50), self.percentile(self.totals, 99), "-"*50, message, "-"*50))
+
+class ScheduledTask:
+    def __init__(self, fn, name="", serial=False):
+        self.fn = fn # Returns seconds until next run, None to stop
+        self.name = name
+        self.serial = serial
+        self.delay = 1.0 # Last returned delay, reused when fn raises
+        self.entry = None # Pending heap entry
+        self.cancelled = False
+
+# Single timer thread for every periodic task, sleeps until the earliest deadline
+# Serial tasks run one at a time on the main loop worker (list cycle, OAuth, keys, EventSub)
+# Other tasks run on the probe pool (priority channels), a task has at most one pending run
+class Scheduler(threading.Thread):
+    def __init__(self, workers=32):
+        super(Scheduler, self).__init__(name="Scheduler", daemon=True)
+        self.heap = [] # [deadline, seq, task], task is None once dropped
+        self.seq = 0
+        self.dropped = 0 # Dropped entries left in heap
+        self.condition = threading.Condition()
+        self.serialExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="LiveAlertLoop", initializer=setOAuthUpdater)
+        self.probeExecutor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="Probe")
+        self.stopThread = False
+
+    # Run fn after delay seconds and again after every delay it returns
+    def schedule(self, fn, delay=0, name="", serial=False):
+        task = ScheduledTask(fn, name, serial)
+        self.push(task, delay)
+
+        return task
+
+    # Run fn once on the main loop worker as soon as possible
+    def call(self, fn, *args):
+        def once():
+            fn(*args)
+
+        return self.schedule(once, serial=True)
+
+    # Queue next run of task, an earlier pending run is kept
+    def push(self, task, delay):
+        with self.condition:
+            if task.cancelled or self.stopThread:
+                return
+
+            deadline = time.monotonic() + max(0.0, delay)
+
+            if task.entry:
+                if task.entry[0] <= deadline:
+                    return
+
+                self.drop(task)
+
+            self.seq += 1
+            task.entry = [deadline, self.seq, task]
+            wake = not self.heap or deadline < self.heap[0][0]
+            heapq.heappush(self.heap, task.entry)
+
+            if wake: # New earliest deadline
+                self.condition.notify()
+
+    # Run task as soon as possible instead of its next deadline
+    def runNow(self, task):
+        self.push(task, 0)
+
+    # Drop task from schedule, a running task is not rescheduled
+    def cancel(self, task):
+        with self.condition:
+            task.cancelled = True
+
+            if task.entry:
+                self.drop(task)
+
+    def drop(self, task):
+        task.entry[2] = None
+        task.entry = None
+        self.dropped += 1
+
+        if self.dropped > 64 and self.dropped > len(self.heap) // 2: # Compact after channel churn
+            self.heap = [n for n in self.heap if n[2]]
+            heapq.heapify(self.heap)
+            self.dropped = 0
+
+    # Returns {"tasks": n, "serial": n, "next": seconds until earliest run}
+    def stats(self):
+        with self.condition:
+            tasks = [n for n in self.heap if n[2]]
+
+            return {
+                "tasks" : len(tasks),
+                "serial" : sum(1 for n in tasks if n[2].serial),
+                "next" : round(max(0.0, min(n[0] for n in tasks) - time.monotonic()), 3) if tasks else None
+            }
+
+    def stop(self):
+        with self.condition:
+            self.stopThread = True
+            self.condition.notify()
+
+        self.serialExecutor.shutdown(wait=False)
+        self.probeExecutor.shutdown(wait=False)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.stopThread:
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+
+                    wait = self.heap[0][0] - time.monotonic()
+
+                    if wait > 0:
+                        self.condition.wait(wait)
+                        continue
+
+                    task = heapq.heappop(self.heap)[2]
+
+                    if not task:
+                        self.dropped = max(0, self.dropped - 1)
+                        continue
+
+                    task.entry = None
+                    break
+
+                if self.stopThread:
+                    return
+
+            try:
+                (self.serialExecutor if task.serial else self.probeExecutor).submit(self.runTask, task)
+            except RuntimeError: # Executor shut down
+                return
+
+    def runTask(self, task):
+        if task.cancelled or self.stopThread:
+            return
+
+        try:
+            delay = task.fn()
+        except Exception as e:
+            safeprint("{} {} Error: {}\n{}".format(timeStamp(), task.name or "Scheduler", e, traceback.format_exc().rstrip()), phase="scheduler", task=task.name)
+            delay = task.delay
+
+        if delay is not None:
+            task.delay = delay
+            self.push(task, delay)
+
+oauthUpdater = threading.local()
+
+# Mark current thread as allowed to request OAuth token update
+def setOAuthUpdater():
+    oauthUpdater.enabled = True
+
+# Returns True if current thread may request OAuth token update
+def isOAuthUpdater():
+    return isinstance(threading.current_thread(), threading._MainThread) or getattr(oauthUpdater, "enabled", False)
+
+# Falsy result of getAPIResponse when response matches the fingerprint of last request, callers that don't check it see no data
+class UnchangedResponse(dict):
+    pass
+
+UNCHANGED = UnchangedResponse()
+
+# Returns valid API response, or UNCHANGED with fingerprint key when response is the same as last time
+def getAPIResponse(url, clientID=None, kraken=None, token=None, ignoreHeader=None, data=None, printError=None, post=None, raw=None, ignoreKrakenHeader=None, insecure=None, priority=RateLimiter.POLL, fingerprint=None):
     global needOAuthUpdate
     header = None
 
@@ -115,29 +990,45 @@ def getAPIResponse(url, clientID=None, kraken=None, token=None, ignoreHeader=Non
             if token: header.update({'Authorization' : "Bearer " + token})
 
     try:
+        rateLimiter.acquire(url, priority)
+
         if raw:
             if insecure:
-                with requests.get(url, timeout=10, verify=False) as res:
+                with httpPool.get(url, timeout=10, verify=False) as res:
+                    rateLimiter.update(url, res.status_code, res.headers)
                     return res.content
             else:
-                with requests.get(url, timeout=10) as res:
+                with httpPool.get(url, timeout=10) as res:
+                    rateLimiter.update(url, res.status_code, res.headers)
                     return res.content
         else:
             if post: # Update data
-                res = requests.post(url, data=data, headers=header, timeout=5)
+                res = httpPool.post(url, data=data, headers=header, timeout=5)
             else: # Request data
+                if fingerprint and header is not None:
+                    header.update(httpPool.validators(fingerprint, url))
+
                 if insecure:
-                    res = requests.get(url, headers=header, timeout=10, verify=False)
+                    res = httpPool.get(url, headers=header, timeout=10, verify=False)
                 else:
-                    res = requests.get(url, headers=header, timeout=10)
+                    res = httpPool.get(url, headers=header, timeout=10)
+
+                # Skip parsing when nothing changed since last request
+                if fingerprint and httpPool.unchanged(fingerprint, url, res):
+                    rateLimiter.update(url, res.status_code, res.headers)
+                    metrics.inc("tla_http_unchanged_total", endpoint=metricEndpoint(url))
+
+                    return UNCHANGED
 
             # code = res.status_code
             info = res.json()
+            rateLimiter.update(url, res.status_code, res.headers, info)
 
-            if isinstance(threading.current_thread(), threading._MainThread): # Update from main thread only
+            if isOAuthUpdater(): # Update from main thread and its helix chunk workers only
                 if info and info.get("status") == 401: # Must provide a valid Client-ID or OAuth token
-                    safeprint("{} Error: {}".format(timeStamp(), info.get("message")))
+                    safeprint("{} Error: {}".format(timeStamp(), info.get("message")), phase="oauth", status=401)
                     needOAuthUpdate = True
+                    metrics.inc("tla_oauth_invalid_total")
 
             if not kraken:
                 if info.get("data"):
@@ -157,6 +1048,7 @@ def getOAuthToken(clientID, clientSecret):
     url = "https://id.twitch.tv/oauth2/token?client_id={0}&client_secret={1}&grant_type=client_credentials".format(clientID, clientSecret)
 
     response = getAPIResponse(url, kraken=True, ignoreHeader=True, post=True)
+    result = "failed"
 
     try:
         # safeprint("{} Fetching new access token...".format(timeStamp()))
@@ -169,10 +1061,13 @@ def getOAuthToken(clientID, clientSecret):
                 data = json.dumps(response)
                 outputFile(filePath, data, mode="w", raw=True)
                 # safeprint("{} Successfully grabbed access token!".format(timeStamp()))
-                safeprint("{} 성공적으로 새로운 토큰을 받았다에요!".format(timeStamp()))
+                safeprint("{} 성공적으로 새로운 토큰을 받았다에요!".format(timeStamp()), phase="oauth")
+                result = "ok"
     except:
         pass
 
+    metrics.inc("tla_oauth_refresh_total", result=result)
+
 # Returns True if current OAuth token is valid
 def validateOAuthToken(clientID):
     filePath = join(appPath, "oauth_{}".format(clientID))
@@ -258,22 +1153,32 @@ def getClientID(botToken):
 
     return clientIDs
 
-# Telegram sendMessage API
-def sendMessage(botToken, TGclientID, message):
-    if not TGclientID:
-        return True
-
-    url = "https://api.telegram.org/bot{0}/{1}".format(botToken, "sendMessage")
-
-    data = {
+# Telegram sendMessage request data
+def getMessageData(TGclientID, message):
+    return {
         "chat_id": TGclientID,
         "text": message,
         "parse_mode": "HTML",
         "disable_web_page_preview": True
     }
 
-    res = getAPIResponse(url, kraken=True, ignoreHeader=True, data=data, post=True)
+# Telegram sendPhoto request data
+def getPhotoData(TGclientID, photo, caption=""):
+    return {
+        "chat_id": TGclientID,
+        "photo": photo,
+        "caption": caption,
+        "parse_mode": "HTML"
+    }
+
+# Telegram bot API request
+def telegramRequest(botToken, method, data):
+    url = "https://api.telegram.org/bot{0}/{1}".format(botToken, method)
 
+    return getAPIResponse(url, kraken=True, ignoreHeader=True, data=data, post=True, priority=RateLimiter.ALERT)
+
+# Returns True if Telegram response is ok
+def checkTelegramResponse(res):
     if res:
         if not res["ok"]:
             if res["error_code"] == 400:
@@ -288,35 +1193,164 @@ def sendMessage(botToken, TGclientID, message):
 
     return False
 
+# Telegram sendMessage API
+def sendMessage(botToken, TGclientID, message):
+    if not TGclientID:
+        return True
+
+    return checkTelegramResponse(telegramRequest(botToken, "sendMessage", getMessageData(TGclientID, message)))
+
 # Telegram sendPhoto API
 def sendPhoto(botToken, TGclientID, photo, caption=""):
     if not TGclientID:
         return True
 
-    url = "https://api.telegram.org/bot{0}/{1}".format(botToken, "sendPhoto")
+    return checkTelegramResponse(telegramRequest(botToken, "sendPhoto", getPhotoData(TGclientID, photo, caption)))
+
+# Background Telegram delivery, keeps message order and pace per chat and retries failed messages
+class TelegramQueue:
+    def __init__(self, workers=2, chatInterval=1.0, groupInterval=3.0, retries=5):
+        self.chatInterval = chatInterval # Seconds between messages to same chat
+        self.groupInterval = groupInterval # Groups and channels allow 20 messages per minute
+        self.retries = retries
+        self.condition = threading.Condition()
+        self.chats = {} # chatID: deque of [botToken, method, data, queued, attempts]
+        self.ready = [] # Heap of [readyTime, sequence, chatID]
+        self.busy = set() # Chats in ready heap or being sent
+        self.nextSend = {} # chatID: earliest time of next message
+        self.sequence = 0
+        self.pending = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retried = 0
+        self.latencyTotal = 0.0
+        self.latencyMax = 0.0
+
+        for i in range(max(1, workers)):
+            threading.Thread(target=self.work, name="TelegramWorker{}".format(i), daemon=True).start()
+
+    # Queue Telegram API request and return immediately
+    def put(self, botToken, method, data):
+        chatID = data.get("chat_id")
+
+        if not chatID:
+            return
 
-    data = {
-        "chat_id": TGclientID,
-        "photo": photo,
-        "caption": caption,
-        "parse_mode": "HTML"
-    }
+        with self.condition:
+            self.chats.setdefault(chatID, deque()).append([botToken, method, data, time.time(), 0])
+            self.pending += 1
+            metrics.set("tla_telegram_queue", self.pending)
 
-    res = getAPIResponse(url, kraken=True, ignoreHeader=True, data=data, post=True)
+            if chatID not in self.busy:
+                self.schedule(chatID, self.nextSend.get(chatID, 0))
 
-    if res:
-        if not res["ok"]:
-            if res["error_code"] == 400:
-                safeprint("메시지 전달 오류: 설정 파일이 잘 못 되었거나 메시지 호환이 안 된다에요")
-            elif res["error_code"] == 403:
-                safeprint("메시지 권한 오류: 봇에게 먼저 대화를 걸어 주세요")
+            self.condition.notify()
+
+    def sendMessage(self, botToken, TGclientID, message):
+        if TGclientID:
+            self.put(botToken, "sendMessage", getMessageData(TGclientID, message))
+
+    def sendPhoto(self, botToken, TGclientID, photo, caption=""):
+        if TGclientID:
+            self.put(botToken, "sendPhoto", getPhotoData(TGclientID, photo, caption))
+
+    # Push chat to ready heap, called with condition held
+    def schedule(self, chatID, readyTime):
+        self.sequence += 1
+        self.busy.add(chatID)
+        heapq.heappush(self.ready, [readyTime, self.sequence, chatID])
+
+    def work(self):
+        while True:
+            with self.condition:
+                while True:
+                    now = time.time()
+
+                    if self.ready and self.ready[0][0] <= now:
+                        chatID = heapq.heappop(self.ready)[2]
+                        job = self.chats[chatID][0]
+                        break
+
+                    self.condition.wait(self.ready[0][0] - now if self.ready else None)
+
+            res = None
+
+            try:
+                res = telegramRequest(job[0], job[1], job[2])
+            except Exception:
+                pass
+
+            now = time.time()
+            retryAfter = 0.0
+
+            if res and res.get("ok"):
+                done = True
+            elif res and res.get("error_code") == 429: # Wait as told, not counted as attempt
+                retryAfter = float((res.get("parameters") or {}).get("retry_after", 1))
+                done = False
+            elif (not res or res.get("error_code", 500) >= 500) and job[4] < self.retries: # Network or server error
+                job[4] += 1
+                retryAfter = min(60.0, 2.0 ** job[4])
+                done = False
             else:
-                if res.get("error_code"):
-                    safeprint("메시지 오류: {}".format(res.get("error_code")))
-        else:
-            return True
+                checkTelegramResponse(res)
+                safeprint("{0} 텔레그램 메시지 전달이 늦거나 실패할 수 있다에요...".format(timeStamp()), phase="delivery", method=job[1], chatID=chatID, attempts=job[4], latency=round(time.time() - job[3], 3))
+                done = True
+                res = None
+
+            with self.condition:
+                if done:
+                    self.chats[chatID].popleft()
+                    self.pending -= 1
+                    metrics.set("tla_telegram_queue", self.pending)
+
+                    if res:
+                        latency = now - job[3]
+                        self.delivered += 1
+                        self.latencyTotal += latency
+                        self.latencyMax = max(self.latencyMax, latency)
+                        metrics.inc("tla_deliveries_total", channel="telegram", result="ok")
+                        metrics.observe("tla_telegram_delivery_seconds", latency)
+                    else:
+                        self.failed += 1
+                        metrics.inc("tla_deliveries_total", channel="telegram", result="failed")
 
-    return False
+                    self.nextSend[chatID] = now + (self.groupInterval if str(chatID).startswith("-") else self.chatInterval)
+                    readyTime = self.nextSend[chatID]
+                else:
+                    self.retried += 1
+                    readyTime = now + retryAfter
+                    metrics.inc("tla_deliveries_total", channel="telegram", result="retried")
+
+                if self.chats[chatID]:
+                    self.schedule(chatID, readyTime)
+                else:
+                    del self.chats[chatID]
+                    self.busy.discard(chatID)
+
+                self.condition.notify_all()
+
+    # Wait until queue is empty or timeout
+    def flush(self, timeout=5):
+        deadline = time.time() + timeout
+
+        with self.condition:
+            while self.pending and time.time() < deadline:
+                self.condition.wait(deadline - time.time())
+
+        return not self.pending
+
+    # Returns {"queue": n, "delivered": n, "failed": n, "retried": n, "latencyAvg": s, "latencyMax": s}
+    def stats(self):
+        with self.condition:
+            return {
+                "queue" : self.pending,
+                "delivered" : self.delivered,
+                "failed" : self.failed,
+                "retried" : self.retried,
+                "latencyAvg" : self.latencyTotal / self.delivered if self.delivered else 0.0,
+                "latencyMax" : self.latencyMax
+            }
 
 # Convert time from UTC to local
 def convertUTCtoLocalTime(timeStr, format="[%y-%m-%d %I:%M:%S %p]", localTimeZone=""):
@@ -392,69 +1426,94 @@ def fileToList(fileName, removeDuplicate=None):
 
     return listItems
 
-# Parse Twitch.tv's M3U8 file
-def parseM3U8(inputM3U8, excludeURL=None, limit=0): # No leak
-    lines = [l for l in inputM3U8.split("\n") if l]
+# Reloads alert list file only when its modified time or size changes
+class ListWatcher:
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.stat = None # (mtime, size) of last read
+        self.items = [] # loginIDs in file order
+        self.itemSet = set()
+
+    # Returns [added, removed] loginIDs since last read or None if file is unchanged
+    def check(self):
+        try:
+            st = os.stat(self.fileName)
+            stat = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stat = None
+
+        if stat == self.stat:
+            return None
+
+        self.stat = stat
+        items = fileToList(self.fileName, removeDuplicate=True)
+        itemSet = set(items)
+        diff = [[n for n in items if n not in self.itemSet], [n for n in self.items if n not in itemSet]]
+        self.items = items
+        self.itemSet = itemSet
+
+        return diff
+
+m3u8ExtraKeys = frozenset(("#EXT-X-TWITCH-INFO", "#EXT-X-MEDIA", "#EXT-X-STREAM-INF", "#EXT-X-DATERANGE"))
+m3u8MultiKeys = frozenset(("#EXT-X-MEDIA", "#EXT-X-STREAM-INF", "#EXT-X-DATERANGE", "#EXT-X-PROGRAM-DATE-TIME", "#EXTINF", "#EXT-X-TWITCH-PREFETCH"))
+m3u8Attribute = re.compile(r'([A-Z0-9-]+)=(?:"([^"]*)"|([^,]*))') # Quoted values may contain commas
+
+# Parse Twitch.tv's M3U8 file in a single pass, only keeps tags in keys when given
+def parseM3U8(inputM3U8, excludeURL=None, limit=0, keys=None): # No leak
     parsed = {}
-    extraKeys = ["#EXT-X-TWITCH-INFO", "#EXT-X-MEDIA", "#EXT-X-STREAM-INF", "#EXT-X-DATERANGE"]
-    multiKeys = ["#EXT-X-MEDIA", "#EXT-X-STREAM-INF", "#EXT-X-DATERANGE", "#EXT-X-PROGRAM-DATE-TIME", "#EXTINF", "#EXT-X-TWITCH-PREFETCH"]
+    extraKeys = m3u8ExtraKeys
+    multiKeys = m3u8MultiKeys
     count = 0
 
-    if "#EXTM3U" in lines[0]:
-        for n in lines:
-            if limit > 0 and limit < count: # Limit parsed line count
-                break
+    for n in inputM3U8.split("\n"):
+        if not n:
+            continue
 
-            if "#EXTM3U" not in n and n[0] == "#":
-                temp = n.split(":", 1) # Split at first colon
+        if count == 0 and "#EXTM3U" not in n:
+            break
 
-                if temp[0] in extraKeys: # Split again for extra options
-                    temp2 = [n.split("=") for n in re.split(r',(?=[A-Z])', temp[1].replace('"', ""))] # Split at comma followed by capitalized letter
+        if limit > 0 and limit < count: # Limit parsed line count
+            break
 
-                    if temp[0] in multiKeys: # Create list for multikeys
-                        tempDict = {}
+        count += 1
 
-                        for m in temp2:
-                            if len(m) > 1:
-                                tempDict[m[0]] = m[1]
+        if n[0] == "#":
+            if "#EXTM3U" in n:
+                continue
 
-                        if tempDict:
-                            if parsed.get(temp[0]):
-                               parsed[temp[0]].append(tempDict)
-                            else:
-                                parsed[temp[0]] = [tempDict]
-                    else:
-                        tempDict = {}
+            key, _, value = n.partition(":") # Split at first colon
 
-                        for m in temp2:
-                            if len(m) > 1:
-                                tempDict[m[0]] = m[1]
-                        if tempDict:
-                            parsed[temp[0]] = tempDict
-                else:
-                    if temp[0] in multiKeys:
-                        if parsed.get(temp[0]):
-                            parsed[temp[0]].append(temp[1])
-                        else:
-                            parsed[temp[0]] = [temp[1]]
-                    else:
-                        parsed[temp[0]] = temp[1]
-            elif not excludeURL and n[0:5] == "https":
-                if parsed.get("url"):
-                    parsed["url"].append(n)
-                else:
-                    parsed["url"] = [n]
+            if keys is not None and key not in keys: # Skip tags nobody reads
+                continue
 
-            count += 1
+            if key in extraKeys: # Parse attribute list
+                value = {k : q or v for k, q, v in m3u8Attribute.findall(value)}
+
+                if not value:
+                    continue
+
+            if key in multiKeys: # Create list for multikeys
+                if key in parsed:
+                    parsed[key].append(value)
+                else:
+                    parsed[key] = [value]
+            else:
+                parsed[key] = value
+        elif not excludeURL and n[0:5] == "https":
+            if "url" in parsed:
+                parsed["url"].append(n)
+            else:
+                parsed["url"] = [n]
 
     return parsed
 
-# Get stream data
-def getStreamInformation(clientID, loginID, quality="best", streamID=[], localTimeZone=""):
-    tokenURL = "https://api.twitch.tv/api/channels/{0}/access_token.json?client_id={1}&{2}".format(loginID, clientID, int(time.time()))
+# Returns access token request url for usher playlist
+def getAccessTokenURL(clientID, loginID):
+    return "https://api.twitch.tv/api/channels/{0}/access_token.json?client_id={1}&{2}".format(loginID, clientID, int(time.time()))
+
+# Returns [sig, token] from access token response
+def parseAccessToken(token):
     sig = ""
-    token = getAPIResponse(tokenURL, kraken=True, ignoreHeader=True)
-    # safeprint(token)
 
     try:
         if token and isinstance(token, dict):
@@ -466,181 +1525,285 @@ def getStreamInformation(clientID, loginID, quality="best", streamID=[], localTi
     except:
         pass
 
-    streamInfo = {}
-
-    if sig and token:
-        url = "https://usher.ttvnw.net/api/channel/hls/{0}.m3u8?allow_source=true&fast_bread=true&p={1}&sig={2}&token={3}".format(loginID, int(time.time()), sig, token)
+    return [sig, token] if sig and token else ["", ""]
 
-        stream = getAPIResponse(url, ignoreHeader=True, raw=True).decode("utf-8") # Memory leak?
-        # safeprint(stream)
+# Returns usher master playlist url
+def getUsherURL(loginID, sig, token):
+    return "https://usher.ttvnw.net/api/channel/hls/{0}.m3u8?allow_source=true&fast_bread=true&p={1}&sig={2}&token={3}".format(loginID, int(time.time()), sig, token)
 
-        if stream and "#EXTM3U" in stream:
-            serverTime = ""
-            streamTime = ""
-            broadcastID = 0
-            source = ""
-            sequence = ""
-            timeElapsed = ""
-            timeTotal = ""
-            streamList = parseM3U8(stream)
-
-            if streamList and isinstance(streamList, dict):
-                if streamList.get("#EXT-X-TWITCH-INFO"):
-                    serverTime = streamList.get("#EXT-X-TWITCH-INFO").get("SERVER-TIME")
-                    streamTime = streamList.get("#EXT-X-TWITCH-INFO").get("STREAM-TIME")
-                    broadcastID = int(streamList.get("#EXT-X-TWITCH-INFO").get("BROADCAST-ID", 0))
-
-                media = streamList.get("#EXT-X-MEDIA")
-                idx = -1
-
-                if media:
-                    for i in range(len(media)):
-                        if quality == "best":
-                            if "chunked" in media[i].get("GROUP-ID"):
-                                source = media[i].get("NAME").split(" ")[0]
-                                idx = i
-                                break
-                        else:
-                            if quality in media[i].get("NAME"):
-                                source = media[i].get("NAME").split(" ")[0]
-                                idx = i
-                                break
-
-                    if (streamID and broadcastID not in streamID) or (not streamID and idx > -1): # Skip further parsing if current stream is equal to previous stream
-                        streamURL = streamList.get("url")
-
-                        if streamURL and streamURL[idx]:
-                            playList = getAPIResponse(streamURL[idx], ignoreHeader=True, raw=True).decode("utf-8")
-
-                            if playList and "#EXTM3U" in playList:
-                                streamData = parseM3U8(playList, excludeURL=True, limit=7)
-
-                                if streamData and isinstance(streamData, dict):
-                                    sequence = streamData.get("#EXT-X-MEDIA-SEQUENCE")
-                                    timeElapsed = streamData.get("#EXT-X-TWITCH-ELAPSED-SECS")
-                                    timeTotal = streamData.get("#EXT-X-TWITCH-TOTAL-SECS")
-
-                    try:
-                        if serverTime and streamTime:
-                            streamInfo["newStream"] = False if streamID and broadcastID in streamID else True
-                            streamInfo["serverTime"] = float(serverTime)
-                            streamInfo["streamTime"] = float(streamTime)
-                            streamInfo["broadcastID"] = broadcastID
-                            streamInfo["source"] = source
-
-                            startTime = round(streamInfo["serverTime"] - streamInfo["streamTime"]) # Start time in nearest second
-                            currentTime = datetime.now().astimezone()
-                            startTimeDT = datetime.utcfromtimestamp(startTime).replace(tzinfo=ZoneInfo("Etc/UTC")) # Convert to UTC time object
-
-                            # Convert to spcecified timezone or local start time
-                            if localTimeZone:
-                                startTimeDT = startTimeDT.astimezone(ZoneInfo(localTimeZone))
-                            else:
-                                startTimeDT += currentTime.utcoffset()
-                                startTimeDT = startTimeDT.replace(tzinfo=None).astimezone()
-
-                            startTimeString = startTimeDT.strftime("[%y-%m-%d %I:%M:%S %p]") # Local start time in HH:MM:SS format
-
-                            # Get elapsed time
-                            elapsedTotal = currentTime - startTimeDT
-                            elapsedTotal = time.strftime('%H:%M:%S', time.gmtime(elapsedTotal.total_seconds())) # Format into HH:MM:SS
-
-                            streamInfo["startTime"] = startTime
-                            streamInfo["startTimeString"] = startTimeString
-                            streamInfo["elapsedTotal"] = elapsedTotal
-
-                        if sequence and timeElapsed and timeTotal:
-                            streamInfo["sequence"] = int(sequence)
-                            streamInfo["timeElapsed"] = float(timeElapsed)
-                            streamInfo["timeTotal"] = float(timeTotal)
-                            streamInfo["needPartial"] = streamInfo["sequence"] > 0 or (streamInfo["timeTotal"] - streamInfo["timeElapsed"]) > 20.0
-                    except:
-                        pass
+# Returns broadcast information and selected media from parsed master playlist
+def parseMasterPlaylist(streamList, quality="best"):
+    master = {}
 
-    # if streamInfo: safeprint(streamInfo)
-    return streamInfo
+    if streamList and isinstance(streamList, dict):
+        master = {"serverTime" : "", "streamTime" : "", "broadcastID" : 0, "source" : "", "idx" : -1, "url" : streamList.get("url")}
 
-class winNotify(threading.Thread):
-    def __init__(self,  *args, **kwargs):
-        super(winNotify, self).__init__(*args, **kwargs)
-        try:
-            self.displayName = kwargs.get("kwargs").get("displayName")
-            self.loginID = kwargs.get("kwargs").get("loginID")
-            self.startTime = kwargs.get("kwargs").get("startTime")
-            self.elapsed = kwargs.get("kwargs").get("elapsed")
-            self.title = kwargs.get("kwargs").get("title")
-            self.game = kwargs.get("kwargs").get("game")
-            self.oldName = kwargs.get("kwargs").get("oldName")
-            self.btype = kwargs.get("kwargs").get("btype")
-            self.oldID = kwargs.get("kwargs").get("oldID")
-            self.url = "https://www.twitch.tv/{}".format(self.loginID)
-        except:
-            return
+        if streamList.get("#EXT-X-TWITCH-INFO"):
+            master["serverTime"] = streamList.get("#EXT-X-TWITCH-INFO").get("SERVER-TIME")
+            master["streamTime"] = streamList.get("#EXT-X-TWITCH-INFO").get("STREAM-TIME")
+            master["broadcastID"] = int(streamList.get("#EXT-X-TWITCH-INFO").get("BROADCAST-ID", 0))
 
-        self.logo = Logo
-        self.daemon = True
-        self.changed = False
-        self.types = ["일반", "제휴", "파트너"]
-        self.arrow = u'\U0001F846'
+        media = streamList.get("#EXT-X-MEDIA")
 
-        self.createShellLink(appName, AUMID)
+        if not media:
+            return {}
 
-        if self.btype:
-            self.generateTemplate(
-                text1="{} ({})".format(self.displayName, self.loginID),
-                text2="[{}] {} [{}] 회원이 되었어요{}".format(self.types[int(self.btype[0])], self.arrow, self.types[int(self.btype[1])], ("..." if int(self.btype[0]) - int(self.btype[1]) > 0 else "!")),
-                attribution="{}".format("강등 되었다에요..ㅠㅠ" if int(self.btype[0]) - int(self.btype[1]) > 0 else "구독 '해줘'"))
-        else:
-            if self.oldName:
-                self.generateTemplate(
-                    text1="{} ({})".format(self.displayName, self.loginID),
-                    text2="[{}] {} [{}]".format(self.oldName, self.arrow, self.displayName),
-                    text3="닉네임이 변경 되었어요!".format(),
-                    attribution="{}".format("이건 굉장히 귀하네요"))
-            elif self.oldID:
-                self.generateTemplate(
-                    text1="{} ({})".format(self.displayName, self.loginID),
-                    text2="[{}] {} [{}]".format(self.oldID, self.arrow, self.loginID),
-                    text3="아이디가 변경 되었어요!".format(),
-                    attribution="{}".format("알림 목록 파일을 수정해 주세요"))
+        for i in range(len(media)):
+            if quality == "best":
+                if "chunked" in media[i].get("GROUP-ID"):
+                    master["source"] = media[i].get("NAME").split(" ")[0]
+                    master["idx"] = i
+                    break
             else:
-                self.generateTemplate(
-                    text1="{} ({}) ({} 경과)".format(self.displayName, self.loginID, self.elapsed),
-                    text2="시작: {}".format(self.startTime),
-                    text3="{}".format(self.title),
-                    attribution="{}".format(self.game))
+                if quality in media[i].get("NAME"):
+                    master["source"] = media[i].get("NAME").split(" ")[0]
+                    master["idx"] = i
+                    break
 
-        if self.changed: # Wait for update
-            self.changed = False
-            time.sleep(4)
+    return master
 
-        self.start()
+# Returns variant playlist url or empty string if current stream is equal to previous stream
+def getVariantURL(master, streamID=[]):
+    broadcastID = master.get("broadcastID")
 
-    def generateTemplate(self, template="ToastGeneric", text1="", text2="", text3="", attribution=""):
-        self.tString = """
-            <toast>
-            <visual>
-                <binding template="{template}">
-                    <image placement="appLogoOverride" src="{logo}" />
-                    <text>{text1}</text>
-                    <text>{text2}</text>
-                    <text>{text3}</text>
-                    <text placement="attribution">{attribution}</text>
-                </binding>
-            </visual>
-            <actions>
-                <action content="바로가기!" activationType="protocol" arguments="{url}" />
-                <action content="나중에..." activationType="system" arguments="dismiss" />
-            </actions>
-            <audio src="ms-winsoundevent:Notification.Looping.Alarm" />
-            </toast>
-        """
+    if (streamID and broadcastID not in streamID) or (not streamID and master.get("idx") > -1): # Skip further parsing if current stream is equal to previous stream
+        streamURL = master.get("url")
 
-        self.tString = self.tString.format(logo=self.logo, template=template, text1=escape(text1), text2=escape(text2), text3=escape(text3), attribution=escape(attribution), url=self.url)
+        if streamURL and streamURL[master.get("idx")]:
+            return streamURL[master.get("idx")]
 
-    def createShellLink(self, appName, AUMID):
-        import pythoncom
-        from win32com.shell import shell, shellcon
+    return ""
+
+# Build stream information from master playlist and variant playlist data
+def buildStreamInfo(master, streamData, streamID=[], localTimeZone=""):
+    streamInfo = {}
+
+    if not master:
+        return streamInfo
+
+    serverTime = master.get("serverTime")
+    streamTime = master.get("streamTime")
+    broadcastID = master.get("broadcastID")
+    sequence = ""
+    timeElapsed = ""
+    timeTotal = ""
+
+    if streamData and isinstance(streamData, dict):
+        sequence = streamData.get("#EXT-X-MEDIA-SEQUENCE")
+        timeElapsed = streamData.get("#EXT-X-TWITCH-ELAPSED-SECS")
+        timeTotal = streamData.get("#EXT-X-TWITCH-TOTAL-SECS")
+
+    try:
+        if serverTime and streamTime:
+            streamInfo["newStream"] = False if streamID and broadcastID in streamID else True
+            streamInfo["serverTime"] = float(serverTime)
+            streamInfo["streamTime"] = float(streamTime)
+            streamInfo["broadcastID"] = broadcastID
+            streamInfo["source"] = master.get("source")
+
+            startTime = round(streamInfo["serverTime"] - streamInfo["streamTime"]) # Start time in nearest second
+            currentTime = datetime.now().astimezone()
+            startTimeDT = datetime.utcfromtimestamp(startTime).replace(tzinfo=ZoneInfo("Etc/UTC")) # Convert to UTC time object
+
+            # Convert to spcecified timezone or local start time
+            if localTimeZone:
+                startTimeDT = startTimeDT.astimezone(ZoneInfo(localTimeZone))
+            else:
+                startTimeDT += currentTime.utcoffset()
+                startTimeDT = startTimeDT.replace(tzinfo=None).astimezone()
+
+            startTimeString = startTimeDT.strftime("[%y-%m-%d %I:%M:%S %p]") # Local start time in HH:MM:SS format
+
+            # Get elapsed time
+            elapsedTotal = currentTime - startTimeDT
+            elapsedTotal = time.strftime('%H:%M:%S', time.gmtime(elapsedTotal.total_seconds())) # Format into HH:MM:SS
+
+            streamInfo["startTime"] = startTime
+            streamInfo["startTimeString"] = startTimeString
+            streamInfo["elapsedTotal"] = elapsedTotal
+
+        if sequence and timeElapsed and timeTotal:
+            streamInfo["sequence"] = int(sequence)
+            streamInfo["timeElapsed"] = float(timeElapsed)
+            streamInfo["timeTotal"] = float(timeTotal)
+            streamInfo["needPartial"] = streamInfo["sequence"] > 0 or (streamInfo["timeTotal"] - streamInfo["timeElapsed"]) > 20.0
+    except:
+        pass
+
+    return streamInfo
+
+masterKeys = {"#EXT-X-TWITCH-INFO", "#EXT-X-MEDIA"} # Tags read by parseMasterPlaylist
+variantKeys = {"#EXT-X-MEDIA-SEQUENCE", "#EXT-X-TWITCH-ELAPSED-SECS", "#EXT-X-TWITCH-TOTAL-SECS"} # Tags read by buildStreamInfo
+
+# Returns stop function for master playlist reader, stops after url of selected media
+def getMasterStop(quality="best"):
+    state = {"info" : False, "media" : False}
+
+    def stop(line):
+        if line.startswith("#EXT-X-TWITCH-INFO"):
+            state["info"] = True
+        elif line.startswith("#EXT-X-MEDIA:") and not state["media"]:
+            if quality == "best":
+                match = re.search(r'GROUP-ID="([^"]*)"', line)
+                state["media"] = bool(match and "chunked" in match.group(1))
+            else:
+                match = re.search(r'NAME="([^"]*)"', line)
+                state["media"] = bool(match and quality in match.group(1))
+        elif state["media"] and line.startswith("https"):
+            return state["info"]
+
+        return False
+
+    return stop
+
+# Returns stop function for variant playlist reader, stops once header tags are read
+def getVariantStop():
+    found = set()
+
+    def stop(line):
+        key = line.split(":", 1)[0]
+
+        if key in variantKeys:
+            found.add(key)
+
+        return len(found) == len(variantKeys) or key == "#EXTINF" # Header ends at first segment
+
+    return stop
+
+# Returns playlist text read line by line until stop(line) is True, without downloading the rest
+def getPlaylistResponse(url, stop=None, priority=RateLimiter.PROBE, drainLimit=8192):
+    lines = []
+
+    try:
+        rateLimiter.acquire(url, priority)
+
+        with httpPool.get(url, timeout=10, stream=True) as res:
+            rateLimiter.update(url, res.status_code, res.headers)
+
+            if res.status_code != 200:
+                return ""
+
+            for line in res.iter_lines(chunk_size=1024):
+                line = line.decode("utf-8")
+                lines.append(line)
+
+                if stop and stop(line):
+                    remaining = res.raw.length_remaining
+
+                    if remaining is not None and remaining <= drainLimit: # Cheaper to read the rest than to reconnect
+                        res.raw.drain_conn()
+
+                    break
+    except:
+        pass
+
+    return "\n".join(lines)
+
+# Get stream data
+def getStreamInformation(clientID, loginID, quality="best", streamID=[], localTimeZone=""):
+    token = getAPIResponse(getAccessTokenURL(clientID, loginID), kraken=True, ignoreHeader=True, priority=RateLimiter.PROBE)
+    # safeprint(token)
+    sig, token = parseAccessToken(token)
+    streamInfo = {}
+
+    if sig and token:
+        stream = getPlaylistResponse(getUsherURL(loginID, sig, token), getMasterStop(quality))
+        # safeprint(stream)
+
+        if stream and "#EXTM3U" in stream:
+            streamData = {}
+            master = parseMasterPlaylist(parseM3U8(stream, keys=masterKeys), quality)
+
+            if master:
+                variantURL = getVariantURL(master, streamID)
+
+                if variantURL:
+                    playList = getPlaylistResponse(variantURL, getVariantStop())
+
+                    if playList and "#EXTM3U" in playList:
+                        streamData = parseM3U8(playList, excludeURL=True, limit=7, keys=variantKeys)
+
+                streamInfo = buildStreamInfo(master, streamData, streamID, localTimeZone)
+
+    # if streamInfo: safeprint(streamInfo)
+    return streamInfo
+
+# Long-lived Windows toast notification worker, checks shortcut and AUMID once on start
+class NotifyWorker(threading.Thread):
+    def __init__(self):
+        super(NotifyWorker, self).__init__(name="NotifyWorker", daemon=True)
+        self.queue = queue.Queue()
+        self.logo = Logo
+        self.types = ["일반", "제휴", "파트너"]
+        self.arrow = u'\U0001F846'
+        self.notifier = None
+        self.start()
+
+    # Queue toast with displayName, loginID and startTime, elapsed, title, game or oldName, btype, oldID
+    def notify(self, **kwargs):
+        if kwargs.get("displayName"):
+            self.queue.put(kwargs)
+
+    def stop(self):
+        self.queue.put(None)
+
+    def generateTemplate(self, url, template="ToastGeneric", text1="", text2="", text3="", attribution=""):
+        tString = """
+            <toast>
+            <visual>
+                <binding template="{template}">
+                    <image placement="appLogoOverride" src="{logo}" />
+                    <text>{text1}</text>
+                    <text>{text2}</text>
+                    <text>{text3}</text>
+                    <text placement="attribution">{attribution}</text>
+                </binding>
+            </visual>
+            <actions>
+                <action content="바로가기!" activationType="protocol" arguments="{url}" />
+                <action content="나중에..." activationType="system" arguments="dismiss" />
+            </actions>
+            <audio src="ms-winsoundevent:Notification.Looping.Alarm" />
+            </toast>
+        """
+
+        return tString.format(logo=self.logo, template=template, text1=escape(text1), text2=escape(text2), text3=escape(text3), attribution=escape(attribution), url=url)
+
+    # Returns toast xml string of queued notification
+    def buildTemplate(self, info):
+        displayName = info.get("displayName")
+        loginID = info.get("loginID")
+        btype = info.get("btype")
+        url = "https://www.twitch.tv/{}".format(loginID)
+
+        if btype:
+            return self.generateTemplate(url,
+                text1="{} ({})".format(displayName, loginID),
+                text2="[{}] {} [{}] 회원이 되었어요{}".format(self.types[int(btype[0])], self.arrow, self.types[int(btype[1])], ("..." if int(btype[0]) - int(btype[1]) > 0 else "!")),
+                attribution="{}".format("강등 되었다에요..ㅠㅠ" if int(btype[0]) - int(btype[1]) > 0 else "구독 '해줘'"))
+        elif info.get("oldName"):
+            return self.generateTemplate(url,
+                text1="{} ({})".format(displayName, loginID),
+                text2="[{}] {} [{}]".format(info.get("oldName"), self.arrow, displayName),
+                text3="닉네임이 변경 되었어요!".format(),
+                attribution="{}".format("이건 굉장히 귀하네요"))
+        elif info.get("oldID"):
+            return self.generateTemplate(url,
+                text1="{} ({})".format(displayName, loginID),
+                text2="[{}] {} [{}]".format(info.get("oldID"), self.arrow, loginID),
+                text3="아이디가 변경 되었어요!".format(),
+                attribution="{}".format("알림 목록 파일을 수정해 주세요"))
+
+        return self.generateTemplate(url,
+            text1="{} ({}) ({} 경과)".format(displayName, loginID, info.get("elapsed")),
+            text2="시작: {}".format(info.get("startTime")),
+            text3="{}".format(info.get("title")),
+            attribution="{}".format(info.get("game")))
+
+    # Returns True if AUMID of shortcut was updated
+    def createShellLink(self, appName, AUMID):
+        import pythoncom
+        from win32com.shell import shell, shellcon
         from win32com.propsys import propsys, pscon
         import win32timezone
 
@@ -673,153 +1836,1387 @@ class winNotify(threading.Thread):
         if (currentID != AUMID):
             store.SetValue(pscon.PKEY_AppUserModel_ID, propsys.PROPVARIANTType(AUMID, pythoncom.VT_LPWSTR))
             store.Commit()
-            self.changed = True
+            return True
+
+        return False
+
+    def run(self):
+        try:
+            import pythoncom
+            pythoncom.CoInitialize() # COM is initialized per thread
+
+            if self.createShellLink(appName, AUMID): # Wait for update
+                time.sleep(4)
+
+            import winrt.windows.data.xml.dom as dom
+            from winrt.windows.ui.notifications import ToastNotificationManager, ToastNotification
+
+            # Create notifier once
+            self.notifier = ToastNotificationManager.create_toast_notifier(AUMID)
+        except Exception as e:
+            safeprint("Notification Error: {}".format(e))
+
+        while True:
+            info = self.queue.get()
+
+            if info is None:
+                break
+
+            if not self.notifier: # Drop toasts when notifier is unavailable
+                metrics.inc("tla_deliveries_total", channel="windows", result="failed")
+                continue
+
+            try:
+                # Convert to XmlDocument
+                xDoc = dom.XmlDocument()
+                xDoc.load_xml(self.buildTemplate(info))
+                self.notifier.show(ToastNotification(xDoc))
+                metrics.inc("tla_deliveries_total", channel="windows", result="ok")
+            except Exception as e:
+                safeprint("Notification Error: {}".format(e))
+                metrics.inc("tla_deliveries_total", channel="windows", result="failed")
+
+# Stands in for NotifyWorker when headless, alerts are sent by Telegram only
+class NullNotifier:
+    def notify(self, **kwargs):
+        pass
+
+# userData dictionary that keeps userID to loginID reverse index in sync
+class UserDataMap(dict): # loginID: [userID, displayName, broadcasterType, live, time, [streamID]]
+    def __init__(self, *args, **kwargs):
+        super(UserDataMap, self).__init__()
+        self.index = {} # userID: loginID
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        self.unindex(key)
+        super(UserDataMap, self).__setitem__(key, value)
+
+        if value and value[0]:
+            self.index[value[0]] = key
+
+    def __delitem__(self, key):
+        self.unindex(key)
+        super(UserDataMap, self).__delitem__(key)
+
+    def pop(self, key, *default):
+        self.unindex(key)
+        return super(UserDataMap, self).pop(key, *default)
+
+    def popitem(self):
+        key, value = super(UserDataMap, self).popitem()
+
+        if self.index.get(value[0]) == key:
+            self.index.pop(value[0], None)
+
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def clear(self):
+        self.index.clear()
+        super(UserDataMap, self).clear()
+
+    # Remove userID of key unless userID already points to renamed loginID
+    def unindex(self, key):
+        value = self.get(key)
+
+        if value and self.index.get(value[0]) == key:
+            self.index.pop(value[0], None)
+
+    # Returns loginID of given userID
+    def findLoginID(self, userID):
+        return self.index.get(userID)
+
+# Learns usual go-live time of day of each channel and polls less often outside of it
+class PollSchedule:
+    def __init__(self, fileName, window=60, budget=0, coldFactor=6, minHistory=3):
+        self.fileName = fileName
+        self.window = window * 60 # Seconds around usual start time to poll at full rate
+        self.budget = budget # Requests per minute, 0 for unlimited
+        self.coldFactor = coldFactor
+        self.minHistory = minHistory
+        self.history = {} # loginID: [start timestamps]
+        self.lastLive = {} # loginID: timestamp
+        self.intervals = {} # loginID: seconds
+        self.nextDue = {} # loginID: timestamp
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            if isfile(self.fileName):
+                data = json.loads(readFile(self.fileName, whole=True) or "{}")
+
+                if isinstance(data, dict):
+                    self.history = data
+        except ValueError:
+            pass
+
+    # Write history to file if changed
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+
+            data = json.dumps(self.history)
+            self.dirty = False
+
+        outputFile(self.fileName, data, mode="w")
+
+    # Record stream start from startTime or Helix started_at
+    def record(self, loginID, startTime):
+        if not startTime:
+            return
+
+        with self.lock:
+            starts = self.history.setdefault(loginID, [])
+
+            if all(abs(startTime - n) > 600 for n in starts): # Same stream seen by probe and Helix
+                starts.append(int(startTime))
+                del starts[:-30] # Keep last 30 starts
+                self.dirty = True
+
+        self.setLive(loginID)
+
+    def setLive(self, loginID, now=None):
+        self.lastLive[loginID] = now or time.time()
+
+    # Returns True if channel is near its usual start time, was live recently or has too little history
+    def isHot(self, loginID, now):
+        if now - self.lastLive.get(loginID, 0) < self.window * 2: # Restarts and raids right after stream
+            return True
+
+        starts = self.history.get(loginID)
+
+        if not starts or len(starts) < self.minHistory:
+            return True
+
+        for n in starts:
+            diff = (now - n) % 86400 # Seconds after usual start time of day
+
+            if diff <= self.window or diff >= 86400 - self.window:
+                return True
+
+        return False
+
+    # Plan interval of every channel within request budget, priority probes cost 2 requests and normal checks 1/99 request
+    def plan(self, priority, normal, prioritySleep, normalSleep):
+        now = time.time()
+        intervals = {}
+        cost = [0.0, 0.0] # [hot, cold] requests per minute
+
+        for loginIDs, sleep, weight in [[priority, prioritySleep, 2.0], [normal, normalSleep, 1 / 99]]:
+            for k in loginIDs:
+                hot = self.isHot(k, now)
+                intervals[k] = [sleep if hot else sleep * self.coldFactor, weight, hot]
+                cost[0 if hot else 1] += weight * 60 / intervals[k][0]
+
+        factor = [1.0, 1.0]
+
+        if self.budget and sum(cost) > self.budget:
+            if self.budget > cost[0] and cost[1]: # Stretch cold channels first
+                factor[1] = cost[1] / (self.budget - cost[0])
+            else:
+                factor = [sum(cost) / self.budget] * 2
+
+        self.intervals = dict((k, v[0] * factor[0 if v[2] else 1]) for k, v in intervals.items())
+
+    # Returns planned interval of loginID
+    def interval(self, loginID, default):
+        return self.intervals.get(loginID, default)
+
+    # Returns loginIDs due for polling and sets their next due time
+    def due(self, loginIDs, default):
+        now = time.time()
+        dueList = []
+
+        for k in loginIDs:
+            if self.nextDue.get(k, 0) <= now + 1:
+                dueList.append(k)
+                self.nextDue[k] = now + self.interval(k, default)
+
+        return dueList
+
+# Resolved user records kept on disk to skip lookups on start, revalidated by age
+class UserCache:
+    def __init__(self, fileName, maxAge=24, batch=100):
+        self.fileName = fileName
+        self.maxAge = maxAge * 3600 # Seconds before entry needs revalidation
+        self.batch = batch # Entries revalidated per list update
+        self.users = {} # loginID: [userID, displayName, broadcasterType, verified]
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            if isfile(self.fileName):
+                data = json.loads(readFile(self.fileName, whole=True) or "{}")
+
+                if isinstance(data, dict):
+                    self.users = dict((k, v) for k, v in data.items() if isinstance(v, list) and len(v) == 4)
+        except ValueError:
+            pass
+
+    # Write cache to file if changed
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+
+            data = json.dumps(self.users, ensure_ascii=False)
+            self.dirty = False
+
+        outputFile(self.fileName, data, mode="w")
+
+    # Returns userData value of loginID or None if not cached
+    def get(self, loginID):
+        v = self.users.get(loginID)
+
+        return [v[0], v[1], v[2], False, None, []] if v else None
+
+    # Store resolved user, verified time is spread so entries do not expire together
+    def put(self, loginID, userID, displayName, broadcasterType):
+        with self.lock:
+            self.users[loginID] = [userID, displayName, broadcasterType, int(time.time() - random.random() * self.maxAge * 0.2)]
+            self.dirty = True
+
+    def remove(self, loginID):
+        with self.lock:
+            if self.users.pop(loginID, None):
+                self.dirty = True
+
+    # Returns oldest loginIDs past maxAge, at most batch
+    def stale(self, loginIDs):
+        expire = time.time() - self.maxAge
+        stale = [k for k in loginIDs if k in self.users and self.users[k][3] < expire]
+
+        return heapq.nsmallest(self.batch, stale, key=lambda k: self.users[k][3])
+
+    # Drop users no longer in any list
+    def prune(self, loginIDs):
+        with self.lock:
+            for k in [k for k in self.users if k not in loginIDs]:
+                del self.users[k]
+                self.dirty = True
+
+# gameID to gameName cache with size cap, LRU and TTL eviction, misses are looked up together
+class GameCache:
+    def __init__(self, fileName, maxSize=1000, ttl=168):
+        self.fileName = fileName
+        self.maxSize = maxSize
+        self.ttl = ttl * 3600 # Seconds before name is looked up again
+        self.games = OrderedDict() # gameID: [gameName, time], least recently used first
+        self.pending = {} # gameID: Event of lookup in flight
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            if isfile(self.fileName):
+                data = json.loads(readFile(self.fileName, whole=True) or "{}")
+
+                if isinstance(data, dict):
+                    for k, v in sorted(data.items(), key=lambda n: n[1][1]): # Oldest first
+                        self.games[k] = v
+
+                    self.evict()
+        except (ValueError, IndexError, TypeError):
+            pass
+
+    # Write cache to file if changed
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+
+            data = json.dumps(self.games, ensure_ascii=False)
+            self.dirty = False
+
+        outputFile(self.fileName, data, mode="w")
+
+    # Drop least recently used games over maxSize
+    def evict(self):
+        while len(self.games) > self.maxSize:
+            self.games.popitem(last=False)
+
+    # Returns gameName and marks gameID as recently used
+    def get(self, gameID, default=None):
+        with self.lock:
+            v = self.games.get(gameID)
+
+            if not v:
+                return default
+
+            self.games.move_to_end(gameID)
+
+            return v[0]
+
+    def put(self, gameID, gameName):
+        if not gameID:
+            return
+
+        with self.lock:
+            v = self.games.get(gameID)
+
+            if v and v[0] == gameName and time.time() - v[1] < self.ttl / 2: # Skip rewrite of fresh entry
+                self.games.move_to_end(gameID)
+                return
+
+            self.games[gameID] = [gameName, int(time.time())]
+            self.games.move_to_end(gameID)
+            self.evict()
+            self.dirty = True
+
+    # Look up missing or expired gameIDs with one fetch call, waits for lookups already in flight
+    def resolve(self, gameIDs, fetch, timeout=10):
+        now = time.time()
+        missing = []
+        waiting = []
+
+        with self.lock:
+            for k in set(gameIDs):
+                if not k:
+                    continue
+
+                v = self.games.get(k)
+
+                if v and now - v[1] < self.ttl:
+                    self.hits += 1
+                elif k in self.pending:
+                    waiting.append(self.pending[k])
+                else:
+                    self.misses += 1
+                    self.pending[k] = threading.Event()
+                    missing.append(k)
+
+        if missing:
+            try:
+                for k, v in fetch(missing).items():
+                    self.put(k, v)
+            except Exception as e:
+                safeprint("{} Game Error: {}".format(timeStamp(), e))
+            finally:
+                with self.lock:
+                    for k in missing:
+                        self.pending.pop(k).set()
+
+        for event in waiting:
+            event.wait(timeout)
+
+    def stats(self):
+        with self.lock:
+            return {"size" : len(self.games), "hits" : self.hits, "misses" : self.misses, "pending" : len(self.pending)}
+
+# Sent alerts by loginID and broadcastID/streamID kept across restarts, saved once per cycle instead of per alert
+class AlertStore:
+    def __init__(self, fileName="", maxSize=5000):
+        self.fileName = fileName
+        self.maxSize = max(0, maxSize) # 0 keeps nothing
+        self.alerts = OrderedDict() # "loginID_streamID": time, oldest first
+        self.stopTime = 0 # Last save of previous run
+        self.savedTime = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            if self.fileName and isfile(self.fileName):
+                data = json.loads(readFile(self.fileName, whole=True) or "{}")
+
+                if isinstance(data, dict) and isinstance(data.get("alerts"), dict):
+                    self.stopTime = data.get("saved", 0)
+
+                    for k, v in sorted(data["alerts"].items(), key=lambda n: n[1]):
+                        self.alerts[k] = v
+
+                    while len(self.alerts) > self.maxSize:
+                        self.alerts.popitem(last=False)
+        except (ValueError, TypeError):
+            pass
+
+    # Write store if changed, or every 10 minutes to keep stop time close
+    def save(self):
+        now = time.time()
+
+        with self.lock:
+            if not self.fileName or (not self.dirty and now - self.savedTime < 600):
+                return
+
+            data = json.dumps({"saved" : int(now), "alerts" : self.alerts})
+            self.dirty = False
+            self.savedTime = now
+
+        outputFile(self.fileName, data, mode="w")
+
+    # Returns True and records stream if it was not alerted or marked before
+    def claim(self, loginID, streamID):
+        if not streamID or not self.maxSize:
+            return True
+
+        key = "{}_{}".format(loginID, streamID)
+
+        with self.lock:
+            if key in self.alerts:
+                return False
+
+            self.alerts[key] = int(time.time())
+            self.dirty = True
+
+            if len(self.alerts) > self.maxSize:
+                self.alerts.popitem(last=False)
+
+        return True
+
+    # Returns True if stream started while previous run was stopped, newalertsonly does not hide it
+    def startedAfterStop(self, startTime):
+        return bool(self.stopTime and startTime and startTime > self.stopTime)
+
+# Single instance stand-in, owns every channel and drops alerts already in alertStore
+class LocalCoordinator:
+    shared = False
+
+    # Renew ownership, returns True if owned shards changed
+    def update(self, leaseTime=None):
+        return False
+
+    def owns(self, loginID):
+        return True
+
+    # Returns True if this instance should send alert of streamID
+    def claimAlert(self, loginID, streamID):
+        return alertStore.claim(loginID, streamID)
+
+    def close(self):
+        pass
+
+# Splits alert lists between instances sharing one SQLite file
+# Channels hash to fixed shards, each live instance leases its fair share and takes over expired leases of dead peers
+class SQLiteCoordinator(LocalCoordinator):
+    shared = True
+
+    def __init__(self, fileName, instanceID="", shards=64, leaseTime=90, keepAlerts=7):
+        self.fileName = fileName
+        self.instanceID = instanceID or "{}-{}".format(socket.gethostname(), os.getpid())
+        self.shards = max(1, shards)
+        self.leaseTime = leaseTime
+        self.keepAlerts = keepAlerts * 86400
+        self.owned = set()
+        self.shardOf = {} # loginID: shard
+        self.lock = threading.Lock()
+        self.lastPrune = 0
+        self.db = sqlite3.connect(fileName, timeout=10, isolation_level=None, check_same_thread=False)
+
+        with self.lock:
+            self.db.execute("CREATE TABLE IF NOT EXISTS leases (shard INTEGER PRIMARY KEY, owner TEXT, expires REAL)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS instances (id TEXT PRIMARY KEY, heartbeat REAL)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS alerts (key TEXT PRIMARY KEY, owner TEXT, time REAL)")
+            self.db.executemany("INSERT OR IGNORE INTO leases VALUES (?, '', 0)", [(i,) for i in range(self.shards)])
+
+    def update(self, leaseTime=None):
+        leaseTime = max(self.leaseTime, leaseTime or 0)
+        now = time.time()
+
+        try:
+            with self.lock:
+                self.db.execute("BEGIN IMMEDIATE")
+
+                try:
+                    self.db.execute("INSERT OR REPLACE INTO instances VALUES (?, ?)", (self.instanceID, now))
+                    self.db.execute("DELETE FROM instances WHERE heartbeat < ?", (now - leaseTime,))
+                    peers = self.db.execute("SELECT COUNT(*) FROM instances").fetchone()[0]
+                    fairShare = -(-self.shards // max(1, peers))
+                    self.db.execute("UPDATE leases SET expires = ? WHERE owner = ?", (now + leaseTime, self.instanceID))
+                    owned = [n[0] for n in self.db.execute("SELECT shard FROM leases WHERE owner = ? ORDER BY shard", (self.instanceID,))]
+
+                    if len(owned) > fairShare: # Hand extra shards to new peers
+                        self.db.executemany("UPDATE leases SET owner = '', expires = 0 WHERE shard = ?", [(n,) for n in owned[fairShare:]])
+                        owned = owned[:fairShare]
+                    elif len(owned) < fairShare: # Claim free shards and shards of dead peers
+                        free = [n[0] for n in self.db.execute("SELECT shard FROM leases WHERE expires < ? ORDER BY shard LIMIT ?", (now, fairShare - len(owned)))]
+                        self.db.executemany("UPDATE leases SET owner = ?, expires = ? WHERE shard = ?", [(self.instanceID, now + leaseTime, n) for n in free])
+                        owned += free
+
+                    if now - self.lastPrune > 3600:
+                        self.db.execute("DELETE FROM alerts WHERE time < ?", (now - self.keepAlerts,))
+                        self.lastPrune = now
+
+                    self.db.execute("COMMIT")
+                except Exception:
+                    self.db.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            safeprint("{} Coordination Error: {}".format(timeStamp(), e), phase="coordination")
+            return False
+
+        owned = set(owned)
+        changed = owned != self.owned
+        self.owned = owned
+
+        if changed:
+            safeprint("{} [{}] 전체 {} 개 중 {} 개의 샤드를 확인한다에요 [인스턴스 {}]".format(timeStamp(), self.instanceID, self.shards, len(owned), peers), phase="coordination", shards=sorted(owned))
+
+        return changed
+
+    def owns(self, loginID):
+        shard = self.shardOf.get(loginID)
+
+        if shard is None:
+            shard = self.shardOf[loginID] = HashRing.hash(loginID) % self.shards
+
+        return shard in self.owned
+
+    def claimAlert(self, loginID, streamID):
+        if not streamID:
+            return True
+
+        if not alertStore.claim(loginID, streamID): # Sent by this instance, also before restart
+            return False
+
+        try:
+            with self.lock:
+                return self.db.execute("INSERT OR IGNORE INTO alerts VALUES (?, ?, ?)", ("{}_{}".format(loginID, streamID), self.instanceID, time.time())).rowcount == 1
+        except sqlite3.Error as e: # Prefer duplicate alert over missed alert
+            safeprint("{} Coordination Error: {}".format(timeStamp(), e), phase="coordination")
+            return True
+
+    # Release leases so peers take over without waiting for expiry
+    def close(self):
+        try:
+            with self.lock:
+                self.db.execute("UPDATE leases SET owner = '', expires = 0 WHERE owner = ?", (self.instanceID,))
+                self.db.execute("DELETE FROM instances WHERE id = ?", (self.instanceID,))
+                self.db.close()
+        except sqlite3.Error:
+            pass
+
+# Detection and alert state of a single priority channel
+class PriorityChannel:
+    def __init__(self, loginID, userID=None, displayName=None, sleep=None, newAlertsOnly=None, winnotify=None, TWclientID=None, botToken=None, TGclientID=None, localTimeZone=None, schedule=None, deliver=None):
+        self.loginID = loginID
+        self.userID = userID
+        self.displayName = displayName
+        self.sleep = sleep
+        self.newAlertsOnly = newAlertsOnly
+        self.notification = winnotify
+        self.TWclientID = TWclientID
+        self.TWclientIDPriv = ""
+        self.botToken = botToken
+        self.TGclientID = TGclientID
+        self.localTimeZone = localTimeZone
+        self.schedule = schedule
+        self.deliver = deliver # deliver(loginID, streamInfo) replaces buildMessage in worker processes
+        self.broadcastID = []
+        self.lock = threading.Lock() # Probe and EventSub may detect the same broadcast
+
+        if not self.sleep or self.sleep < 3: # Set default sleep value if not specified or set too low
+            self.sleep = 10
+
+    # Returns True if streamInfo is a new stream to alert, None if it needs to be probed again shortly
+    def detectNewStream(self, streamInfo):
+        alert = False
+
+        with self.lock:
+            if streamInfo and isinstance(streamInfo, dict):
+                if streamInfo.get("newStream") and streamInfo.get("broadcastID") not in self.broadcastID:
+                    if not streamInfo.get("startTimeString"): # Rare but sometimes time string isn't extracted
+                        return None
+
+                    if len(self.broadcastID) > 4: # Keep last 5 broadcastIDs
+                        self.broadcastID.pop(0)
+
+                    self.broadcastID.append(streamInfo.get("broadcastID"))
+                    alert = not self.newAlertsOnly or alertStore.startedAfterStop(streamInfo.get("startTime"))
+
+                    if not alert: # Keep other instances from alerting stream live before start
+                        coordinator.claimAlert(self.loginID, streamInfo.get("broadcastID"))
+
+                    if self.schedule:
+                        self.schedule.record(self.loginID, streamInfo.get("startTime"))
+                elif streamInfo.get("broadcastID") and self.schedule:
+                    self.schedule.setLive(self.loginID)
+
+            if self.newAlertsOnly:
+                self.newAlertsOnly = False
+
+        return alert
+
+    # Alert new stream or hand it to coordinator process
+    def alert(self, streamInfo):
+        if self.deliver:
+            self.deliver(self.loginID, streamInfo)
+        else:
+            self.buildMessage(streamInfo)
+
+    # Returns seconds until next probe
+    def getSleep(self):
+        return self.schedule.interval(self.loginID, self.sleep) if self.schedule else self.sleep
+
+    # Build and send message
+    def buildMessage(self, streamInfo):
+        # Skip messaging on first run if newAlertsOnly is set to true
+        if self.newAlertsOnly:
+            self.newAlertsOnly = False
+            return
+
+        if streamInfo and not coordinator.claimAlert(self.loginID, streamInfo.get("broadcastID")): # Sent by another instance
+            return
+
+        if streamInfo:
+            title = ""
+            game = ""
+            category = ""
+            volt = u'\U000026A1'
+            ts = streamInfo.get("startTime", "")
+            hashStr1 = "{}_{}_{}".format(self.loginID, streamInfo.get("broadcastID", ""), ts)
+            hashStr2 = "{}_{}_{}".format(self.loginID, streamInfo.get("broadcastID", ""), int(ts) + 1 if ts else "") 
+            hashSha1 = []
+            hashSha1.append(hashlib.sha1(hashStr1.encode()).hexdigest()[:20])
+            hashSha1.append(hashlib.sha1(hashStr2.encode()).hexdigest()[:20])
+
+            # Grab title and game
+            url = "https://api.twitch.tv/helix/channels?broadcaster_id={0}".format(self.userID)
+            info = getAPIResponse(url, clientID=self.TWclientID, token=OAuthToken, priority=RateLimiter.ALERT)
+
+            if info and isinstance(info, dict):
+                for n in info.get("data"):
+                    title = n.get("title", "")
+                    title = title.strip()
+                    game = n.get("game_name", "")
+
+            if game:
+                category = "<a href='https://www.twitch.tv/directory/game/{gameHTML}'>{game}</a>".format(gameHTML=quote(game, safe=''), game=escape(game))
+            else:
+                game = "-"
+                category = "-"
+
+            messagePrint = "{} ({}) {}\n".format(self.displayName, self.loginID, volt) + \
+                            "시작: {} ({} 경과)\n".format(streamInfo.get("startTimeString", ""), streamInfo.get("elapsedTotal", "")) + \
+                            "방제: '{}'\n".format(title) + \
+                            "범주: '{}'\n".format(game) + \
+                            "\n{}_{}\n{}_{}".format(hashSha1[0], hashStr1, hashSha1[1], hashStr2)
+
+            message = "<a href='https://www.twitch.tv/{loginID}'>{displayName} ({loginID})</a> {volt}\n".format(loginID=self.loginID, displayName=self.displayName, volt=volt) + \
+                        "시작: {} (<i>{}</i> 경과)\n".format(streamInfo.get("startTimeString", ""), streamInfo.get("elapsedTotal", "")) + \
+                        "방제: <b>{}</b>\n".format(escape(title)) + \
+                        "범주: {}".format(category)
+
+            safeprint("{0}\n{1} {2}\n{3}".format("-"*50, timeStamp(), messagePrint, "-"*50), phase="alert", list="priority", loginID=self.loginID, broadcastID=streamInfo.get("broadcastID"), latency=round(time.time() - ts, 3) if ts else None)
+            metrics.alert("priority", ts)
+
+            if self.notification:
+                notifyWorker.notify(displayName=self.displayName, loginID=self.loginID, startTime=streamInfo.get("startTimeString", ""), elapsed=streamInfo.get("elapsedTotal", ""), title=title, game=game)
+
+            telegramQueue.sendMessage(self.botToken, self.TGclientID, message)
+
+class ScheduledChannel(PriorityChannel):
+    def __init__(self, loginID, **kwargs):
+        PriorityChannel.__init__(self, loginID, **kwargs)
+        self.task = ScheduledTask(self.probe, loginID)
+        scheduler.push(self.task, 0) # After self.task is set, probe checks it before alerting
+
+    # Probe once, returns seconds until next probe
+    def probe(self):
+        try:
+            streamInfo = getStreamInformation(self.TWclientIDPriv, self.loginID, streamID=self.broadcastID, localTimeZone=self.localTimeZone)
+            newStream = self.detectNewStream(streamInfo)
+
+            if newStream is None: # Rare but sometimes time string isn't extracted
+                return 3
+            elif newStream and not self.task.cancelled:
+                self.alert(streamInfo)
+        except:
+            pass
+
+        return self.getSleep()
+
+    def stop(self):
+        scheduler.cancel(self.task)
+
+# Probes every priority channel as a scheduler task on the probe pool
+class ScheduledPriorityEngine:
+    def __init__(self):
+        self.channels = {} # loginID: ScheduledChannel
+
+    # Returns loginIDs of scheduled channels
+    def active(self):
+        return list(self.channels)
+
+    def add(self, loginID, **kwargs):
+        self.remove(loginID)
+        self.channels[loginID] = ScheduledChannel(loginID, **kwargs)
+
+    # Returns scheduled PriorityChannel of loginID
+    def get(self, loginID):
+        return self.channels.get(loginID)
+
+    def remove(self, loginID):
+        channel = self.channels.pop(loginID, None)
+
+        if channel:
+            channel.stop()
+
+    def stop(self):
+        for loginID in list(self.channels):
+            self.remove(loginID)
+
+# Polls every priority channel from a single asyncio event loop with non-blocking I/O
+class AsyncPriorityPoller(threading.Thread):
+    def __init__(self, concurrency=100, quality="best"):
+        super(AsyncPriorityPoller, self).__init__(name="AsyncPriorityPoller", daemon=True)
+        self.concurrency = max(1, concurrency)
+        self.quality = quality
+        self.channels = {} # loginID: PriorityChannel, event loop only
+        self.tasks = {} # loginID: asyncio.Task, event loop only
+        self.names = set() # loginIDs, caller thread only
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.start()
+        self.ready.wait()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+
+        try:
+            self.loop.run_until_complete(self.main())
+        finally:
+            self.loop.close()
+
+    async def main(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.stopEvent = asyncio.Event()
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=10)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as self.session:
+            self.ready.set()
+            await self.stopEvent.wait()
+
+            for task in list(self.tasks.values()):
+                task.cancel()
+
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    # Returns loginIDs of polled channels
+    def active(self):
+        return list(self.names)
+
+    def add(self, loginID, **kwargs):
+        self.names.add(loginID)
+        self.loop.call_soon_threadsafe(self.addChannel, PriorityChannel(loginID, **kwargs))
+
+    # Returns polled PriorityChannel of loginID
+    def get(self, loginID):
+        return self.channels.get(loginID) if loginID in self.names else None
+
+    def remove(self, loginID):
+        self.names.discard(loginID)
+        self.loop.call_soon_threadsafe(self.removeChannel, loginID)
+
+    def stop(self):
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopEvent.set)
+
+    def addChannel(self, channel):
+        if channel.loginID not in self.channels:
+            self.channels[channel.loginID] = channel
+            self.tasks[channel.loginID] = self.loop.create_task(self.pollChannel(channel))
+
+    def removeChannel(self, loginID):
+        self.channels.pop(loginID, None)
+        task = self.tasks.pop(loginID, None)
+
+        if task:
+            task.cancel()
+
+    # Probe loop of a single channel
+    async def pollChannel(self, channel):
+        await asyncio.sleep(random.uniform(0, channel.sleep)) # Spread probes over the refresh interval
+
+        while True:
+            try:
+                async with self.semaphore:
+                    streamInfo = await self.getStreamInformation(channel)
+
+                newStream = channel.detectNewStream(streamInfo)
+
+                if newStream is None: # Rare but sometimes time string isn't extracted
+                    await asyncio.sleep(3)
+                    continue
+                elif newStream:
+                    await self.loop.run_in_executor(None, channel.alert, streamInfo) # Blocking Telegram and Helix calls
+            except asyncio.CancelledError:
+                raise
+            except:
+                pass
+
+            await asyncio.sleep(channel.getSleep())
+
+    async def getResponse(self, url, raw=None, stop=None):
+        lines = []
+        status = None
+
+        try:
+            while True: # Wait for shared rate limiter without blocking event loop
+                delay = rateLimiter.reserve(url, RateLimiter.PROBE)
+
+                if not delay:
+                    break
+
+                await asyncio.sleep(delay)
+
+            t0 = time.time()
+            status = "error"
+
+            async with self.session.get(httpPool.rewrite(url)) as res:
+                status = res.status
+                metrics.observeRequest(url, status, time.time() - t0)
+                rateLimiter.update(url, res.status, res.headers)
+
+                if not raw:
+                    return await res.json(content_type=None)
+                elif res.status != 200:
+                    return ""
+
+                async for line in res.content: # Read playlist line by line until stop(line) is True
+                    line = line.decode("utf-8").rstrip("\r\n")
+                    lines.append(line)
+
+                    if stop and stop(line):
+                        break
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            if status == "error":
+                metrics.observeRequest(url, status, time.time() - t0)
+
+            return "" if raw else {}
+
+        return "\n".join(lines)
+
+    # Same as getStreamInformation with non-blocking access token, master playlist and variant playlist requests
+    async def getStreamInformation(self, channel):
+        sig, token = parseAccessToken(await self.getResponse(getAccessTokenURL(channel.TWclientIDPriv, channel.loginID)))
+        streamInfo = {}
+
+        if sig and token:
+            stream = await self.getResponse(getUsherURL(channel.loginID, sig, token), raw=True, stop=getMasterStop(self.quality))
+
+            if stream and "#EXTM3U" in stream:
+                streamData = {}
+                master = parseMasterPlaylist(parseM3U8(stream, keys=masterKeys), self.quality)
+
+                if master:
+                    variantURL = getVariantURL(master, channel.broadcastID)
+
+                    if variantURL:
+                        playList = await self.getResponse(variantURL, raw=True, stop=getVariantStop())
+
+                        if playList and "#EXTM3U" in playList:
+                            streamData = parseM3U8(playList, excludeURL=True, limit=7, keys=variantKeys)
+
+                    streamInfo = buildStreamInfo(master, streamData, channel.broadcastID, channel.localTimeZone)
+
+        return streamInfo
+
+# Consistent hash ring, channels keep their node when other channels or nodes are added or removed
+class HashRing:
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self.keys = [] # Sorted virtual node hashes
+        self.nodes = {} # hash: node
+
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def hash(key):
+        return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], "big")
+
+    def add(self, node):
+        for i in range(self.replicas):
+            h = self.hash("{}#{}".format(node, i))
+            bisect.insort(self.keys, h)
+            self.nodes[h] = node
+
+    def remove(self, node):
+        self.keys = [h for h in self.keys if self.nodes[h] != node]
+        self.nodes = {h : self.nodes[h] for h in self.keys}
+
+    # Returns node of key or None if ring is empty
+    def get(self, key):
+        if not self.keys:
+            return None
+
+        return self.nodes[self.keys[bisect.bisect(self.keys, self.hash(key)) % len(self.keys)]]
+
+# Priority probe loop of a worker process, sends detected streams to coordinator instead of alerting
+def priorityWorker(index, commands, events, settings):
+    global httpPool, rateLimiter, metrics, alertStore, coordinator, scheduler
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Coordinator stops workers
+    startLogging()
+    httpPool = HTTPPool(settings["poolSize"], settings["keepAlive"], settings["hostOverride"])
+    rateLimiter = RateLimiter(settings["rateLimit"], settings["helixLimit"], settings["share"])
+    metrics = Metrics()
+    alertStore = AlertStore() # Alerts are claimed by coordinator process
+    alertStore.stopTime = settings["stopTime"]
+    coordinator = LocalCoordinator()
+    scheduler = Scheduler(settings["probeWorkers"])
+    scheduler.start()
+
+    if settings["asyncPriority"] and requireAiohttp():
+        engine = AsyncPriorityPoller(settings["asyncConcurrency"])
+    else:
+        engine = ScheduledPriorityEngine()
+
+    def deliver(loginID, streamInfo):
+        events.put((index, loginID, streamInfo))
+
+    while True:
+        command = commands.get()
+
+        if command is None:
+            break
+
+        action, loginID, kwargs = command
+
+        if action == "add":
+            engine.add(loginID, deliver=deliver, **kwargs)
+        elif action == "remove":
+            engine.remove(loginID)
+
+    engine.stop()
+    scheduler.stop()
+
+# Splits priority channels across worker processes by consistent hashing on loginID
+# Workers probe and report new streams, this process dedupes by broadcastID and delivers alerts
+class ProcessPriorityEngine(threading.Thread):
+    def __init__(self, processes=2, settings=None):
+        super(ProcessPriorityEngine, self).__init__(name="ProcessPriorityEngine", daemon=True)
+        self.settings = dict(settings or {}, share=1.0 / max(1, processes))
+        self.context = multiprocessing.get_context("spawn") # Same as Windows, forking a threaded process is unsafe
+        self.events = self.context.Queue()
+        self.workers = [None] * max(1, processes) # [process, commands]
+        self.ring = HashRing(range(len(self.workers)))
+        self.channels = {} # loginID: PriorityChannel used for dedupe and delivery
+        self.shards = {} # loginID: [worker index, worker kwargs]
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ShardAlert")
+
+        for i in range(len(self.workers)):
+            self.startWorker(i)
+
+        self.start()
+
+    def startWorker(self, index):
+        commands = self.context.Queue()
+        process = self.context.Process(target=priorityWorker, args=(index, commands, self.events, self.settings), name="PriorityWorker{}".format(index), daemon=True)
+        process.start()
+        self.workers[index] = [process, commands]
+
+    # Restart dead workers and probe their channels again without alerting streams already live
+    def checkWorkers(self):
+        for i, worker in enumerate(self.workers):
+            if worker[0].is_alive():
+                continue
+
+            safeprint("{} [속성] 작업 프로세스 {} 가 종료되어 다시 시작한다에요 (exit {})".format(timeStamp(), i, worker[0].exitcode))
+            self.startWorker(i)
+
+            for loginID, shard in self.shards.items():
+                if shard[0] == i:
+                    self.workers[i][1].put(("add", loginID, dict(shard[1], newAlertsOnly=True)))
+
+    # Returns loginIDs of probed channels
+    def active(self):
+        self.checkWorkers()
+
+        return list(self.channels)
+
+    def add(self, loginID, **kwargs):
+        channel = PriorityChannel(loginID, **kwargs)
+        channel.newAlertsOnly = False # Applied by worker on its first probe
+        index = self.ring.get(loginID)
+        workerKwargs = {k : v for k, v in kwargs.items() if k in ("userID", "displayName", "sleep", "newAlertsOnly", "TWclientID", "localTimeZone")}
+        self.channels[loginID] = channel
+        self.shards[loginID] = [index, workerKwargs]
+        self.workers[index][1].put(("add", loginID, workerKwargs))
+
+    # Returns PriorityChannel of loginID
+    def get(self, loginID):
+        return self.channels.get(loginID)
+
+    def remove(self, loginID):
+        self.channels.pop(loginID, None)
+        shard = self.shards.pop(loginID, None)
+
+        if shard:
+            self.workers[shard[0]][1].put(("remove", loginID, None))
+
+    def stop(self):
+        for worker in self.workers:
+            worker[1].put(None)
+
+        self.events.put(None)
 
     def run(self):
-        import winrt.windows.data.xml.dom as dom
-        from winrt.windows.ui.notifications import ToastNotificationManager, ToastNotification
+        while True:
+            event = self.events.get()
+
+            if event is None:
+                break
+
+            channel = self.channels.get(event[1])
+
+            if channel and channel.detectNewStream(event[2]): # Also drops streams already pushed by EventSub
+                self.executor.submit(channel.buildMessage, event[2])
+
+        for worker in self.workers:
+            worker[0].join(timeout=3)
+
+            if worker[0].is_alive():
+                worker[0].terminate()
+
+# Receives stream.online, stream.offline and channel.update notifications over EventSub WebSocket
+class EventSubClient(threading.Thread):
+    types = {"stream.online" : "1", "stream.offline" : "1", "channel.update" : "2"}
+
+    def __init__(self, TWclientID, token, url="wss://eventsub.wss.twitch.tv/ws", apiURL="https://api.twitch.tv/helix/eventsub/subscriptions", onEvent=None):
+        super(EventSubClient, self).__init__(name="EventSubClient", daemon=True)
+        self.TWclientID = TWclientID
+        self.token = token
+        self.url = url
+        self.apiURL = apiURL
+        self.events = queue.Queue() # [type, event]
+        self.onEvent = onEvent # Called after each queued notification
+        self.connected = False
+        self.generation = 0 # Increased on every new session, subscriptions don't carry over
+        self.wanted = {} # userID: loginID
+        self.subscribed = {} # userID: {type: subscriptionID}
+        self.limitUntil = 0 # Subscription or cost limit of session reached, no new subscriptions before this time
+        self.messageIDs = deque(maxlen=200)
+        self.lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.stopThread = False
+        self.start()
+        self.ready.wait()
 
-        if not self.displayName: # Init only
-            return
+    # Set broadcasters to subscribe, thread safe
+    def setChannels(self, channels):
+        with self.lock:
+            self.wanted = dict(channels)
 
-        try:
-            # Convert to XmlDocument
-            self.xDoc = dom.XmlDocument()
-            self.xDoc.load_xml(self.tString)
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.syncEvent.set)
 
-            # Create notifier
-            self.notifier = ToastNotificationManager.create_toast_notifier(AUMID)
-            self.notifier.show(ToastNotification(self.xDoc))
-        except Exception as e:
-            safeprint("Notification Error: {}".format(e))
+    # Returns userIDs with every subscription type enabled, other channels still need polling
+    def subscribedIDs(self):
+        if not self.connected:
+            return set()
 
-class ChannelLoopThread(threading.Thread):
-    def __init__(self,  *args, **kwargs):
-        global OAuthToken
-        super(ChannelLoopThread, self).__init__(*args, **kwargs)
-        self.stopThread = False
-        self.daemon = True
-        self.TWclientIDPriv = ""
+        return set(k for k, v in list(self.subscribed.items()) if all(n in v for n in self.types))
 
-        try:
-            self.loginID = kwargs.get("name")
-            self.userID = kwargs.get("kwargs").get("userID")
-            self.displayName = kwargs.get("kwargs").get("displayName")
-            self.sleep = kwargs.get("kwargs").get("sleep")
-            self.newAlertsOnly = kwargs.get("kwargs").get("newAlertsOnly")
-            self.notification = kwargs.get("kwargs").get("winnotify")
-            self.TWclientID = kwargs.get("kwargs").get("TWclientID")
-            self.botToken = kwargs.get("kwargs").get("botToken")
-            self.TGclientID = kwargs.get("kwargs").get("TGclientID")
-            self.localTimeZone = kwargs.get("kwargs").get("localTimeZone")
-        except:
-            return
+    def stop(self):
+        self.stopThread = True
 
-        self.broadcastID = []
+        if not self.loop.is_closed(): # Don't wait for next message or keepalive timeout
+            self.loop.call_soon_threadsafe(self.mainTask.cancel)
 
-        if not self.sleep or self.sleep < 3: # Set default sleep value if not specified or set too low
-            self.sleep = 10
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.syncEvent = asyncio.Event()
+        self.mainTask = self.loop.create_task(self.main())
+        self.ready.set()
 
-        self.start()
+        try:
+            self.loop.run_until_complete(self.mainTask)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.connected = False
+            self.loop.close()
 
-    # Build and send message
-    def buildMessage(self, streamInfo):
-        # Skip messaging on first run if newAlertsOnly is set to true
-        if self.newAlertsOnly:
-            self.newAlertsOnly = False
-            return
+    async def main(self):
+        delay = 1
 
-        if streamInfo:
-            title = ""
-            game = ""
-            category = ""
-            volt = u'\U000026A1'
-            ts = streamInfo.get("startTime", "")
-            hashStr1 = "{}_{}_{}".format(self.loginID, streamInfo.get("broadcastID", ""), ts)
-            hashStr2 = "{}_{}_{}".format(self.loginID, streamInfo.get("broadcastID", ""), int(ts) + 1 if ts else "") 
-            hashSha1 = []
-            hashSha1.append(hashlib.sha1(hashStr1.encode()).hexdigest()[:20])
-            hashSha1.append(hashlib.sha1(hashStr2.encode()).hexdigest()[:20])
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as self.session:
+            url = self.url
 
-            # Grab title and game
-            url = "https://api.twitch.tv/helix/channels?broadcaster_id={0}".format(self.userID)
-            info = getAPIResponse(url, clientID=self.TWclientID, token=OAuthToken)
+            while not self.stopThread:
+                try:
+                    url = await self.listen(url)
+                    delay = 1
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    if self.connected:
+                        safeprint("{} EventSub 연결이 끊어졌어요. 일반 확인 모드로 전환한다에요: {}".format(timeStamp(), e))
 
-            if info and isinstance(info, dict):
-                for n in info.get("data"):
-                    title = n.get("title", "")
-                    title = title.strip()
-                    game = n.get("game_name", "")
+                    url = self.url
 
-            if game:
-                category = "<a href='https://www.twitch.tv/directory/game/{gameHTML}'>{game}</a>".format(gameHTML=quote(game, safe=''), game=escape(game))
-            else:
-                game = "-"
-                category = "-"
+                self.connected = False
 
-            messagePrint = "{} ({}) {}\n".format(self.displayName, self.loginID, volt) + \
-                            "시작: {} ({} 경과)\n".format(streamInfo.get("startTimeString", ""), streamInfo.get("elapsedTotal", "")) + \
-                            "방제: '{}'\n".format(title) + \
-                            "범주: '{}'\n".format(game) + \
-                            "\n{}_{}\n{}_{}".format(hashSha1[0], hashStr1, hashSha1[1], hashStr2)
+                if not self.stopThread and url == self.url:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 60) # Back off until server is reachable again
 
-            message = "<a href='https://www.twitch.tv/{loginID}'>{displayName} ({loginID})</a> {volt}\n".format(loginID=self.loginID, displayName=self.displayName, volt=volt) + \
-                        "시작: {} (<i>{}</i> 경과)\n".format(streamInfo.get("startTimeString", ""), streamInfo.get("elapsedTotal", "")) + \
-                        "방제: <b>{}</b>\n".format(escape(title)) + \
-                        "범주: {}".format(category)
+    # Read messages until the socket drops, returns url to connect to next
+    async def listen(self, url):
+        keepalive = 10
+        syncTask = None
 
-            safeprint("{0}\n{1} {2}\n{3}".format("-"*50, timeStamp(), messagePrint, "-"*50))
+        async with self.session.ws_connect(url, heartbeat=None, receive_timeout=None) as ws:
+            try:
+                while not self.stopThread:
+                    msg = await ws.receive(timeout=keepalive + 5) # No message or keepalive in time means dead connection
+
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+
+                    data = json.loads(msg.data)
+                    metadata = data.get("metadata", {})
+                    payload = data.get("payload", {})
+                    messageType = metadata.get("message_type")
+
+                    if metadata.get("message_id") in self.messageIDs: # Duplicate delivery
+                        continue
+
+                    self.messageIDs.append(metadata.get("message_id"))
+
+                    if messageType == "session_welcome":
+                        session = payload.get("session", {})
+                        keepalive = session.get("keepalive_timeout_seconds") or keepalive
+
+                        if url == self.url: # New session, previous subscriptions are gone
+                            self.subscribed = {}
+                            self.limitUntil = 0
+                            self.generation += 1
+
+                        self.sessionID = session.get("id")
+                        self.connected = True
+
+                        if syncTask is None:
+                            syncTask = self.loop.create_task(self.syncLoop())
+                    elif messageType == "notification":
+                        self.events.put([payload.get("subscription", {}).get("type"), payload.get("event", {})])
+
+                        if self.onEvent:
+                            self.onEvent()
+                    elif messageType == "session_reconnect":
+                        return payload.get("session", {}).get("reconnect_url") or self.url
+                    elif messageType == "revocation":
+                        subscription = payload.get("subscription", {})
+                        self.subscribed.get(subscription.get("condition", {}).get("broadcaster_user_id"), {}).pop(subscription.get("type"), None)
+                        self.limitUntil = 0 # Slot is free again
+            finally:
+                if syncTask:
+                    syncTask.cancel()
+
+        return self.url
+
+    # Subscribe added broadcasters and unsubscribe removed ones whenever channel list changes
+    async def syncLoop(self):
+        while not self.stopThread:
+            self.syncEvent.clear()
+
+            with self.lock:
+                wanted = dict(self.wanted)
+
+            for userID in [k for k in self.subscribed if k not in wanted]:
+                for subscriptionID in self.subscribed.pop(userID).values():
+                    if subscriptionID:
+                        await self.request("DELETE", "{}?id={}".format(self.apiURL, subscriptionID))
+                        self.limitUntil = 0 # Slot is free again
+
+            for userID in wanted: # Priority channels come first and get subscriptions first
+                for subscriptionType, version in self.types.items():
+                    if time.time() < self.limitUntil: # Channels over the limit are polled
+                        break
+
+                    if subscriptionType not in self.subscribed.get(userID, {}):
+                        await self.subscribe(userID, subscriptionType, version)
+
+            await self.syncEvent.wait()
+
+    async def subscribe(self, userID, subscriptionType, version):
+        body = {
+            "type" : subscriptionType,
+            "version" : version,
+            "condition" : {"broadcaster_user_id" : userID},
+            "transport" : {"method" : "websocket", "session_id" : self.sessionID}
+        }
+
+        status, info = await self.request("POST", self.apiURL, body)
+
+        if status in (200, 202) and info.get("data"):
+            self.subscribed.setdefault(userID, {})[subscriptionType] = info["data"][0].get("id")
+
+            if info.get("max_total_cost") and info.get("total_cost", 0) >= info.get("max_total_cost"):
+                self.limitUntil = time.time() + 600
+        elif status == 409: # Already subscribed
+            self.subscribed.setdefault(userID, {})[subscriptionType] = ""
+        elif status == 429: # Session holds at most 300 subscriptions, retry later in case it was rate limit
+            self.limitUntil = time.time() + 600
+            safeprint("{} EventSub 구독 한도에 도달했어요. 나머지 채널은 주기적으로 확인한다에요 ({}개 채널 구독 중): {}".format(timeStamp(), len(self.subscribedIDs()), info.get("message", "")))
+        elif info.get("message"):
+            safeprint("{} EventSub Error #{}: {}".format(timeStamp(), status, info.get("message")))
+
+    async def request(self, method, url, body=None):
+        header = {"Client-ID" : self.TWclientID, "Authorization" : "Bearer " + self.token}
 
-            if self.notification:
-                winNotify(kwargs=dict(displayName=self.displayName, loginID=self.loginID, startTime=streamInfo.get("startTimeString", ""), elapsed=streamInfo.get("elapsedTotal", ""), title=title, game=game))
+        try:
+            async with self.session.request(method, url, json=body, headers=header) as res:
+                info = await res.json(content_type=None) if res.status != 204 else {}
+                return res.status, info or {}
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return 0, {}
+
+# Local HTTP API to edit alert lists and read state, handlers run on the main loop worker
+class ControlServer:
+    loginPattern = re.compile(r"^[a-z0-9_]{1,25}$")
+
+    def __init__(self, liveAlert, port, host="127.0.0.1", timeout=30):
+        self.liveAlert = liveAlert
+        self.timeout = timeout # Waits for a running list cycle
+        self.server = None
+        control = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                routes = {
+                    "/channels" : liveAlert.channelState,
+                    "/live" : liveAlert.liveState,
+                    "/stats" : liveAlert.controlStats
+                }
+                fn = routes.get(self.path.split("?")[0])
+
+                if not fn:
+                    self.reply(404, {"error" : "not found"})
+                    return
+
+                self.reply(*control.runSerial(fn))
+
+            def do_POST(self):
+                path = self.path.split("?")[0]
+
+                # Browsers can't send JSON cross-origin without a preflight, which is never answered
+                if self.headers.get("Content-Type", "").split(";")[0].strip() != "application/json":
+                    self.reply(415, {"error" : "Content-Type must be application/json"})
+                    return
+
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+
+                    if length < 0: # read(-1) waits for client to close
+                        raise ValueError
+
+                    body = json.loads(self.rfile.read(length) or b"{}")
+
+                    if not isinstance(body, dict):
+                        raise ValueError
+                except ValueError:
+                    self.reply(400, {"error" : "invalid json"})
+                    return
+
+                if path == "/refresh":
+                    liveAlert.refreshNow()
+                    self.reply(200, {"scheduled" : True})
+                elif path in ("/channels/add", "/channels/remove"):
+                    listName = body.get("list")
+                    logins = body.get("logins", [body["login"]] if body.get("login") else [])
+                    logins = [str(n).strip().lower() for n in logins] if isinstance(logins, list) else []
+
+                    if listName not in ("priority", "normal"):
+                        self.reply(400, {"error" : "list must be priority or normal"})
+                    elif not logins or not all(control.loginPattern.match(n) for n in logins):
+                        self.reply(400, {"error" : "invalid logins"})
+                    else:
+                        self.reply(*control.runSerial(liveAlert.editList, listName == "priority", logins, path.endswith("/add")))
+                else:
+                    self.reply(404, {"error" : "not found"})
 
-            if not sendMessage(self.botToken, self.TGclientID, message):
-                safeprint("{0} 텔레그램 메시지 전달이 늦거나 실패할 수 있다에요...".format(timeStamp()))
+            def reply(self, status, data):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
 
-    def run(self):
-        while True:
-            try:
-                streamInfo = getStreamInformation(self.TWclientIDPriv, self.loginID, streamID=self.broadcastID, localTimeZone=self.localTimeZone)
+            def log_message(self, *args):
+                pass
 
-                if streamInfo and isinstance(streamInfo, dict):
-                    if streamInfo.get("newStream"):
-                        if streamInfo.get("startTimeString"):
-                            if len(self.broadcastID) > 4: # Keep last 5 broadcastIDs
-                                self.broadcastID.pop(0)
+        try:
+            self.server = ThreadingHTTPServer((host, port), Handler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name="ControlServer", daemon=True).start()
+            safeprint("{} 제어 API 시작: http://{}:{}".format(timeStamp(), host, port))
+        except OSError as e:
+            safeprint("{} 제어 API를 시작하지 못했어요 ({}:{}): {}".format(timeStamp(), host, port, e))
+
+    # Run fn between list cycles, returns [status, result]
+    def runSerial(self, fn, *args):
+        done = threading.Event()
+        lock = threading.Lock()
+        state = {"started" : False, "expired" : False}
+        result = [500, None]
+
+        def task():
+            with lock:
+                if state["expired"]: # Client was told it failed, don't apply it late
+                    done.set()
+                    return
+
+                state["started"] = True
 
-                            self.broadcastID.append(streamInfo.get("broadcastID"))
-                            self.buildMessage(streamInfo)
-                        else: # Rare but sometimes time string isn't extracted
-                            time.sleep(3)
-                            continue
+            try:
+                result[:] = [200, fn(*args)]
+            except Exception as e:
+                result[:] = [500, {"error" : str(e)}]
+            finally:
+                done.set()
 
-                if self.newAlertsOnly:
-                    self.newAlertsOnly = False
+        scheduler.call(task)
 
-                t0 = time.time()
+        if not done.wait(self.timeout):
+            with lock:
+                if not state["started"]:
+                    state["expired"] = True
+                    return [503, {"error" : "main loop busy"}]
 
-                while time.time() - t0 < self.sleep:
-                    if self.stopThread:
-                        return True
+            done.wait() # Already running, report its result
 
-                    time.sleep(1)
-            except:
-                pass
+        return result
 
-    def stop(self):
-        self.stopThread = True
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
 
 class TwitchLiveAlert:
     def __init__(self):
         safeprint("{}\n트위치 {} {}\n{}".format("-"*50, appName, TLAversion, "-"*50))
-        self.userData = {}
-        self.priorityData = {}
+        self.userData = UserDataMap()
+        self.priorityData = UserDataMap()
         self.changeData = []
         self.changedID = [[], []]
-        self.gameData = {}
-        self.listHashP = 0
-        self.listHashN = 0
+        self.lookupFailed = [False, False] # [priority, normal] user lookup failed
         self.runOnStart = True
+        self.priorityEngine = None
+        self.eventSubClient = None
+        self.controlServer = None
+        self.channelInfo = {} # userID: [title, gameID] pushed by channel.update
 
         if self.createConfig(configFile): # Config file created
             exitOnKey()
@@ -835,8 +3232,36 @@ class TwitchLiveAlert:
         self.notification = True
         self.silentstart = False
         self.localTimeZone = ""
+        self.asyncPriority = False
+        self.asyncConcurrency = 100
+        self.priorityProcesses = 0
+        self.maxConcurrency = 8
+        self.eventSub = False
+        self.eventSubToken = ""
+        self.eventSubURL = "wss://eventsub.wss.twitch.tv/ws"
+        self.eventSubAPI = "https://api.twitch.tv/helix/eventsub/subscriptions"
+        self.adaptivePolling = False
+        self.pollBudget = 0
+        self.pollWindow = 60
+        self.userCacheEnabled = True
+        self.userCacheAge = 6
+        self.gameCacheSize = 1000
+        self.gameCacheTTL = 168
+        self.profileLog = ""
+        self.profileCycles = 0
+        self.controlPort = 0
         self.loadConfig() # Read and load config
+
+        if headless: # No toast without Windows desktop
+            self.notification = False
         self.initialAlert = self.newAlertsOnly
+        self.pollSchedule = PollSchedule(join(appPath, "pollHistory.json"), self.pollWindow, self.pollBudget) if self.adaptivePolling else None
+        self.userCache = UserCache(join(appPath, "userCache.json"), self.userCacheAge) if self.userCacheEnabled else None
+        self.gameCache = GameCache(join(appPath, "gameCache.json"), self.gameCacheSize, self.gameCacheTTL)
+        self.priorityWatcher = ListWatcher(self.userPriority)
+        self.userWatcher = ListWatcher(self.userListFile)
+        self.profiler = CycleProfiler(self.profileLog, self.profileCycles)
+        self.chunkExecutor = ThreadPoolExecutor(max_workers=max(1, self.maxConcurrency), thread_name_prefix="HelixChunk", initializer=setOAuthUpdater)
 
         clientIDSet = False
 
@@ -971,6 +3396,16 @@ class TwitchLiveAlert:
                         "; 콩솔창의 출력 내용을 console.log 파일에 저장해요\n" \
                         "; logconsole = console.log\n" \
                         "\n" \
+                        "; <logformat> 로그 파일 형식\n" \
+                        "; 콘솔창과 같은 내용으로 저장해요\n" \
+                        "; logformat = text\n" \
+                        "; 시간, 스레드, 메시지와 아이디, 방송 번호, 단계, 지연 시간을 JSON 한 줄로 저장해요\n" \
+                        "; logformat = json\n" \
+                        "\n" \
+                        "; <logmaxsize> <logbackups> 로그 파일 최대 크기(MB)와 보관할 이전 로그 파일 수 (0은 나누지 않음)\n" \
+                        "; logmaxsize = 10\n" \
+                        "; logbackups = 3\n" \
+                        "\n" \
                         "; <localtimezone> 알림 표준 시간대 설정\n" \
                         "; 알림 시간을 설정한 시간대로 표시해 줘요\n" \
                         "; 설정 가능한 시간대 목록은 아래 링크에서 확인해 주세요\n" \
@@ -979,6 +3414,117 @@ class TwitchLiveAlert:
                         "; localtimezone = \n" \
                         "; LA 현지 시간으로 표시 되어요. (제가 LA에 있었을 때...)\n" \
                         "; localtimezone = America/Los_Angeles\n" \
+                        "\n" \
+                        "; <poolsize> 호스트별 연결 풀 크기\n" \
+                        "; 트위치, 텔레그램 서버별로 재사용할 연결 개수에요. 속성 목록이 많은 경우 늘려 주세요\n" \
+                        "; poolsize = 10\n" \
+                        "\n" \
+                        "; <keepalive> 연결 유지 여부\n" \
+                        "; 요청마다 새로 연결하지 않고 기존 연결을 재사용해요\n" \
+                        "; keepalive = True\n" \
+                        "\n" \
+                        "; <ratelimit> 요청 한도 관리 여부\n" \
+                        "; 모든 요청을 서버별 요청 한도에 맞춰 보내고 속성 목록 확인을 가장 먼저 처리해요\n" \
+                        "; ratelimit = True\n" \
+                        "\n" \
+                        "; <helixlimit> 분당 Helix API 요청 한도\n" \
+                        "; 서버에서 받은 Ratelimit 헤더에 맞춰 자동으로 조절 되어요\n" \
+                        "; helixlimit = 800\n" \
+                        "\n" \
+                        "; <telegramworkers> 텔레그램 전송 스레드 수\n" \
+                        "; 알림 확인을 멈추지 않고 텔레그램 메시지를 따로 보내요. 대화방마다 순서와 전송 한도를 지켜요\n" \
+                        "; telegramworkers = 2\n" \
+                        "\n" \
+                        "; <probeworkers> 속성 목록 확인 스레드 수\n" \
+                        "; 스트리머마다 스레드를 만들지 않고 정해진 수의 스레드가 확인할 시간이 된 스트리머만 확인해요\n" \
+                        "; probeworkers = 32\n" \
+                        "\n" \
+                        "; <asyncpriority> 속성 목록 비동기 확인 여부 (aiohttp 모듈 필요)\n" \
+                        "; 확인 스레드를 쓰지 않고 하나의 이벤트 루프에서 속성 목록을 확인해요. 속성 목록이 많은 경우 사용해 주세요\n" \
+                        "; asyncpriority = False\n" \
+                        "\n" \
+                        "; <asyncconcurrency> 비동기 모드 최대 동시 요청 수\n" \
+                        "; asyncconcurrency = 100\n" \
+                        "\n" \
+                        "; <priorityprocesses> 속성 목록을 나눠서 확인할 프로세스 수 (0, 1은 사용 안 함)\n" \
+                        "; 속성 목록을 여러 프로세스에 나눠서 모든 CPU 코어로 확인해요. 목록이 바뀌어도 다른 스트리머는 프로세스를 옮기지 않아요\n" \
+                        "; priorityprocesses = 0\n" \
+                        "\n" \
+                        "; <maxconcurrency> 일반 목록 최대 동시 요청 수\n" \
+                        "; 일반 목록을 99명씩 나눠서 동시에 요청해요\n" \
+                        "; maxconcurrency = 8\n" \
+                        "\n" \
+                        "; <eventsub> EventSub 웹소켓 사용 여부 (aiohttp 모듈 필요)\n" \
+                        "; 주기적으로 확인하지 않고 트위치가 보내주는 생방 시작 알림을 바로 받아요. 연결이 끊어지면 주기적으로 확인해요\n" \
+                        "; eventsub = False\n" \
+                        "\n" \
+                        "; <eventsubtoken> EventSub 사용자 액세스 토큰\n" \
+                        "; 웹소켓 구독은 앱 토큰이 아닌 사용자 토큰이 필요해요\n" \
+                        "; eventsubtoken = \n" \
+                        "\n" \
+                        "; <eventsuburl> <eventsubapi> EventSub 서버 주소 (테스트 서버를 사용하는 경우에만 설정해 주세요)\n" \
+                        "; eventsuburl = wss://eventsub.wss.twitch.tv/ws\n" \
+                        "; eventsubapi = https://api.twitch.tv/helix/eventsub/subscriptions\n" \
+                        "\n" \
+                        "; <metricsport> 메트릭 서버 포트 (0은 사용 안 함)\n" \
+                        "; http://127.0.0.1:<포트>/metrics 주소로 요청 수와 시간, 확인 주기별 소요 시간, 알림 지연 시간, 전송 결과를 Prometheus 형식으로 보여줘요\n" \
+                        "; metricsport = 0\n" \
+                        "\n" \
+                        "; <alerthistory> 보낸 알림을 저장할 개수 (0은 저장 안 함)\n" \
+                        "; 보낸 알림을 alertHistory.json 파일에 저장해서 프로그램을 다시 시작해도 같은 방송을 다시 알리지 않아요\n" \
+                        "; newalertsonly = True 인 경우에도 프로그램이 꺼져 있는 동안 시작한 방송은 알려줘요\n" \
+                        "; alerthistory = 5000\n" \
+                        "\n" \
+                        "; <coordination> 여러 알리미가 목록을 나눠서 확인할 때 함께 사용할 SQLite 파일 (비워두면 사용 안 함)\n" \
+                        "; 알리미마다 목록의 일부만 확인하고, 종료된 알리미가 확인하던 목록은 남은 알리미가 이어서 확인해요. 같은 방송 알림은 한 번만 보내요\n" \
+                        "; coordination = \\\\nas\\share\\coordination.db\n" \
+                        "; <instanceid> 알리미 이름 (비워두면 컴퓨터 이름-프로세스 번호)\n" \
+                        "; <shards> 목록을 나눌 개수, 모든 알리미가 같은 값을 써야 해요\n" \
+                        "; <leasetime> 응답이 없는 알리미의 목록을 가져오기까지 기다리는 시간(초)\n" \
+                        "; shards = 64\n" \
+                        "; leasetime = 90\n" \
+                        "\n" \
+                        "; <hostoverride> 트위치, 텔레그램 요청을 보낼 테스트 서버 주소 (tools/fakeTwitch.py 테스트 서버를 사용하는 경우에만 설정해 주세요)\n" \
+                        "; hostoverride = http://127.0.0.1:8080\n" \
+                        "\n" \
+                        "; <adaptivepolling> 방송 시간 학습 여부\n" \
+                        "; 스트리머별로 방송을 시작한 시간을 기록하고 평소 방송 시작 시간 근처에서만 자주 확인해요\n" \
+                        "; adaptivepolling = False\n" \
+                        "\n" \
+                        "; <pollwindow> 평소 방송 시작 시간 전후로 자주 확인할 시간(분)\n" \
+                        "; pollwindow = 60\n" \
+                        "\n" \
+                        "; <pollbudget> 분당 최대 요청 수 (0은 제한 없음)\n" \
+                        "; 요청 수가 넘치면 방송 시간이 아닌 스트리머부터 확인 간격을 늘려요\n" \
+                        "; pollbudget = 0\n" \
+                        "\n" \
+                        "; <usercache> 유저 정보 저장 여부\n" \
+                        "; 조회한 유저 정보를 userCache.json 파일에 저장해서 프로그램 시작 시 다시 조회하지 않고 바로 알림을 확인해요\n" \
+                        "; 저장된 유저 정보는 오래된 순서대로 조금씩 다시 확인해요\n" \
+                        "; usercache = True\n" \
+                        "\n" \
+                        "; <usercacheage> 저장된 유저 정보를 다시 확인할 시간(시간)\n" \
+                        "; 아이디, 닉네임, 등급 변경 사항은 이 시간 안에 알려드려요\n" \
+                        "; usercacheage = 6\n" \
+                        "\n" \
+                        "; <gamecachesize> 저장할 게임(범주) 이름 개수\n" \
+                        "; 게임 이름을 gameCache.json 파일에 저장하고 오래 사용하지 않은 게임부터 지워요\n" \
+                        "; gamecachesize = 1000\n" \
+                        "\n" \
+                        "; <gamecachettl> 저장된 게임 이름을 다시 조회할 시간(시간)\n" \
+                        "; gamecachettl = 168\n" \
+                        "\n" \
+                        "; <profilelog> 확인 주기 단계별 소요 시간 기록 파일\n" \
+                        "; 확인 주기마다 단계별 소요 시간과 요청 수, 가장 느린 단계, 최근 100회 p50/p99 값을 JSON 한 줄로 기록해요\n" \
+                        "; profilelog = cycleProfile.jsonl\n" \
+                        "\n" \
+                        "; <profilecycles> 시작 후 cProfile로 분석할 확인 주기 횟수 (0은 사용 안 함)\n" \
+                        "; 분석이 끝나면 cycleProfile_<시간>.prof 파일을 저장하고 오래 걸린 함수 목록을 보여줘요. 실행 중에는 6을 누르면 분석해요\n" \
+                        "; profilecycles = 0\n" \
+                        "\n" \
+                        "; <controlport> 제어 API 포트 (0은 사용 안 함)\n" \
+                        "; http://127.0.0.1:<포트> 주소로 목록에 스트리머를 추가, 삭제하고 상태를 확인할 수 있어요. 목록 파일도 함께 바뀌고 바로 적용되어요\n" \
+                        "; controlport = 0\n" \
                         "\n"
 
             safeprint("설정파일 생성중...")
@@ -997,7 +3543,35 @@ class TwitchLiveAlert:
                 "winnotify": "True",
                 "\nsilentstart": "False",
                 "logconsole": "",
-                "localtimezone": ""
+                "logformat": "text",
+                "logmaxsize": "10",
+                "logbackups": "3",
+                "localtimezone": "",
+                "\npoolsize": "10",
+                "keepalive": "True",
+                "ratelimit": "True",
+                "helixlimit": "800",
+                "telegramworkers": "2",
+                "probeworkers": "32",
+                "metricsport": "0",
+                "alerthistory": "5000",
+                "coordination": "",
+                "asyncpriority": "False",
+                "asyncconcurrency": "100",
+                "priorityprocesses": "0",
+                "maxconcurrency": "8",
+                "eventsub": "False",
+                "eventsubtoken": "",
+                "adaptivepolling": "False",
+                "pollwindow": "60",
+                "pollbudget": "0",
+                "usercache": "True",
+                "usercacheage": "6",
+                "gamecachesize": "1000",
+                "gamecachettl": "168",
+                "profilelog": "",
+                "profilecycles": "0",
+                "controlport": "0"
             }
 
             with open(fileName, 'w', encoding="utf-8") as configfile:
@@ -1023,34 +3597,40 @@ class TwitchLiveAlert:
                 self.notification = config["LiveAlertConfig"].getboolean("winnotify", True)
                 self.silentstart = config["LiveAlertConfig"].getboolean("silentstart", False)
                 self.localTimeZone = config["LiveAlertConfig"].get("localtimezone", "")
+                self.asyncPriority = config["LiveAlertConfig"].getboolean("asyncpriority", False)
+                self.asyncConcurrency = int(config["LiveAlertConfig"].get("asyncconcurrency", 100))
+                self.priorityProcesses = int(config["LiveAlertConfig"].get("priorityprocesses", 0))
+                self.maxConcurrency = int(config["LiveAlertConfig"].get("maxconcurrency", 8))
+                self.eventSub = config["LiveAlertConfig"].getboolean("eventsub", False)
+                self.eventSubToken = config["LiveAlertConfig"].get("eventsubtoken", "")
+                self.eventSubURL = config["LiveAlertConfig"].get("eventsuburl", "") or self.eventSubURL
+                self.eventSubAPI = config["LiveAlertConfig"].get("eventsubapi", "") or self.eventSubAPI
+                self.adaptivePolling = config["LiveAlertConfig"].getboolean("adaptivepolling", False)
+                self.pollBudget = int(config["LiveAlertConfig"].get("pollbudget", 0))
+                self.pollWindow = int(config["LiveAlertConfig"].get("pollwindow", 60))
+                self.userCacheEnabled = config["LiveAlertConfig"].getboolean("usercache", True)
+                self.userCacheAge = int(config["LiveAlertConfig"].get("usercacheage", 6))
+                self.gameCacheSize = int(config["LiveAlertConfig"].get("gamecachesize", 1000))
+                self.gameCacheTTL = int(config["LiveAlertConfig"].get("gamecachettl", 168))
+                self.profileLog = config["LiveAlertConfig"].get("profilelog", "")
+                self.profileCycles = int(config["LiveAlertConfig"].get("profilecycles", 0))
+                self.controlPort = int(config["LiveAlertConfig"].get("controlport", 0))
                 safeprint("설정파일 로딩 완료!")
         except Exception as e:
             safeprint("Error: {}".format(e))
 
     # Get userData from list of loginIDs or userIDs using Helix API
-    def getUserDatafromIDs(self, IDList, userIDLookup=False):
-        maxURLSize = 99
-        lowerIndex = 0
+    # IDs of chunks unchanged since last lookup with fingerprint are added to unchanged
+    def getUserDatafromIDs(self, IDList, userIDLookup=False, fingerprint=None, unchanged=None):
         userData = {}
 
         if IDList:
-            while lowerIndex < len(IDList): # Loop through IDList and update streamData information
-                url = "https://api.twitch.tv/helix/users?"
-                upperIndex = min(lowerIndex + maxURLSize, len(IDList))
-
-                for k in IDList[lowerIndex:upperIndex]:
-                    if userIDLookup:
-                        url += "id=" + k + "&"
-                    else:
-                        url += "login=" + k + "&"
-
-                if url[-1] == "&":
-                    url = url[:-1]
+            responses = self.getChunkResponses("https://api.twitch.tv/helix/users?", "id" if userIDLookup else "login", IDList, priority=RateLimiter.BACKGROUND, fingerprint=fingerprint)
 
-                lowerIndex += maxURLSize
-                info = getAPIResponse(url, clientID=self.TWclientID, token=OAuthToken)
-
-                if info:
+            for chunk, info in zip(self.chunks(IDList), responses):
+                if info is UNCHANGED and unchanged is not None:
+                    unchanged.extend(chunk)
+                elif info:
                     btype = {"" : "0", "affiliate" : "1", "partner" : "2"}
 
                     for n in info["data"]:
@@ -1061,59 +3641,86 @@ class TwitchLiveAlert:
 
         return userData
 
-    # Request UserData API if missing key value pair
-    def needUpdate(self, loginIDList, userData):
-        for n in loginIDList:
-            if n not in userData:
-                return True
+    # Split IDs into chunks of one request each
+    def chunks(self, IDList, maxURLSize=99):
+        return [IDList[lowerIndex:lowerIndex + maxURLSize] for lowerIndex in range(0, len(IDList), maxURLSize)]
 
-        return False
+    # Request url for every chunk of IDs concurrently and returns responses in chunk order
+    def getChunkResponses(self, baseURL, key, IDList, maxURLSize=99, priority=RateLimiter.POLL, fingerprint=None):
+        urls = [baseURL + "&".join(key + "=" + k for k in chunk) for chunk in self.chunks(IDList, maxURLSize)]
+
+        if len(urls) < 2:
+            return [getAPIResponse(url, clientID=self.TWclientID, token=OAuthToken, priority=priority, fingerprint=fingerprint) for url in urls]
+
+        return list(self.chunkExecutor.map(lambda url: getAPIResponse(url, clientID=self.TWclientID, token=OAuthToken, priority=priority, fingerprint=fingerprint), urls))
 
     # Add or remove loginID from userData
     def updateUserData(self, userData, forced=None, priority=None):
-        loginIDList = []
         removed = []
         validate = {}
         added = []
         dataResponse = {}
         fillerID = "twitch"
         popFiller = False
+        watcher = self.priorityWatcher if priority else self.userWatcher
+        changedID = self.changedID[0 if priority else 1]
+        diff = watcher.check() # [added, removed] or None when list file is unchanged
+        lookupList = []
+
+        if diff:
+            # Remove from self.changedID once loginID is added to the alert list
+            for n in diff[0]:
+                if n in changedID:
+                    changedID.remove(n)
+
+            # Remove deleted loginID, keep changed loginID to continue to track live streams
+            for k in diff[1]:
+                if k in userData and k not in changedID:
+                    userData.pop(k, None)
+                    removed.append(str(k))
 
-        if priority:
-            loginIDList = fileToList(self.userPriority, removeDuplicate=True)
-            userHash = self.listHashP
-        else:
-            loginIDList = fileToList(self.userListFile, removeDuplicate=True)
-            userHash = self.listHashN
+            newIDs = [n for n in diff[0] if n not in userData]
+
+            if self.userCache: # Add cached users without lookup
+                for k in newIDs:
+                    cached = self.userCache.get(k)
 
-        # Remove from self.changedID once loginID is added to the alert list
-        for n in loginIDList:
-            if n in self.changedID[0 if priority else 1]:
-                self.changedID[0 if priority else 1].remove(n)
+                    if cached:
+                        userData[k] = cached
+                        added.append(str(k))
+                    else:
+                        lookupList.append(k)
+            else:
+                lookupList = newIDs
 
-        # Add changed loginID to continue to track live streams
-        loginIDList.extend(self.changedID[0 if priority else 1])
+        if forced and not self.userCache: # Revalidate whole list when forced
+            lookupList = watcher.items + [n for n in changedID if n not in watcher.itemSet]
+        elif forced or self.lookupFailed[0 if priority else 1]: # Retry loginIDs not resolved yet
+            lookupList.extend(n for n in watcher.items if n not in userData and n not in lookupList)
 
-        # Remove non-matching key
-        for k in list(userData):
-            if k not in loginIDList:
-                userData.pop(k, None)
-                removed.append(str(k))
+        self.lookupFailed[0 if priority else 1] = False
+        lookupSet = set(lookupList)
+        listName = "priority" if priority else "normal"
+        unchanged = [] # Looked up with the same response as last time, nothing to reconcile
 
-        currentHash = hash(str(loginIDList)) # Get list hash
+        if self.userCache: # Revalidate oldest cached users
+            lookupList.extend(self.userCache.stale(n for n in userData if n not in lookupSet))
+            lookupSet = set(lookupList)
 
-        if (currentHash != userHash and self.needUpdate(loginIDList, userData)) or forced: # Update when hash changes or when forced
+        if lookupList:
             # Add known account for valid dataResponse check
-            if len(loginIDList) and fillerID not in loginIDList:
-                loginIDList.append(fillerID)
+            if fillerID not in lookupList:
+                lookupList.append(fillerID)
                 popFiller = True
 
-            if priority:
-                self.listHashP = currentHash
-            else:
-                self.listHashN = currentHash
+            dataResponse = self.getUserDatafromIDs(lookupList, fingerprint="users_" + listName, unchanged=unchanged)
+            self.lookupFailed[0 if priority else 1] = not dataResponse and not unchanged # Retry on next cycle
+            lookupSet.difference_update(unchanged)
 
-            dataResponse = self.getUserDatafromIDs(loginIDList)
+            if self.userCache: # Same response verifies cached users again
+                for k in unchanged:
+                    if k in userData:
+                        self.userCache.put(k, userData.get(k)[0], userData.get(k)[1], userData.get(k)[2])
 
             if dataResponse: # Check needed to distinguish from valid response and non API response
                 # Add missing key value pair
@@ -1132,9 +3739,14 @@ class TwitchLiveAlert:
                                 self.changeData.append([k, v[1], "", userData.get(k)[2] + v[2], ""]) # [loginID, displayName, prechange-displayName, typeChange, prechange-loginID]
                                 userData.get(k)[2] = v[2]
 
+                if self.userCache:
+                    for k, v in dataResponse.items():
+                        if k in userData:
+                            self.userCache.put(k, v[0], v[1], v[2])
+
                 # Validate invalid key value pair from userData (either username has changed or banned)
                 for k, v in userData.items():
-                    if k not in dataResponse:
+                    if k in lookupSet and k not in dataResponse:
                         validate.update({v[0]:k}) # {userID : loginID}
                         removed.append(k)
 
@@ -1148,30 +3760,37 @@ class TwitchLiveAlert:
                                 userData.update({v[0]:[k, v[1], v[2], v[3], userData.get(validate.get(k))[4]]}) # Add new loginID to userData
                                 added.append(v[0])
 
+                                if self.userCache:
+                                    self.userCache.put(v[0], k, v[1], v[2])
+
                                 if v[0] not in self.changedID[0 if priority else 1]:
                                     self.changedID[0 if priority else 1].append(v[0]) # Track changed loginID
 
                 for k in removed:
                     userData.pop(k, None)
 
-            # Remove fillerID after use
-            if popFiller:
-                loginIDList.remove(fillerID)
+                    if self.userCache:
+                        self.userCache.remove(k)
 
         listType = "[속성] " if priority else "[일반] "
+        phase = "priority_users" if priority else "normal_users"
 
         if added or removed:
-            safeprint("{0} {1}알리미 목록이 업데이트 되었다에요 [{2}]".format(timeStamp(), listType, len(userData)))
+            # Responses of changed list no longer describe userData
+            httpPool.forget("users_" + listName)
+            httpPool.forget("streams_" + listName)
+
+            safeprint("{0} {1}알리미 목록이 업데이트 되었다에요 [{2}]".format(timeStamp(), listType, len(userData)), phase=phase, count=len(userData))
 
             if removed:
-                safeprint("{0} {1}목록에서 {2} 명을 삭제했다에요\n{3}\n".format(timeStamp(), listType, len(removed), removed))
+                safeprint("{0} {1}목록에서 {2} 명을 삭제했다에요\n{3}\n".format(timeStamp(), listType, len(removed), removed), phase=phase, removed=removed)
             if added:
-                safeprint("{0} {1}목록에 {2} 명을 추가했다에요\n{3}\n".format(timeStamp(), listType, len(added), added))
+                safeprint("{0} {1}목록에 {2} 명을 추가했다에요\n{3}\n".format(timeStamp(), listType, len(added), added), phase=phase, added=added)
 
-            missing = [n for n in loginIDList if n not in userData]
+            missing = [n for n in watcher.items if n not in userData]
 
             if missing:
-                safeprint("{0} 다음 {1}목록의 아이디를 조회할 수 없어요. 다시 확인해 주세요\n{2}".format(timeStamp(), listType, missing))
+                safeprint("{0} 다음 {1}목록의 아이디를 조회할 수 없어요. 다시 확인해 주세요\n{2}".format(timeStamp(), listType, missing), phase=phase, missing=missing)
 
         return userData
 
@@ -1183,90 +3802,164 @@ class TwitchLiveAlert:
 
         return None
 
-    # Build gameID to gameName dictionary
+    # Look up missing gameNames of streamData in one batch
     def getGameResponse(self, streamData):
         if not streamData:
             return False
 
-        gameIDs = list(n[4] for n in streamData.values() if n[4] not in self.gameData) # List of gameIDs
-        gameIDs = list(set(gameIDs)) # Remove duplicates, no order preserved
+        self.gameCache.resolve([n[4] for n in streamData.values()], self.getGameNames)
 
-        if gameIDs:
-            # safeprint("Found new gameIDs: {0}".format(gameIDs))
-            maxURLSize = 99
-            lowerIndex = 0
+    # Returns gameID to gameName dictionary from Helix API
+    def getGameNames(self, gameIDs):
+        gameData = {}
 
-            while lowerIndex < len(gameIDs):
-                url = "https://api.twitch.tv/helix/games?"
-                upperIndex = min(lowerIndex + maxURLSize, len(gameIDs))
+        for info in self.getChunkResponses("https://api.twitch.tv/helix/games?", "id", gameIDs, priority=RateLimiter.ALERT):
+            if info:
+                for n in info["data"]:
+                    gameData[n.get("id")] = n.get("name")
 
-                for k in gameIDs[lowerIndex:upperIndex]:
-                    url += "id=" + k + "&"
+        return gameData
 
-                if url[-1] == "&":
-                    url = url[:-1]
+    # Set loginID live and returns True if streamID is new
+    def setLiveStream(self, userData, loginID, streamID, streamTime):
+        userData.get(loginID)[3] = True
 
-                lowerIndex += maxURLSize
+        if self.pollSchedule:
+            self.pollSchedule.setLive(loginID)
 
-                info = getAPIResponse(url, clientID=self.TWclientID, token=OAuthToken)
+        if streamID not in userData.get(loginID)[-1]: # New streamID
+            if len(userData.get(loginID)[-1]) > 4: # Keep last 5 streamIDs
+                userData.get(loginID)[-1].pop(0)
 
-                if info:
-                    for n in info["data"]:
-                        if n.get("id") not in self.gameData:
-                            self.gameData[n.get("id")] = n.get("name")
+            if streamTime:
+                timeStampUTC = round(datetime.fromisoformat(streamTime.replace("Z", "+00:00")).timestamp())
 
-        # safeprint("Updated gameData: {0}".format(self.gameData))
+                if timeStampUTC:
+                    userData.get(loginID)[4] = timeStampUTC
 
-    # Returns updated userData and streamData in the form { userID: [displayName, streamTitle, timeStamp, viewerCount, gameID, streamID], ... }
-    def getLiveResponse(self, userData):
-        loginIDList = list(userData.keys())
+                    if self.pollSchedule:
+                        self.pollSchedule.record(loginID, timeStampUTC)
 
-        maxURLSize = 99
-        lowerIndex = 0
-        streamData = {}
+            userData.get(loginID)[-1].append(streamID)
+            return True
+
+        return False
+
+    # Alert live streams and keep channel changes pushed by EventSub
+    def handleEventSub(self):
+        if not self.eventSubClient:
+            return
+
+        while True:
+            try:
+                eventType, event = self.eventSubClient.events.get_nowait()
+            except queue.Empty:
+                break
+
+            try:
+                userID = event.get("broadcaster_user_id")
+
+                if eventType == "channel.update":
+                    self.channelInfo[userID] = [event.get("title", ""), event.get("category_id", "")]
+
+                    if event.get("category_id"):
+                        self.gameCache.put(event.get("category_id"), event.get("category_name", ""))
+                elif eventType == "stream.offline":
+                    loginID = self.userData.findLoginID(userID)
+
+                    if loginID:
+                        self.userData.get(loginID)[3] = False
+                        httpPool.forget("streams_normal") # Next poll sets live state again
+                elif eventType == "stream.online" and event.get("type", "live") == "live":
+                    self.alertEventStream(event)
+            except Exception as e:
+                safeprint("{} EventSub Error: {}".format(timeStamp(), e))
+
+    # Send stream.online event through priority channel or userData alert path
+    def alertEventStream(self, event):
+        userID = event.get("broadcaster_user_id")
+        streamID = event.get("id")
+        streamTime = re.sub(r"\.\d+", "", event.get("started_at", "")) # Strip nanoseconds
+
+        if not streamID or not streamTime:
+            return
+
+        loginID = self.priorityData.findLoginID(userID)
+        channel = self.priorityEngine.get(loginID) if loginID and self.priorityEngine else None
+
+        if channel:
+            timeStr = convertUTCtoLocalTime(streamTime, localTimeZone=self.localTimeZone)
+            streamInfo = {
+                "newStream" : True,
+                "broadcastID" : int(streamID),
+                "source" : "",
+                "startTime" : round(datetime.fromisoformat(streamTime.replace("Z", "+00:00")).timestamp()),
+                "startTimeString" : timeStr[0],
+                "elapsedTotal" : timeStr[1]
+            }
+
+            channel.newAlertsOnly = False # Pushed streams always started after launch
+
+            if channel.detectNewStream(streamInfo):
+                channel.buildMessage(streamInfo)
 
-        while lowerIndex < len(loginIDList): # Loop through loginIDList and update streamData information
-            url = "https://api.twitch.tv/helix/streams?"
-            upperIndex = min(lowerIndex + maxURLSize, len(loginIDList))
+        loginID = self.userData.findLoginID(userID)
 
-            for k in loginIDList[lowerIndex:upperIndex]:
-                url += "user_login=" + k + "&"
+        if loginID and self.setLiveStream(self.userData, loginID, streamID, streamTime):
+            if userID not in self.channelInfo: # Missed channel.update, grab title and game
+                info = getAPIResponse("https://api.twitch.tv/helix/channels?broadcaster_id={0}".format(userID), clientID=self.TWclientID, token=OAuthToken, priority=RateLimiter.ALERT)
 
-            if url[-1] == "&":
-                url = url[:-1]
+                if info and isinstance(info, dict):
+                    for n in info.get("data"):
+                        self.channelInfo[userID] = [n.get("title", ""), n.get("game_id", "")]
 
-            lowerIndex += maxURLSize
+                        if n.get("game_id"):
+                            self.gameCache.put(n.get("game_id"), n.get("game_name", ""))
 
-            info = getAPIResponse(url, clientID=self.TWclientID, token=OAuthToken)
+            title, gameID = self.channelInfo.get(userID, ["", ""])
+            streamData = {loginID : [event.get("broadcaster_user_name") or self.userData.get(loginID)[1], title, streamTime, 0, gameID, streamID]}
+            self.buildMessage(streamData, sendThumb=False, pushed=True) # Preview thumbnail doesn't exist yet
 
-            # Reset live state
-            for k in userData:
-                userData.get(k)[3] = False
+    # Returns updated userData and streamData in the form { userID: [displayName, streamTitle, timeStamp, viewerCount, gameID, streamID], ... }
+    # With fingerprint, chunks with the same response as last time are not parsed again
+    def getLiveResponse(self, userData, loginIDList=None, fingerprint=None):
+        if loginIDList is None:
+            loginIDList = list(userData.keys())
 
+        streamData = {}
+        responses = self.getChunkResponses("https://api.twitch.tv/helix/streams?", "user_login", loginIDList, fingerprint=fingerprint)
+        unchanged = set()
+
+        for chunk, info in zip(self.chunks(loginIDList), responses):
+            if info is UNCHANGED:
+                unchanged.update(chunk)
+
+        # Reset live state, channels of unchanged responses keep theirs
+        for k in loginIDList:
+            if k in userData:
+                if k not in unchanged:
+                    userData.get(k)[3] = False
+                elif userData.get(k)[3] and self.pollSchedule:
+                    self.pollSchedule.setLive(k)
+
+        for info in responses: # Loop through responses in loginIDList order and update streamData information
             if info:
                 for n in info["data"]:
-                    match = self.searchForValue(userData, n.get("user_id"))
+                    if isinstance(userData, UserDataMap):
+                        match = userData.findLoginID(n.get("user_id"))
+                    else:
+                        match = self.searchForValue(userData, n.get("user_id"))
 
                     if match:
                         streamID = n.get("id")
-                        streamTime = n.get("started_at")
 
                         if streamID:
-                            userData.get(match)[3] = True
-
-                            if streamID not in userData.get(match)[-1]: # New streamID
-                                if len(userData.get(match)[-1]) > 4: # Keep last 5 streamIDs
-                                    userData.get(match)[-1].pop(0)
-
-                                if streamTime:
-                                    timeStampUTC = round(datetime.fromisoformat(streamTime.replace("Z", "+00:00")).timestamp())
-
-                                    if timeStampUTC:
-                                        userData.get(match)[4] = timeStampUTC
-
-                                userData.get(match)[-1].append(streamID)
+                            if self.setLiveStream(userData, match, streamID, n.get("started_at")): # New streamID
                                 streamData[match] = [n.get("user_name"), n.get("title"), n.get("started_at"), n.get("viewer_count"), n.get("game_id"), streamID]
 
+                                if n.get("game_name"): # Skip games lookup when name comes with stream
+                                    self.gameCache.put(n.get("game_id"), n.get("game_name"))
+
         # Build gameID to gameName dictionary
         if streamData:
             self.getGameResponse(streamData)
@@ -1274,19 +3967,30 @@ class TwitchLiveAlert:
         return streamData, userData
 
     # Build and send message
-    def buildMessage(self, streamData, sendThumb=True):
+    def buildMessage(self, streamData, sendThumb=True, pushed=False):
         # Skip messaging on first run if newAlertsOnly is set to true
-        if self.newAlertsOnly:
+        if self.newAlertsOnly and not pushed:
             self.newAlertsOnly = False
-            return
+            resumed = {} # Streams started while stopped are still new
+
+            for n in streamData:
+                if alertStore.startedAfterStop(datetime.fromisoformat(streamData.get(n)[2].replace("Z", "+00:00")).timestamp()):
+                    resumed[n] = streamData.get(n)
+                else: # Keep this and other instances from alerting streams live before start
+                    coordinator.claimAlert(n, streamData.get(n)[5])
+
+            streamData = resumed
 
         if streamData: # userID: [displayName, streamTitle, timeStamp, viewerCount, gameID, streamID]
             eye = u'\U0001F441'
 
             for n in streamData:
+                if not coordinator.claimAlert(n, streamData.get(n)[5]): # Sent by another instance
+                    continue
+
                 timeStr = convertUTCtoLocalTime(streamData.get(n)[2], localTimeZone=self.localTimeZone)
                 thumbURL = "https://static-cdn.jtvnw.net/previews-ttv/live_user_{0}-640x360.jpg?a={1}".format(n, time.time())
-                category = self.gameData.get(streamData.get(n)[4], "")
+                category = self.gameCache.get(streamData.get(n)[4], "")
                 timeStampUTC = round(datetime.fromisoformat(streamData.get(n)[2].replace("Z", "+00:00")).timestamp())
                 hashStr = "{}_{}_{}".format(n, streamData.get(n)[5], timeStampUTC)
                 hashSha1 = hashlib.sha1(hashStr.encode()).hexdigest()[:20]
@@ -1299,7 +4003,7 @@ class TwitchLiveAlert:
                 messagePrint = "{} ({}) ({} 명 시청중)\n".format(streamData.get(n)[0], n, streamData.get(n)[3]) + \
                                 "시작: {} ({} 경과)\n".format(timeStr[0], timeStr[1]) + \
                                 "방제: '{}'\n".format(streamData.get(n)[1].strip()) + \
-                                "범주: '{}'\n".format(self.gameData.get(streamData.get(n)[4], "-")) + \
+                                "범주: '{}'\n".format(self.gameCache.get(streamData.get(n)[4], "-")) + \
                                 "\n{}_{}".format(hashSha1, hashStr)
 
                 message = "<a href='https://www.twitch.tv/{loginID}'>{displayName} ({loginID})</a> ({eye} <i>{view}</i>)\n".format(loginID=n, displayName=streamData.get(n)[0], eye=eye, view=streamData.get(n)[3]) + \
@@ -1307,22 +4011,16 @@ class TwitchLiveAlert:
                             "방제: <b>{}</b>\n".format(escape(streamData.get(n)[1].strip())) + \
                             "범주: {}".format(category)
 
-                safeprint("{0}\n{1} {2}\n{3}".format("-"*50, timeStamp(), messagePrint, "-"*50))
+                safeprint("{0}\n{1} {2}\n{3}".format("-"*50, timeStamp(), messagePrint, "-"*50), phase="alert", list="normal", loginID=n, broadcastID=streamData.get(n)[5], latency=round(time.time() - timeStampUTC, 3), pushed=pushed)
+                metrics.alert("normal", timeStampUTC)
 
                 if self.notification:
-                    winNotify(kwargs=dict(displayName=streamData.get(n)[0], loginID=n, startTime=timeStr[0], elapsed=timeStr[1], title=streamData.get(n)[1].strip(), game=self.gameData.get(streamData.get(n)[4], "-")))
-
-                rval = False
+                    notifyWorker.notify(displayName=streamData.get(n)[0], loginID=n, startTime=timeStr[0], elapsed=timeStr[1], title=streamData.get(n)[1].strip(), game=self.gameCache.get(streamData.get(n)[4], "-"))
 
                 if sendThumb:
-                    rval = sendPhoto(self.botToken, self.TGclientID, thumbURL, message)
+                    telegramQueue.sendPhoto(self.botToken, self.TGclientID, thumbURL, message)
                 else:
-                    rval = sendMessage(self.botToken, self.TGclientID, message)
-
-                if not rval:
-                    safeprint("{0} 텔레그램 메시지 전달이 늦거나 실패할 수 있다에요...".format(timeStamp()))
-
-                time.sleep(2) # Give some delay between consecutive alerts
+                    telegramQueue.sendMessage(self.botToken, self.TGclientID, message)
 
     # Build and send notification when displayName or broadcasterType changes
     def notifyUserChange(self):
@@ -1344,7 +4042,7 @@ class TwitchLiveAlert:
                                 "{}".format("강등 되었다에요..ㅠㅠ" if change > 0 else "구독 '해줘'")
 
                     if self.notification:
-                        winNotify(kwargs=dict(displayName=n[1], loginID=n[0], btype=n[3]))
+                        notifyWorker.notify(displayName=n[1], loginID=n[0], btype=n[3])
                 elif n[4]: # loginID change
                     messagePrint = "{} ({})\n".format(n[1], n[0]) + \
                                     "[{}] {} [{}]\n".format(n[4], arrow, n[0]) + \
@@ -1355,7 +4053,7 @@ class TwitchLiveAlert:
                                 "아이디가 변경 되었어요!"
 
                     if self.notification:
-                        winNotify(kwargs=dict(displayName=n[1], loginID=n[0], oldID=n[4]))
+                        notifyWorker.notify(displayName=n[1], loginID=n[0], oldID=n[4])
                 else: # displayName change
                     messagePrint = "{} ({})\n".format(n[1], n[0]) + \
                                     "[{}] {} [{}]\n".format(n[2], arrow, n[1]) + \
@@ -1366,31 +4064,31 @@ class TwitchLiveAlert:
                                 "닉네임이 변경 되었어요!\n이건 굉장히 귀하네요"
 
                     if self.notification:
-                        winNotify(kwargs=dict(displayName=n[1], loginID=n[0], oldName=n[2]))
+                        notifyWorker.notify(displayName=n[1], loginID=n[0], oldName=n[2])
 
-                    for t in threading.enumerate(): # Stop thread with old displayName
-                        if t.name != "MainThread" and t.name == n[0]:
-                            t.stop()
+                    if self.priorityEngine: # Stop channel with old displayName
+                        self.priorityEngine.remove(n[0])
 
                 safeprint("{0}\n{1} {2}\n{3}".format("-"*50, timeStamp(), messagePrint, "-"*50))
 
-                if not sendMessage(self.botToken, self.TGclientID, message):
-                    safeprint("{0} 텔레그램 메시지 전달이 늦거나 실패할 수 있다에요...".format(timeStamp()))
-
-                time.sleep(2) # Give some delay between consecutive alerts
+                telegramQueue.sendMessage(self.botToken, self.TGclientID, message)
 
             self.changeData.clear()
 
     # Keyboard event
-    def keyPressEvent(self):
-        key = kbFunc()
-
+    def keyPressEvent(self, key):
         if key == 49: # 1
             self.printLiveResponse()
         elif key == 50: # 2
             self.printUserList(priority=True) # priority
         elif key == 51: # 3
             self.printUserList()
+        elif key == 52: # 4
+            self.printStats()
+        elif key == 53: # 5
+            self.profiler.printStats()
+        elif key == 54: # 6
+            self.profiler.startProfile(self.profileCycles or 5)
         # elif key > 0: # Print key
             # safeprint(key)
 
@@ -1441,6 +4139,33 @@ class TwitchLiveAlert:
         else:
             safeprint("{}\n{} [{}] 목록이 비어 있다에요\n{}".format("-"*50, timeStamp(), "속성" if priority else "일반", "-"*50))
 
+    # Print connection pool statistics
+    def printStats(self):
+        stats = httpPool.stats()
+        message = ""
+        total = [0, 0]
+
+        for host in sorted(stats):
+            message += "{} [요청 {}] [재사용 {}] [새 연결 {}]\n".format(host, stats[host]["requests"], stats[host]["hits"], stats[host]["misses"])
+            total[0] += stats[host]["hits"]
+            total[1] += stats[host]["misses"]
+
+        safeprint("{}\n{} 연결 풀 통계 [재사용 {}] [새 연결 {}]\n{}\n{}{}".format("-"*50, timeStamp(), total[0], total[1], "-"*50, message, "-"*50))
+
+        stats = rateLimiter.stats()
+        message = ""
+
+        for name in stats:
+            message += "{} [대기열 {}] [남은 요청 {}] [대기 {}회 평균 {:.2f}초 최대 {:.2f}초] [429 {}회]\n".format(name, stats[name]["queue"], stats[name]["tokens"], stats[name]["waits"], stats[name]["waitAvg"], stats[name]["waitMax"], stats[name]["limited"])
+
+        safeprint("{} 요청 한도 통계\n{}\n{}{}".format(timeStamp(), "-"*50, message, "-"*50))
+
+        stats = telegramQueue.stats()
+        safeprint("{} 텔레그램 전송 [대기열 {}] [전송 {}] [실패 {}] [재시도 {}] [지연 평균 {:.2f}초 최대 {:.2f}초]".format(timeStamp(), stats["queue"], stats["delivered"], stats["failed"], stats["retried"], stats["latencyAvg"], stats["latencyMax"]))
+
+        stats = self.gameCache.stats()
+        safeprint("{} 게임 이름 캐시 [저장 {}] [적중 {}] [조회 {}]".format(timeStamp(), stats["size"], stats["hits"], stats["misses"]))
+
     # Print list of live streams on start (when newalertsonly is set to true)
     def runOnce(self):
         if self.runOnStart:
@@ -1473,8 +4198,7 @@ class TwitchLiveAlert:
         global needOAuthUpdate
         global OAuthToken
 
-        forceCount = 0
-        forceUpdate = False
+        self.forceUpdate = False
         self.createAlertFile(fileName)
         self.createAlertFile(fileName2)
 
@@ -1482,7 +4206,7 @@ class TwitchLiveAlert:
         safeprint("{} 트위치 생방알리미 시작!".format(timeStamp()))
 
         if not self.silentstart:
-            sendMessage(self.botToken, self.TGclientID, "{0} 트위치 생방알리미 시작!\n[일반] | [썸네일 <i>{1}</i>] [{stopwatch} <i>{2}</i>초]\n[속성] | [{stopwatch} <i>{3}</i>초]".format(timeStamp(), "ON" if self.sendThumb else "OFF", self.refresh, self.refresh2, stopwatch=stopwatch))
+            telegramQueue.sendMessage(self.botToken, self.TGclientID, "{0} 트위치 생방알리미 시작!\n[일반] | [썸네일 <i>{1}</i>] [{stopwatch} <i>{2}</i>초]\n[속성] | [{stopwatch} <i>{3}</i>초]".format(timeStamp(), "ON" if self.sendThumb else "OFF", self.refresh, self.refresh2, stopwatch=stopwatch))
 
         if not validateOAuthToken(self.TWclientID):
             # safeprint("{} Need to get valid OAuth Token".format(timeStamp()))
@@ -1490,7 +4214,45 @@ class TwitchLiveAlert:
             getOAuthToken(self.TWclientID, self.TWclientSecret)
 
         OAuthToken = setOAuthToken(self.TWclientID)
-        activePriority = []
+        self.activePriority = []
+        self.knownPriority = set() # Priority list of previous cycle
+        self.pollGeneration = -1
+
+        # Split priority channels between worker processes to use every core
+        if self.priorityProcesses > 1:
+            safeprint("{} [속성] 목록을 {} 개의 프로세스로 나눠서 확인한다에요".format(timeStamp(), self.priorityProcesses))
+            self.priorityEngine = ProcessPriorityEngine(self.priorityProcesses, {
+                "poolSize" : poolSize,
+                "keepAlive" : keepAlive,
+                "hostOverride" : hostOverride,
+                "rateLimit" : rateLimit,
+                "helixLimit" : helixLimit,
+                "asyncPriority" : self.asyncPriority,
+                "asyncConcurrency" : self.asyncConcurrency,
+                "stopTime" : alertStore.stopTime,
+                "probeWorkers" : probeWorkers
+            })
+        # Poll priority channels from one event loop instead of one thread per channel
+        elif self.asyncPriority:
+            if requireAiohttp():
+                safeprint("{} [속성] 목록을 비동기 모드로 확인한다에요 [동시 요청 {}]".format(timeStamp(), self.asyncConcurrency))
+                self.priorityEngine = AsyncPriorityPoller(self.asyncConcurrency)
+            else:
+                safeprint("{} 비동기 모드(asyncpriority)를 사용하려면 aiohttp 모듈이 필요해요".format(timeStamp()))
+
+        if not self.priorityEngine:
+            self.priorityEngine = ScheduledPriorityEngine()
+
+        # Push live changes over EventSub and fall back to polling while disconnected
+        if self.eventSub:
+            if not requireAiohttp():
+                safeprint("{} EventSub 모드(eventsub)를 사용하려면 aiohttp 모듈이 필요해요".format(timeStamp()))
+            elif not self.eventSubToken:
+                safeprint("{} EventSub 모드(eventsub)를 사용하려면 사용자 토큰(eventsubtoken)이 필요해요".format(timeStamp()))
+            else:
+                safeprint("{} EventSub 모드로 생방 여부를 확인한다에요".format(timeStamp()))
+                self.eventSubClient = EventSubClient(self.TWclientID, self.eventSubToken, self.eventSubURL, self.eventSubAPI, onEvent=lambda: scheduler.call(self.handleEventSub))
+
 
         # Unset self.localTimeZone to if invalid
         try:
@@ -1504,88 +4266,312 @@ class TwitchLiveAlert:
             self.localTimeZone = ""
             pass
 
+        # Every periodic task runs from the scheduler, main thread only waits for keys
+        scheduler.schedule(self.checkOAuth, min(self.refresh, self.refresh2), name="OAuth", serial=True)
+        scheduler.schedule(self.forceRefresh, self.refresh * 6, name="ForceRefresh", serial=True)
+        self.cycleTask = scheduler.schedule(self.runCycle, name="Cycle", serial=True)
+        scheduler.start()
+
+        if self.controlPort > 0:
+            self.controlServer = ControlServer(self, self.controlPort)
+
         while True:
-            if needOAuthUpdate:
-                safeprint("{} 인증 토큰 업데이트가 필요해요...".format(timeStamp()))
-                needOAuthUpdate = False
-                getOAuthToken(self.TWclientID, self.TWclientSecret)
-                OAuthToken = setOAuthToken(self.TWclientID)
-
-            if forceCount > 5:
-                forceUpdate = True
-                forceCount = 0
-
-            # Update priorityData
-            self.priorityData = self.updateUserData(self.priorityData, forced=forceUpdate, priority=True)
-
-            # Stop threads that are no longer in priority list
-            for t in threading.enumerate():
-                if t.name != "MainThread" and t.name not in list(self.priorityData.keys()):
-                    t.stop()
-
-            if self.priorityData: # loginID: [userID, displayName, broadcasterType, live, time, [streamID]]
-                currentThreads = [t.name for t in threading.enumerate() if t.name != "MainThread"]
-
-                for n in self.priorityData:
-                    if n not in currentThreads: # Start missing thread
-                        userInfo = self.priorityData.get(n)
-
-                        if userInfo:
-                            ChannelLoopThread(name=n, kwargs=dict(userID=userInfo[0],
-                                                                displayName=userInfo[1],
-                                                                sleep=self.refresh2,
-                                                                newAlertsOnly=(True if n in activePriority else self.initialAlert),
-                                                                winnotify=self.notification,
-                                                                TWclientID=self.TWclientID,
-                                                                botToken=self.botToken,
-                                                                TGclientID=self.TGclientID,
-                                                                localTimeZone=self.localTimeZone))
-
-                            # Append to activePriority to prevent extra alert when restarting thread due to name change
-                            if n not in activePriority:
-                                activePriority.append(n)
-
-            # Clear old data from activePriority to prevent alert suppression upon re-addition
-            for k in activePriority:
-                if k not in self.priorityData:
-                    activePriority.remove(k)
-
-            # Update userData
-            self.userData = self.updateUserData(self.userData, forced=forceUpdate, priority=False)
-
-            if self.userData:
-                streamData, self.userData = self.getLiveResponse(self.userData)
+            key = readKey()
+
+            if key == 3: # Ctrl+C is read as a key while waiting
+                signalHandler(signal.SIGINT, None)
+
+            scheduler.call(self.keyPressEvent, key)
+
+    # Renew OAuth token after a request was rejected, returns True if renewed
+    def updateOAuth(self):
+        global needOAuthUpdate
+        global OAuthToken
+
+        if not needOAuthUpdate:
+            return False
+
+        safeprint("{} 인증 토큰 업데이트가 필요해요...".format(timeStamp()), phase="oauth")
+        needOAuthUpdate = False
+        getOAuthToken(self.TWclientID, self.TWclientSecret)
+        OAuthToken = setOAuthToken(self.TWclientID)
+
+        return True
+
+    # Scheduled OAuth check between list cycles, priority alerts may be rejected first
+    def checkOAuth(self):
+        self.updateOAuth()
+
+        return min(self.refresh, self.refresh2)
+
+    # Scheduled forced update of user data on next list cycle
+    def forceRefresh(self):
+        self.forceUpdate = True
+
+        return self.refresh * 6
+
+    # Start and stop priority channels to match priorityData and owned shards
+    def reconcilePriority(self):
+        # Stop channels that are no longer in priority list
+        currentChannels = self.priorityEngine.active()
+
+        for n in currentChannels:
+            if n not in self.priorityData or not coordinator.owns(n):
+                self.priorityEngine.remove(n)
+
+        if self.priorityData: # loginID: [userID, displayName, broadcasterType, live, time, [streamID]]
+            for n in self.priorityData:
+                if n not in currentChannels and coordinator.owns(n): # Start missing channel
+                    userInfo = self.priorityData.get(n)
+                    newAlertsOnly = True if n in self.activePriority else self.initialAlert
+
+                    if coordinator.shared and n in self.knownPriority: # Taken over from another instance, coordinator drops alerts already sent
+                        newAlertsOnly = False
+
+                    if userInfo:
+                        self.priorityEngine.add(n, userID=userInfo[0],
+                                                displayName=userInfo[1],
+                                                sleep=self.refresh2,
+                                                newAlertsOnly=newAlertsOnly,
+                                                winnotify=self.notification,
+                                                TWclientID=self.TWclientID,
+                                                botToken=self.botToken,
+                                                TGclientID=self.TGclientID,
+                                                localTimeZone=self.localTimeZone,
+                                                schedule=self.pollSchedule)
+
+                        # Append to activePriority to prevent extra alert when restarting thread due to name change
+                        if n not in self.activePriority:
+                            self.activePriority.append(n)
+
+        # Clear old data from activePriority to prevent alert suppression upon re-addition
+        for k in self.activePriority:
+            if k not in self.priorityData:
+                self.activePriority.remove(k)
+
+        self.knownPriority = set(self.priorityData)
+
+    # One cycle of both lists, returns seconds until next cycle
+    def runCycle(self):
+        self.profiler.start()
+
+        if self.updateOAuth():
+            self.profiler.lap("oauth")
+
+        # Renew shard leases, lease outlives a few refresh waits
+        coordinator.update(max(self.refresh, self.refresh2) * 3)
+        self.profiler.lap("coordination")
+
+        forceUpdate = self.forceUpdate
+
+        # Update priorityData
+        self.priorityData = self.updateUserData(self.priorityData, forced=forceUpdate, priority=True)
+        self.profiler.lap("priority_users")
+
+        self.reconcilePriority()
+        self.profiler.lap("reconcile")
+
+        # Update userData
+        self.userData = self.updateUserData(self.userData, forced=forceUpdate, priority=False)
+        self.profiler.lap("normal_users")
+
+        if self.eventSubClient:
+            self.eventSubClient.setChannels([(v[0], k) for k, v in list(self.priorityData.items()) + list(self.userData.items()) if coordinator.owns(k)])
+            self.profiler.lap("eventsub")
+
+        if self.userData:
+            eventSub = self.eventSubClient
+            loginIDList = None
+
+            # Skip polling channels subscribed over EventSub, except on start, forced update and new session
+            if not eventSub or not eventSub.connected or eventSub.generation != self.pollGeneration or forceUpdate or self.runOnStart:
+                if eventSub:
+                    self.pollGeneration = eventSub.generation
+            else:
+                subscribedIDs = eventSub.subscribedIDs()
+                loginIDList = [k for k, v in self.userData.items() if v[0] not in subscribedIDs]
+
+            if loginIDList is None or loginIDList:
+                # Poll channels away from their usual start time less often
+                if self.pollSchedule and not self.runOnStart and not forceUpdate:
+                    loginIDList = self.pollSchedule.due(list(self.userData.keys()) if loginIDList is None else loginIDList, self.refresh)
+
+                # Poll channels of own shards only
+                if coordinator.shared:
+                    loginIDList = [n for n in (self.userData if loginIDList is None else loginIDList) if coordinator.owns(n)]
+
+                streamData, self.userData = self.getLiveResponse(self.userData, loginIDList, fingerprint="streams_normal")
+                self.profiler.lap("streams")
                 self.buildMessage(streamData, self.sendThumb)
+                self.profiler.lap("alerts")
 
-            # Notify loginID, displayName or broadcasterType changes
-            self.notifyUserChange()
+        # Keep game names, sent alerts and resolved users of both lists for next start
+        self.gameCache.save()
+        alertStore.save()
 
-            # Print live streams on start (when newalertsonly is set to true)
-            self.runOnce()
+        if self.userCache:
+            self.userCache.prune(set(self.priorityData) | set(self.userData))
+            self.userCache.save()
 
-            if forceUpdate:
-                forceUpdate = False
+        # Plan next polling intervals and keep start time history
+        if self.pollSchedule:
+            self.pollSchedule.plan(list(self.priorityData.keys()), list(self.userData.keys()), self.refresh2, self.refresh)
+            self.pollSchedule.save()
 
-            forceCount += 1
+        self.profiler.lap("save")
 
-            t0 = time.time()
+        # Notify loginID, displayName or broadcasterType changes
+        self.notifyUserChange()
+        self.profiler.lap("user_changes")
+
+        # Print live streams on start (when newalertsonly is set to true)
+        self.runOnce()
+        self.profiler.lap("run_once")
+        self.profiler.end()
+        metrics.set("tla_channels", len(self.priorityData), list="priority")
+        metrics.set("tla_channels", len(self.userData), list="normal")
+        metrics.set("tla_priority_active", len(self.priorityEngine.active()))
+
+        if forceUpdate:
+            self.forceUpdate = False
+
+        return self.refresh
+
+    # Add or remove loginIDs in list file, returns loginIDs that changed the file
+    def editListFile(self, fileName, loginIDs, add=True):
+        lines = readFile(fileName) or []
+        current = set(n.strip().lower() for n in lines)
+
+        if add:
+            changed = [n for n in dict.fromkeys(loginIDs) if n not in current]
 
-            while time.time() - t0 < self.refresh:
-                self.keyPressEvent()
-                time.sleep(0.2)
+            if changed:
+                newline = "\n" if lines and not lines[-1].endswith("\n") else ""
+                outputFile(fileName, newline + "\n".join(changed) + "\n", mode="a")
+        else:
+            removeSet = set(loginIDs)
+            changed = [n for n in dict.fromkeys(loginIDs) if n in current]
+
+            if changed:
+                outputFile(fileName, "".join(n for n in lines if n.strip().lower() not in removeSet))
+
+        return changed
+
+    # Apply list file changes now, looks up changed loginIDs only, returns [added, removed]
+    def syncList(self, priority):
+        userData = self.priorityData if priority else self.userData
+        before = set(userData)
+        userData = self.updateUserData(userData, priority=priority)
+
+        if priority:
+            self.priorityData = userData
+            self.reconcilePriority() # New channels are probed right away
+        else:
+            self.userData = userData
+
+        added = [n for n in userData if n not in before]
+        removed = [n for n in before if n not in userData]
+
+        if self.eventSubClient and (added or removed):
+            self.eventSubClient.setChannels([(v[0], k) for k, v in list(self.priorityData.items()) + list(self.userData.items()) if coordinator.owns(k)])
+
+        # Check new normal channels without waiting for next cycle
+        loginIDList = [n for n in added if coordinator.owns(n)] if not priority else []
+
+        if loginIDList:
+            streamData, self.userData = self.getLiveResponse(self.userData, loginIDList, fingerprint="streams_normal")
+            self.buildMessage(streamData, self.sendThumb)
+
+        return [added, removed]
+
+    # Control API: edit list file and apply it
+    def editList(self, priority, loginIDs, add=True):
+        changed = self.editListFile(self.userPriority if priority else self.userListFile, loginIDs, add)
+        added, removed = self.syncList(priority)
+        userData = self.priorityData if priority else self.userData
+
+        return {
+            "list" : "priority" if priority else "normal",
+            "changed" : changed,
+            "added" : added,
+            "removed" : removed,
+            "missing" : [n for n in loginIDs if n not in userData] if add else [] # Not resolved, retried every cycle
+        }
+
+    # Control API: watched channels of both lists
+    def channelState(self):
+        active = set(self.priorityEngine.active()) if self.priorityEngine else set()
+
+        def describe(userData, priority=False):
+            channels = []
+
+            for k, v in userData.items(): # loginID: [userID, displayName, broadcasterType, live, time, [streamID]]
+                channel = {"login" : k, "userID" : v[0], "displayName" : v[1], "live" : bool(v[3])}
+
+                if priority:
+                    channel["probing"] = k in active
+
+                channels.append(channel)
+
+            return channels
+
+        return {"priority" : describe(self.priorityData, True), "normal" : describe(self.userData)}
+
+    # Control API: live streams of both lists, priority live state is fetched like key 1
+    def liveState(self):
+        _, self.priorityData = self.getLiveResponse(self.priorityData)
+        live = []
+
+        for listName, userData in [["priority", self.priorityData], ["normal", self.userData]]:
+            for k, v in userData.items():
+                if v[3]:
+                    live.append({"login" : k, "displayName" : v[1], "list" : listName, "streamID" : v[5][-1] if v[5] else None, "startTime" : v[4]})
+
+        return live
+
+    # Control API: internal statistics shown by keys 4 and 5
+    def controlStats(self):
+        return {
+            "channels" : {"priority" : len(self.priorityData), "normal" : len(self.userData)},
+            "priorityActive" : len(self.priorityEngine.active()) if self.priorityEngine else 0,
+            "threads" : threading.active_count(),
+            "http" : httpPool.stats(),
+            "rateLimit" : rateLimiter.stats(),
+            "telegram" : telegramQueue.stats(),
+            "gameCache" : self.gameCache.stats(),
+            "scheduler" : scheduler.stats(),
+            "cycle" : {
+                "count" : self.profiler.cycle,
+                "p50" : round(self.profiler.percentile(self.profiler.totals, 50), 4),
+                "p99" : round(self.profiler.percentile(self.profiler.totals, 99), 4),
+                "phases" : {k : round(self.profiler.percentile(v, 50), 4) for k, v in self.profiler.history.items()}
+            }
+        }
+
+    # Control API: revalidate both lists and poll on next main loop turn
+    def refreshNow(self):
+        self.forceUpdate = True
+        scheduler.runNow(self.cycleTask)
 
 def main():
+    global notifyWorker
+
     try:
         signal.signal(signal.SIGINT, signalHandler)
-        winNotify(kwargs=dict()) # init notification
+        signal.signal(signal.SIGTERM, signalHandler) # Service stop on Linux
+        notifyWorker = NullNotifier() if headless else NotifyWorker() # init notification
         liveAlert = TwitchLiveAlert()
         liveAlert.loopLiveAlert(liveAlert.userListFile, liveAlert.userPriority)
     except Exception:
         safeprint("{} Main thread error!".format(timeStamp()))
         traceback.print_exc()
-        msvcrt.getch()
+
+        if not headless:
+            readKey()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Priority worker processes of frozen exe
+    headless = headless or "--headless" in sys.argv[1:]
     setpriority()
     appName = "생방알리미"
     AUMID = "TLA.TwitchLiveAlert"
@@ -1594,8 +4580,23 @@ if __name__ == "__main__":
     requests.packages.urllib3.disable_warnings(InsecureRequestWarning) # Suppress warning messages
     needOAuthUpdate = False
     OAuthToken = ""
-    printLock = threading.Lock()
     logConsole = ""
+    logFormat = "text"
+    logMaxSize = 10
+    logBackups = 3
+    poolSize = 10
+    keepAlive = True
+    rateLimit = True
+    helixLimit = 800
+    telegramWorkers = 2
+    hostOverride = ""
+    metricsPort = 0
+    coordination = ""
+    instanceID = ""
+    shardCount = 64
+    leaseTime = 90
+    alertHistory = 5000
+    probeWorkers = 32
 
     # Read config
     config = configparser.ConfigParser()
@@ -1605,13 +4606,34 @@ if __name__ == "__main__":
 
         if "LiveAlertConfig" in config:
             logConsole = config["LiveAlertConfig"].get("logconsole", "")
+            logFormat = config["LiveAlertConfig"].get("logformat", "text")
+            logMaxSize = int(config["LiveAlertConfig"].get("logmaxsize", 10))
+            logBackups = int(config["LiveAlertConfig"].get("logbackups", 3))
+            poolSize = int(config["LiveAlertConfig"].get("poolsize", 10))
+            keepAlive = config["LiveAlertConfig"].getboolean("keepalive", True)
+            rateLimit = config["LiveAlertConfig"].getboolean("ratelimit", True)
+            helixLimit = int(config["LiveAlertConfig"].get("helixlimit", 800))
+            telegramWorkers = int(config["LiveAlertConfig"].get("telegramworkers", 2))
+            hostOverride = config["LiveAlertConfig"].get("hostoverride", "")
+            metricsPort = int(config["LiveAlertConfig"].get("metricsport", 0))
+            coordination = config["LiveAlertConfig"].get("coordination", "")
+            instanceID = config["LiveAlertConfig"].get("instanceid", "")
+            shardCount = int(config["LiveAlertConfig"].get("shards", 64))
+            leaseTime = int(config["LiveAlertConfig"].get("leasetime", 90))
+            alertHistory = int(config["LiveAlertConfig"].get("alerthistory", 5000))
+            probeWorkers = int(config["LiveAlertConfig"].get("probeworkers", 32))
     except:
         pass
 
-    # Enable console logging
-    if logConsole:
-        logging.basicConfig(level=logging.INFO, format="{message}", style='{',
-                            handlers=[logging.FileHandler(logConsole, "a", "utf-8"), logging.StreamHandler(sys.stdout)])
+    # Console and log file output from one background thread
+    logListener = startLogging(logConsole, logFormat, logMaxSize, logBackups)
+
+    httpPool = HTTPPool(poolSize, keepAlive, hostOverride) # Shared by every thread
+    rateLimiter = RateLimiter(rateLimit, helixLimit) # Shared by every thread
+    telegramQueue = TelegramQueue(telegramWorkers) # Shared by every thread
+    scheduler = Scheduler(probeWorkers) # Started by main loop after first tasks are added
+
+    metrics = Metrics(metricsPort) # Shared by every thread, no-op unless metricsport is set
 
     Logo = resourcePath("bt.ico")
     CACert = resourcePath("certifi/cacert.pem")
@@ -1629,6 +4651,17 @@ if __name__ == "__main__":
         appPath = dirname(__file__) # Script path
         exeName = appName
 
-    os.system("title {}".format(exeName))
+    setTitle(exeName)
+
+    alertStore = AlertStore(join(appPath, "alertHistory.json") if alertHistory > 0 else "", alertHistory) # Shared by every thread
+    coordinator = LocalCoordinator()
+
+    # Split alert lists with other instances sharing coordination file
+    if coordination:
+        try:
+            coordinator = SQLiteCoordinator(coordination, instanceID, shardCount, leaseTime)
+            safeprint("{} 다른 알리미와 목록을 나눠서 확인한다에요 [{}] [인스턴스 {}]".format(timeStamp(), coordination, coordinator.instanceID))
+        except sqlite3.Error as e:
+            safeprint("{} Coordination Error: {}".format(timeStamp(), e))
 
     main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Local stand-in for Twitch EventSub WebSocket server and subscription API (requires aiohttp)
+#
+# Usage: python tools/fakeEventSub.py [--port 8090] [--keepalive 10] [--max-subscriptions 300]
+#
+# Like Twitch, each WebSocket session holds at most --max-subscriptions enabled subscriptions, more get 429
+#
+# 알리미설정.ini
+#   eventsub = True
+#   eventsubtoken = fake
+#   eventsuburl = ws://127.0.0.1:8090/ws
+#   eventsubapi = http://127.0.0.1:8090/helix/eventsub/subscriptions
+#
+# Control endpoints
+#   POST /trigger    {"type": "stream.online", "user_id": "123", "login": "abc", "name": "Abc", "title": "...", "category_id": "1", "category_name": "..."}
+#   POST /reconnect  Send session_reconnect to every session
+#   POST /drop       Close every socket without notice
+#   GET  /subscriptions
+
+import argparse
+import asyncio
+import json
+import uuid
+from datetime import datetime, timezone
+
+from aiohttp import web, WSMsgType
+
+class FakeEventSub:
+    def __init__(self, keepalive=10, maxSubscriptions=300):
+        self.keepalive = keepalive
+        self.maxSubscriptions = maxSubscriptions # Per session
+        self.sessions = {} # sessionID: WebSocketResponse
+        self.subscriptions = {} # subscriptionID: subscription
+        self.rejected = 0 # Subscriptions refused over the limit
+
+    def message(self, messageType, payload, subscriptionType=None):
+        metadata = {
+            "message_id" : str(uuid.uuid4()),
+            "message_type" : messageType,
+            "message_timestamp" : now()
+        }
+
+        if subscriptionType:
+            metadata["subscription_type"] = subscriptionType
+            metadata["subscription_version"] = "1"
+
+        return json.dumps({"metadata" : metadata, "payload" : payload})
+
+    def session(self, sessionID, status="connected", reconnectURL=None):
+        return {"session" : {"id" : sessionID, "status" : status, "connected_at" : now(), "keepalive_timeout_seconds" : self.keepalive, "reconnect_url" : reconnectURL}}
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        sessionID = request.query.get("session") or str(uuid.uuid4())
+        reconnected = sessionID in [s.get("transport", {}).get("session_id") for s in self.subscriptions.values()]
+        self.sessions[sessionID] = ws
+
+        if not reconnected:
+            self.clearSubscriptions(sessionID)
+
+        await ws.send_str(self.message("session_welcome", self.session(sessionID)))
+        keepalive = asyncio.ensure_future(self.keepaliveLoop(ws))
+
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            keepalive.cancel()
+
+            if self.sessions.get(sessionID) is ws:
+                self.sessions.pop(sessionID, None)
+
+        return ws
+
+    async def keepaliveLoop(self, ws):
+        while not ws.closed:
+            await asyncio.sleep(self.keepalive * 0.8)
+            await ws.send_str(self.message("session_keepalive", {}))
+
+    def clearSubscriptions(self, sessionID):
+        for k in [k for k, v in self.subscriptions.items() if v["transport"].get("session_id") == sessionID]:
+            self.subscriptions.pop(k)
+
+    async def subscribe(self, request):
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return web.json_response({"status" : 401, "message" : "Missing authorization"}, status=401)
+
+        body = await request.json()
+        sessionID = body.get("transport", {}).get("session_id")
+
+        if sessionID not in self.sessions:
+            return web.json_response({"status" : 400, "message" : "Invalid session"}, status=400)
+
+        sessionSubscriptions = [v for v in self.subscriptions.values() if v["transport"].get("session_id") == sessionID]
+
+        for v in sessionSubscriptions:
+            if v["type"] == body.get("type") and v["condition"] == body.get("condition"):
+                return web.json_response({"status" : 409, "message" : "subscription already exists"}, status=409)
+
+        if len(sessionSubscriptions) >= self.maxSubscriptions:
+            self.rejected += 1
+            return web.json_response({"error" : "Too Many Requests", "status" : 429, "message" : "websocket transport subscription limit exceeded"}, status=429)
+
+        subscription = {
+            "id" : str(uuid.uuid4()),
+            "status" : "enabled",
+            "type" : body.get("type"),
+            "version" : body.get("version"),
+            "condition" : body.get("condition"),
+            "transport" : body.get("transport"),
+            "created_at" : now(),
+            "cost" : 0
+        }
+        self.subscriptions[subscription["id"]] = subscription
+
+        return web.json_response({"data" : [subscription], "total" : len(self.subscriptions), "total_cost" : 0, "max_total_cost" : 10}, status=202)
+
+    async def unsubscribe(self, request):
+        self.subscriptions.pop(request.query.get("id"), None)
+        return web.Response(status=204)
+
+    async def listSubscriptions(self, request):
+        return web.json_response({"data" : list(self.subscriptions.values()), "total" : len(self.subscriptions), "rejected" : self.rejected})
+
+    async def trigger(self, request):
+        body = await request.json()
+        subscriptionType = body.get("type", "stream.online")
+        userID = str(body.get("user_id", ""))
+        event = {
+            "broadcaster_user_id" : userID,
+            "broadcaster_user_login" : body.get("login", ""),
+            "broadcaster_user_name" : body.get("name", body.get("login", ""))
+        }
+
+        if subscriptionType == "stream.online":
+            event.update({"id" : str(body.get("id", uuid.uuid4().int % 10**11)), "type" : "live", "started_at" : body.get("started_at", now())})
+        elif subscriptionType == "channel.update":
+            event.update({"title" : body.get("title", ""), "language" : "ko", "category_id" : body.get("category_id", ""), "category_name" : body.get("category_name", ""), "content_classification_labels" : []})
+
+        sent = 0
+
+        for subscription in list(self.subscriptions.values()):
+            if subscription["type"] == subscriptionType and subscription["condition"].get("broadcaster_user_id") == userID:
+                ws = self.sessions.get(subscription["transport"].get("session_id"))
+
+                if ws and not ws.closed:
+                    await ws.send_str(self.message("notification", {"subscription" : subscription, "event" : event}, subscriptionType))
+                    sent += 1
+
+        return web.json_response({"sent" : sent})
+
+    async def reconnect(self, request):
+        for sessionID, ws in list(self.sessions.items()):
+            reconnectURL = "ws://{}/ws?session={}".format(request.host, sessionID)
+            await ws.send_str(self.message("session_reconnect", self.session(sessionID, "reconnecting", reconnectURL)))
+
+        return web.json_response({"sessions" : len(self.sessions)})
+
+    async def drop(self, request):
+        count = len(self.sessions)
+
+        for ws in list(self.sessions.values()):
+            await ws.close()
+
+        return web.json_response({"dropped" : count})
+
+    def application(self):
+        app = web.Application()
+        app.router.add_get("/ws", self.websocket)
+        app.router.add_post("/helix/eventsub/subscriptions", self.subscribe)
+        app.router.add_delete("/helix/eventsub/subscriptions", self.unsubscribe)
+        app.router.add_get("/subscriptions", self.listSubscriptions)
+        app.router.add_post("/trigger", self.trigger)
+        app.router.add_post("/reconnect", self.reconnect)
+        app.router.add_post("/drop", self.drop)
+        return app
+
+def now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f") + "000Z"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--keepalive", type=int, default=10, help="keepalive_timeout_seconds sent in session_welcome")
+    parser.add_argument("--max-subscriptions", type=int, default=300, help="enabled subscriptions per session")
+    args = parser.parse_args()
+
+    web.run_app(FakeEventSub(args.keepalive, args.max_subscriptions).application(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Local stand-in for Twitch Helix, OAuth, access token, usher playlists and Telegram bot API (requires aiohttp)
+# Requests arrive as /{host}/{path} through hostoverride, e.g. /api.twitch.tv/helix/streams?user_login=channel0
+#
+# Usage: python tools/fakeTwitch.py [--port 8080] [--channels 1000] [--latency 30] [--error-rate 0.01] [--script events.json]
+#
+# 알리미설정.ini
+#   hostoverride = http://127.0.0.1:8080
+#
+# Channels are channel0 ... channel{N-1} with userIDs 100000 ... 100000+N-1
+#
+# Control endpoints
+#   POST /control/live     {"login": "channel3", "title": "...", "game_id": "1"} or {"count": 5} for random offline channels
+#   POST /control/offline  {"login": "channel3"} or {"all": true}
+#   POST /control/config   {"latency": 30, "jitter": 10, "errorRate": 0.01, "errorStatus": 500, "retryAfter": 1, "gameName": true}
+#   POST /control/reset    Clear request counts, events and messages
+#   GET  /control/stats    Request counts, go-live events with detection latency and Telegram messages
+#
+# Script file is a list of {"at": seconds, "action": "live" | "offline", "login": "..." | "count": n}
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import parse_qs
+
+from aiohttp import web
+
+class FakeTwitch:
+    def __init__(self, channels=1000, games=50, initialLive=0.0, latency=0.0, jitter=0.0, errorRate=0.0, errorStatus=500, helixLimit=800):
+        self.channels = {} # loginID: {"id", "login", "name", "btype"}
+        self.ids = {} # userID: loginID
+        self.streams = {} # loginID: {"id", "started", "title", "game_id", "viewers"}
+        self.games = {str(1000 + i) : "Game {}".format(i) for i in range(games)}
+        self.games["509658"] = "Just Chatting"
+        self.tokens = {} # access_token: client_id
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.errorRate = errorRate
+        self.errorStatus = errorStatus
+        self.retryAfter = 1
+        self.gameName = True # Include game_name in streams response
+        self.helixLimit = helixLimit
+        self.helixWindow = [0, 0] # [minute, points used]
+        self.requests = Counter() # endpoint: count
+        self.errors = Counter() # endpoint: injected errors
+        self.events = [] # {"login", "at", "alerted"}
+        self.messages = [] # {"at", "method", "chat_id", "login", "text"}
+        self.broadcastID = 40000000000
+
+        for i in range(channels):
+            self.addChannel("channel{}".format(i), str(100000 + i), "Channel{}".format(i), ["", "affiliate", "partner"][i % 3])
+
+        self.addChannel("twitch", "12826", "Twitch", "partner") # Filler account used by updateUserData
+
+        for k in random.sample(list(self.channels), int(channels * initialLive)):
+            self.setLive(k, record=False)
+
+    def addChannel(self, login, userID, name, btype):
+        self.channels[login] = {"id" : userID, "login" : login, "name" : name, "btype" : btype}
+        self.ids[userID] = login
+
+    # Start new broadcast of login, recorded events are matched with Telegram alerts
+    def setLive(self, login, title=None, gameID=None, record=True):
+        if login not in self.channels:
+            return None
+
+        self.broadcastID += random.randint(1, 1000)
+        self.streams[login] = {
+            "id" : str(self.broadcastID),
+            "started" : time.time(),
+            "title" : title or "{} 방송 {}".format(login, self.broadcastID),
+            "game_id" : gameID or random.choice(list(self.games)),
+            "viewers" : random.randint(1, 5000)
+        }
+
+        if record:
+            self.events.append({"login" : login, "at" : time.time(), "alerted" : None})
+
+        return login
+
+    def setOffline(self, login):
+        return self.streams.pop(login, None) is not None
+
+    # Returns helix user object
+    def user(self, login):
+        c = self.channels[login]
+
+        return {"id" : c["id"], "login" : login, "display_name" : c["name"], "type" : "", "broadcaster_type" : c["btype"], "description" : "", "created_at" : "2015-01-01T00:00:00Z"}
+
+    # Returns helix stream object
+    def stream(self, login):
+        c = self.channels[login]
+        s = self.streams[login]
+        stream = {
+            "id" : s["id"],
+            "user_id" : c["id"],
+            "user_login" : login,
+            "user_name" : c["name"],
+            "game_id" : s["game_id"],
+            "type" : "live",
+            "title" : s["title"],
+            "viewer_count" : s["viewers"],
+            "started_at" : iso(s["started"]),
+            "language" : "ko",
+            "thumbnail_url" : "https://static-cdn.jtvnw.net/previews-ttv/live_user_{}-{{width}}x{{height}}.jpg".format(login),
+            "tag_ids" : [],
+            "is_mature" : False
+        }
+
+        if self.gameName:
+            stream["game_name"] = self.games.get(s["game_id"], "")
+
+        return stream
+
+    # Helix points left in current minute window
+    def helixHeaders(self):
+        minute = int(time.time() // 60)
+
+        if self.helixWindow[0] != minute:
+            self.helixWindow = [minute, 0]
+
+        self.helixWindow[1] += 1
+
+        return {
+            "Ratelimit-Limit" : str(self.helixLimit),
+            "Ratelimit-Remaining" : str(max(0, self.helixLimit - self.helixWindow[1])),
+            "Ratelimit-Reset" : str((minute + 1) * 60)
+        }
+
+    # Returns endpoint name used for request counts
+    def endpoint(self, host, path):
+        if host.startswith("video-weaver"):
+            return "variant"
+        elif host == "usher.ttvnw.net":
+            return "usher"
+        elif host == "api.telegram.org":
+            return "telegram/" + path.rsplit("/", 1)[-1]
+        elif path.endswith("access_token.json"):
+            return "access_token"
+
+        return path.strip("/")
+
+    async def handle(self, request):
+        host = request.match_info["host"]
+        path = "/" + request.match_info["path"]
+        query = parse_qs(request.query_string)
+        endpoint = self.endpoint(host, path)
+        self.requests[endpoint] += 1
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        if self.errorRate and random.random() < self.errorRate:
+            self.errors[endpoint] += 1
+
+            return self.error(host, self.errorStatus)
+
+        if host == "api.twitch.tv":
+            if path.startswith("/helix/"):
+                return web.json_response(self.helix(path, query), headers=self.helixHeaders())
+            elif path.endswith("/access_token.json"):
+                login = path.split("/")[3]
+                token = json.dumps({"channel" : login, "expires" : int(time.time()) + 1200})
+
+                return web.json_response({"token" : token, "sig" : "fakesig{}".format(random.randint(0, 99999)), "mobile_restricted" : False})
+        elif host == "id.twitch.tv":
+            if path == "/oauth2/token":
+                token = "fake{}".format(random.randint(0, 10**12))
+                self.tokens[token] = query.get("client_id", [""])[0]
+
+                return web.json_response({"access_token" : token, "expires_in" : 5000000, "token_type" : "bearer"})
+            elif path == "/oauth2/validate":
+                token = request.headers.get("Authorization", "").split(" ")[-1]
+
+                if token in self.tokens:
+                    return web.json_response({"client_id" : self.tokens[token], "scopes" : [], "expires_in" : 5000000})
+
+                return web.json_response({"status" : 401, "message" : "invalid access token"}, status=401)
+        elif host == "usher.ttvnw.net":
+            login = path.rsplit("/", 1)[-1].replace(".m3u8", "")
+
+            if login in self.streams:
+                return web.Response(text=self.masterPlaylist(login), content_type="application/vnd.apple.mpegurl")
+
+            return web.json_response([{"type" : "error", "error" : "twirp error not_found: transcode does not exist", "error_code" : "transcode_does_not_exist"}], status=404)
+        elif host.startswith("video-weaver"):
+            login = path.rsplit("/", 1)[-1].rsplit("-", 1)[0]
+
+            if login in self.streams:
+                return web.Response(text=self.variantPlaylist(login), content_type="application/vnd.apple.mpegurl")
+
+            return web.Response(status=404)
+        elif host == "api.telegram.org":
+            return web.json_response(await self.telegram(request, path))
+
+        return web.json_response({"status" : 404, "message" : "Not Found"}, status=404)
+
+    def error(self, host, status):
+        if host == "api.telegram.org":
+            if status == 429:
+                return web.json_response({"ok" : False, "error_code" : 429, "description" : "Too Many Requests: retry after {}".format(self.retryAfter), "parameters" : {"retry_after" : self.retryAfter}}, status=429)
+
+            return web.json_response({"ok" : False, "error_code" : status, "description" : "Internal Server Error"}, status=status)
+
+        headers = {}
+
+        if status == 429:
+            headers = {"Ratelimit-Limit" : str(self.helixLimit), "Ratelimit-Remaining" : "0", "Ratelimit-Reset" : str(int(time.time()) + self.retryAfter)}
+
+        return web.json_response({"error" : "Error", "status" : status, "message" : "injected error"}, status=status, headers=headers)
+
+    def helix(self, path, query):
+        data = []
+
+        if path == "/helix/users":
+            logins = query.get("login", []) + [self.ids[n] for n in query.get("id", []) if n in self.ids]
+            data = [self.user(n) for n in logins if n in self.channels]
+        elif path == "/helix/streams":
+            logins = query.get("user_login", []) + [self.ids[n] for n in query.get("user_id", []) if n in self.ids]
+            data = [self.stream(n) for n in logins if n in self.streams]
+        elif path == "/helix/games":
+            data = [{"id" : n, "name" : self.games[n], "box_art_url" : ""} for n in query.get("id", []) if n in self.games]
+        elif path == "/helix/channels":
+            for n in query.get("broadcaster_id", []):
+                login = self.ids.get(n)
+
+                if login:
+                    s = self.streams.get(login, {"title" : "", "game_id" : ""})
+                    data.append({"broadcaster_id" : n, "broadcaster_login" : login, "broadcaster_name" : self.channels[login]["name"], "broadcaster_language" : "ko", "game_id" : s["game_id"], "game_name" : self.games.get(s["game_id"], ""), "title" : s["title"], "delay" : 0})
+
+        return {"data" : data, "pagination" : {}}
+
+    def masterPlaylist(self, login):
+        s = self.streams[login]
+        now = time.time()
+        lines = [
+            "#EXTM3U",
+            '#EXT-X-TWITCH-INFO:NODE="video-edge-fake.sel03",MANIFEST-NODE-TYPE="weaver_cluster",SUPPRESS="false",SERVER-TIME="{:.2f}",TRANSCODESTACK="2023-Transcode-QS-V1",USER-IP="127.0.0.1",CLUSTER="sel03",ABS="false",BROADCAST-ID="{}",STREAM-TIME="{:.3f}",FUTURE="true"'.format(now, s["id"], now - s["started"])
+        ]
+
+        for group, name, resolution in [["chunked", "1080p60 (source)", "1920x1080"], ["720p60", "720p60", "1280x720"], ["480p30", "480p", "852x480"], ["160p30", "160p", "284x160"]]:
+            lines.append('#EXT-X-MEDIA:TYPE=VIDEO,GROUP-ID="{}",NAME="{}",AUTOSELECT=YES,DEFAULT=YES'.format(group, name))
+            lines.append('#EXT-X-STREAM-INF:BANDWIDTH=3000000,RESOLUTION={},CODECS="avc1.4D401F,mp4a.40.2",VIDEO="{}",FRAME-RATE=60.000'.format(resolution, group))
+            lines.append("https://video-weaver.fake.hls.ttvnw.net/v1/playlist/{}-{}.m3u8".format(login, group))
+
+        return "\n".join(lines) + "\n"
+
+    def variantPlaylist(self, login):
+        elapsed = time.time() - self.streams[login]["started"]
+        sequence = int(elapsed // 2)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-TARGETDURATION:6",
+            "#EXT-X-MEDIA-SEQUENCE:{}".format(sequence),
+            "#EXT-X-TWITCH-LIVE-SEQUENCE:{}".format(sequence + 5),
+            "#EXT-X-TWITCH-ELAPSED-SECS:{:.3f}".format(sequence * 2.0),
+            "#EXT-X-TWITCH-TOTAL-SECS:{:.3f}".format(elapsed)
+        ]
+
+        for i in range(6):
+            lines.append("#EXT-X-PROGRAM-DATE-TIME:{}".format(iso(self.streams[login]["started"] + (sequence + i) * 2, ms=True)))
+            lines.append("#EXTINF:2.000,live")
+            lines.append("https://video-edge-fake.sel03.abs.hls.ttvnw.net/v1/segment/{}-{}.ts".format(login, sequence + i))
+
+        return "\n".join(lines) + "\n"
+
+    async def telegram(self, request, path):
+        method = path.rsplit("/", 1)[-1]
+
+        if method == "getUpdates":
+            return {"ok" : True, "result" : [{"update_id" : 1, "message" : {"message_id" : 1, "from" : {"id" : 1, "first_name" : "Bench"}, "chat" : {"id" : 1, "type" : "private"}, "text" : "/start"}}]}
+
+        data = await request.post()
+        text = data.get("text") or data.get("caption") or ""
+        match = re.search(r"twitch\.tv/([a-z0-9_]+)", text)
+        message = {"at" : time.time(), "method" : method, "chat_id" : data.get("chat_id"), "login" : match.group(1) if match else "", "text" : text}
+        self.messages.append(message)
+
+        for event in self.events: # First alert after go-live
+            if event["login"] == message["login"] and event["alerted"] is None and event["at"] <= message["at"]:
+                event["alerted"] = message["at"]
+
+        return {"ok" : True, "result" : {"message_id" : len(self.messages), "chat" : {"id" : data.get("chat_id")}, "date" : int(time.time())}}
+
+    def stats(self):
+        return {
+            "requests" : dict(self.requests),
+            "errors" : dict(self.errors),
+            "events" : [dict(n, latency=(n["alerted"] - n["at"]) if n["alerted"] else None) for n in self.events],
+            "messages" : len(self.messages),
+            "alerts" : dict(Counter(n["login"] for n in self.messages if n["login"])), # login: alert messages
+            "live" : len(self.streams)
+        }
+
+    def reset(self):
+        self.requests.clear()
+        self.errors.clear()
+        self.events = []
+        self.messages = []
+
+    def configure(self, body):
+        self.latency = float(body.get("latency", self.latency * 1000)) / 1000
+        self.jitter = float(body.get("jitter", self.jitter * 1000)) / 1000
+        self.errorRate = float(body.get("errorRate", self.errorRate))
+        self.errorStatus = int(body.get("errorStatus", self.errorStatus))
+        self.retryAfter = int(body.get("retryAfter", self.retryAfter))
+        self.gameName = bool(body.get("gameName", self.gameName))
+
+    # Apply {"action": "live" | "offline", "login": ... | "count": n | "all": true}, returns changed loginIDs
+    def apply(self, body):
+        action = body.get("action", "live")
+
+        if action == "live":
+            if body.get("login"):
+                logins = [body.get("login")]
+            else:
+                logins = random.sample([n for n in self.channels if n not in self.streams and n != "twitch"], int(body.get("count", 1)))
+
+            return [n for n in logins if self.setLive(n, body.get("title"), body.get("game_id"))]
+        elif body.get("all"):
+            logins = list(self.streams)
+        else:
+            logins = [body.get("login")]
+
+        return [n for n in logins if self.setOffline(n)]
+
+    async def controlLive(self, request):
+        body = await request.json()
+        body["action"] = "live"
+
+        return web.json_response({"live" : self.apply(body)})
+
+    async def controlOffline(self, request):
+        body = await request.json()
+        body["action"] = "offline"
+
+        return web.json_response({"offline" : self.apply(body)})
+
+    async def controlConfig(self, request):
+        self.configure(await request.json())
+
+        return web.json_response({"latency" : self.latency * 1000, "jitter" : self.jitter * 1000, "errorRate" : self.errorRate, "errorStatus" : self.errorStatus, "retryAfter" : self.retryAfter, "gameName" : self.gameName})
+
+    async def controlReset(self, request):
+        self.reset()
+
+        return web.json_response({"reset" : True})
+
+    async def controlStats(self, request):
+        return web.json_response(self.stats())
+
+    # Run scripted events relative to server start
+    async def runScript(self, script):
+        t0 = time.time()
+
+        for n in sorted(script, key=lambda n: n.get("at", 0)):
+            await asyncio.sleep(max(0.0, t0 + n.get("at", 0) - time.time()))
+            self.apply(n)
+
+    def application(self, script=None):
+        app = web.Application()
+        app.router.add_post("/control/live", self.controlLive)
+        app.router.add_post("/control/offline", self.controlOffline)
+        app.router.add_post("/control/config", self.controlConfig)
+        app.router.add_post("/control/reset", self.controlReset)
+        app.router.add_get("/control/stats", self.controlStats)
+        app.router.add_route("*", "/{host}/{path:.*}", self.handle)
+
+        if script:
+            async def startScript(app):
+                asyncio.ensure_future(self.runScript(script))
+
+            app.on_startup.append(startScript)
+
+        return app
+
+def iso(timestamp, ms=False):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z" if ms else datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--channels", type=int, default=1000)
+    parser.add_argument("--initial-live", type=float, default=0.0, help="ratio of channels already live on start")
+    parser.add_argument("--latency", type=float, default=0.0, help="response delay in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +- delay in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--script", help="json file of scripted events")
+    args = parser.parse_args()
+
+    script = None
+
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+
+    fake = FakeTwitch(args.channels, initialLive=args.initial_live, latency=args.latency, jitter=args.jitter, errorRate=args.error_rate, errorStatus=args.error_status)
+    web.run_app(fake.application(script), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()